@@ -0,0 +1,239 @@
+"""
+Indicateurs agronomiques journaliers calculés depuis les observations locales :
+évapotranspiration de référence FAO-56 Penman-Monteith, cumul de pluie et
+degrés-jours de croissance. Tous les calculs sont vectorisés par jour avec NumPy.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import WeatherDailyRollup, WeatherObservation, WeatherStation
+
+# Résolutions utilisables (par finesse décroissante) : les données journalières n'ont pas de min/max
+ROLLUP_RESOLUTIONS = ['5min', '30min', '4hour']
+
+SOLAR_CONSTANT = 0.0820  # MJ m-2 min-1
+STEFAN_BOLTZMANN = 4.903e-9  # MJ K-4 m-2 jour-1
+
+
+def saturation_vapour_pressure(temperature):
+    """e°(T) en kPa (FAO-56, éq. 11)."""
+    return 0.6108 * np.exp(17.27 * temperature / (temperature + 237.3))
+
+
+def extraterrestrial_radiation(latitude, day_of_year):
+    """Rayonnement extraterrestre Ra en MJ m-2 jour-1 (FAO-56, éq. 21)."""
+    phi = np.radians(latitude)
+    dr = 1 + 0.033 * np.cos(2 * np.pi / 365 * day_of_year)
+    delta = 0.409 * np.sin(2 * np.pi / 365 * day_of_year - 1.39)
+    omega = np.arccos(np.clip(-np.tan(phi) * np.tan(delta), -1, 1))
+    return 24 * 60 / np.pi * SOLAR_CONSTANT * dr * (
+        omega * np.sin(phi) * np.sin(delta) + np.cos(phi) * np.cos(delta) * np.sin(omega)
+    )
+
+
+def et0_fao56(t_min, t_max, rh_min, rh_max, solar, wind, pressure, latitude, day_of_year):
+    """
+    ET0 journalière (mm) par Penman-Monteith FAO-56, sur des tableaux de jours.
+    Unités d'entrée : °C, %, rayonnement moyen W/m², vent moyen km/h à la hauteur
+    de l'anémomètre, pression absolue hPa.
+    """
+    t_mean = (t_max + t_min) / 2
+    pressure_kpa = pressure / 10
+    gamma = 0.000665 * pressure_kpa
+    # Altitude déduite de la pression mesurée (inverse de l'éq. 7), pour Rso
+    elevation = (1 - (pressure_kpa / 101.3) ** (1 / 5.26)) * 293 / 0.0065
+
+    es = (saturation_vapour_pressure(t_max) + saturation_vapour_pressure(t_min)) / 2
+    ea = (saturation_vapour_pressure(t_min) * rh_max / 100 + saturation_vapour_pressure(t_max) * rh_min / 100) / 2
+    slope = 4098 * saturation_vapour_pressure(t_mean) / (t_mean + 237.3) ** 2
+
+    # Vent ramené à 2 m (éq. 47), en m/s
+    height = settings.WEATHER_ANEMOMETER_HEIGHT
+    u2 = wind / 3.6 * 4.87 / np.log(67.8 * height - 5.42)
+
+    rs = solar * 0.0864
+    ra = extraterrestrial_radiation(latitude, day_of_year)
+    rso = (0.75 + 2e-5 * elevation) * ra
+    rns = 0.77 * rs
+    rnl = (
+        STEFAN_BOLTZMANN * ((t_max + 273.16) ** 4 + (t_min + 273.16) ** 4) / 2
+        * (0.34 - 0.14 * np.sqrt(np.maximum(ea, 0)))
+        * (1.35 * np.clip(rs / np.where(rso > 0, rso, np.nan), 0.25, 1.0) - 0.35)
+    )
+    rn = rns - rnl
+
+    et0 = (
+        (0.408 * slope * rn + gamma * 900 / (t_mean + 273) * u2 * (es - ea))
+        / (slope + gamma * (1 + 0.34 * u2))
+    )
+    return np.maximum(et0, 0)
+
+
+def growing_degree_days(t_min, t_max, base):
+    """Degrés-jours de croissance (méthode de la moyenne, Tmax plafonnée à WEATHER_GDD_CAP)."""
+    t_mean = (np.minimum(t_max, settings.WEATHER_GDD_CAP) + t_min) / 2
+    return np.maximum(t_mean - base, 0)
+
+
+def nan_array(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+
+def daily_aggregates(rows):
+    """
+    Agrège des observations [(jour, rang de résolution, température, humidité, vent,
+    pression, rayonnement, pluie journalière)] triées par jour. Pour chaque jour, seule
+    la résolution la plus fine disponible est retenue.
+    """
+    days = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=len(rows))
+    ranks = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    finest = np.minimum.reduceat(ranks, starts)
+    keep = ranks == np.repeat(finest, np.diff(np.r_[starts, len(days)]))
+
+    days = days[keep]
+    columns = [nan_array(row[index] for row, kept in zip(rows, keep) if kept) for index in range(2, 8)]
+    temperature, humidity, wind, pressure, solar, rain = columns
+
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    counts = np.diff(np.r_[starts, len(days)])
+
+    def reduce_mean(values):
+        valid = ~np.isnan(values)
+        total = np.add.reduceat(np.where(valid, values, 0), starts)
+        count = np.add.reduceat(valid.astype(np.int64), starts)
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+    def reduce_max(values):
+        return np.fmax.reduceat(values, starts)
+
+    def reduce_min(values):
+        return np.fmin.reduceat(values, starts)
+
+    return {
+        'day': days[starts],
+        'samples': counts,
+        't_min': reduce_min(temperature),
+        't_max': reduce_max(temperature),
+        't_mean': reduce_mean(temperature),
+        'rh_min': reduce_min(humidity),
+        'rh_max': reduce_max(humidity),
+        'wind': reduce_mean(wind),
+        'pressure': reduce_mean(pressure),
+        'solar': reduce_mean(solar),
+        # Pluie journalière cumulée depuis minuit : le total du jour est son maximum
+        'rain': reduce_max(rain),
+    }
+
+
+def pending_rollup_days(device_id, first_day, last_day):
+    """
+    Jours passés de [first_day, last_day] ayant des observations mais pas d'agrégat complet.
+    Les jours sans aucune observation (panne, avant l'installation) ne sont jamais dus.
+    """
+    last_day = min(last_day, timezone.localdate() - timedelta(days=1))
+    if last_day < first_day:
+        return []
+    observed = set(
+        WeatherObservation.objects.filter(
+            device_id=device_id,
+            resolution__in=ROLLUP_RESOLUTIONS,
+            timestamp__gte=timezone.make_aware(datetime.combine(first_day, time.min)),
+            timestamp__lt=timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min)),
+        )
+        .annotate(day=TruncDate('timestamp'))
+        .order_by()
+        .values_list('day', flat=True)
+        .distinct()
+    )
+    complete = set(
+        WeatherDailyRollup.objects.filter(
+            device_id=device_id, date__range=(first_day, last_day), complete=True
+        ).values_list('date', flat=True)
+    )
+    return sorted(observed - complete)
+
+
+def update_rollups(device_id, since=None, until=None, latitude=None):
+    """
+    Recalcule les agrégats journaliers d'un appareil à partir du dernier jour déjà
+    calculé (inclus, il pouvait être incomplet) ou de `since`, jusqu'à `until` inclus
+    (sans limite par défaut). Retourne le nombre de jours écrits.
+    """
+    if since is None:
+        since = WeatherDailyRollup.objects.filter(device_id=device_id).aggregate(last=Max('date'))['last']
+    if latitude is None:
+        station = WeatherStation.objects.filter(device_id=device_id, location__isnull=False).first()
+        latitude = station.location.y if station else settings.WEATHER_DEFAULT_LATITUDE
+
+    observations = WeatherObservation.objects.filter(device_id=device_id, resolution__in=ROLLUP_RESOLUTIONS)
+    if since is not None:
+        start = timezone.make_aware(datetime.combine(since, time.min))
+        observations = observations.filter(timestamp__gte=start)
+    if until is not None:
+        end = timezone.make_aware(datetime.combine(until + timedelta(days=1), time.min))
+        observations = observations.filter(timestamp__lt=end)
+
+    rank = {resolution: index for index, resolution in enumerate(ROLLUP_RESOLUTIONS)}
+    rows = [
+        (day, rank[resolution], *values)
+        for day, resolution, *values in observations
+        .annotate(day=TruncDate('timestamp'))
+        .order_by('day', 'timestamp')
+        .values_list('day', 'resolution', 'temperature', 'humidity', 'wind_speed', 'pressure_absolute', 'solar', 'rain_daily')
+        .iterator(chunk_size=5000)
+    ]
+    if not rows:
+        return 0
+
+    daily = daily_aggregates(rows)
+    day_of_year = np.array([date.fromordinal(int(day)).timetuple().tm_yday for day in daily['day']])
+    # Pression manquante : atmosphère standard
+    pressure = np.where(np.isnan(daily['pressure']), 1013.25, daily['pressure'])
+    et0 = et0_fao56(
+        daily['t_min'], daily['t_max'], daily['rh_min'], daily['rh_max'],
+        daily['solar'], daily['wind'], pressure, latitude, day_of_year
+    )
+    gdd = growing_degree_days(daily['t_min'], daily['t_max'], settings.WEATHER_GDD_BASE)
+
+    def value(array, index):
+        result = float(array[index])
+        return None if np.isnan(result) else round(result, 3)
+
+    today = timezone.localdate()
+    computed_at = timezone.now()
+    rollups = [
+        WeatherDailyRollup(
+            device_id=device_id,
+            date=date.fromordinal(int(day)),
+            samples=int(daily['samples'][index]),
+            complete=date.fromordinal(int(day)) < today,
+            t_min=value(daily['t_min'], index),
+            t_max=value(daily['t_max'], index),
+            t_mean=value(daily['t_mean'], index),
+            rain=value(daily['rain'], index),
+            et0=value(et0, index),
+            gdd=value(gdd, index),
+            computed_at=computed_at,
+        )
+        for index, day in enumerate(daily['day'])
+    ]
+    WeatherDailyRollup.objects.bulk_create(
+        rollups,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['device_id', 'date'],
+        update_fields=['samples', 'complete', 't_min', 't_max', 't_mean', 'rain', 'et0', 'gdd', 'computed_at']
+    )
+    return len(rollups)
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
@@ -0,0 +1,294 @@
+"""
+Client de l'API Ecowitt.
+Session HTTP mutualisée (keep-alive), délais de connexion et de lecture stricts,
+nouvelles tentatives bornées avec gigue, et disjoncteur par clé API qui sert
+la dernière réponse valide tant que le service amont est en échec.
+"""
+
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Statuts HTTP pour lesquels une nouvelle tentative a un sens
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class EcowittError(Exception):
+    """Erreur de communication avec l'API Ecowitt."""
+
+    def __init__(self, message, status_code=None, upstream_message=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.upstream_message = upstream_message
+
+
+class EcowittUnavailable(EcowittError):
+    """Le disjoncteur est ouvert et aucune réponse de secours n'est disponible."""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur simple : s'ouvre après `failure_threshold` échecs consécutifs,
+    laisse passer une requête d'essai après `reset_timeout` secondes (semi-ouvert)
+    et se referme au premier succès.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_progress:
+                return False
+            # Semi-ouvert : une seule requête d'essai
+            self.trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class SingleFlight:
+    """
+    Regroupe les appels concurrents portant sur une même clé : un seul thread exécute
+    la fonction, les autres attendent et reçoivent le même résultat (ou la même erreur).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            call['done'].wait()
+        else:
+            try:
+                call['result'] = fn()
+            except Exception as e:
+                call['error'] = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call['done'].set()
+
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+
+
+single_flight = SingleFlight()
+
+_session = None
+_session_lock = threading.Lock()
+_breakers = {}
+_breakers_lock = threading.Lock()
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def get_session():
+    """Session HTTP partagée par le processus (pool de connexions keep-alive)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=settings.ECOWITT_POOL_SIZE,
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def get_breaker(api_key):
+    """Disjoncteur associé à une clé API."""
+    with _breakers_lock:
+        breaker = _breakers.get(api_key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                settings.ECOWITT_BREAKER_THRESHOLD,
+                settings.ECOWITT_BREAKER_RESET_TIMEOUT
+            )
+            _breakers[api_key] = breaker
+        return breaker
+
+
+def get_semaphore(api_key):
+    """Limite le nombre d'appels simultanés vers Ecowitt pour une clé API (tous threads confondus)."""
+    with _semaphores_lock:
+        semaphore = _semaphores.get(api_key)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(settings.ECOWITT_MAX_CONCURRENCY_PER_KEY)
+            _semaphores[api_key] = semaphore
+        return semaphore
+
+
+def device_params(device_id):
+    """Paramètre d'identification d'un appareil : MAC (avec « : ») ou IMEI."""
+    return {'mac' if ':' in device_id else 'imei': device_id}
+
+
+class EcowittClient:
+    """Client de l'API Ecowitt v3 pour un couple de clés d'une entreprise."""
+
+    def __init__(self, application_key, api_key, base_url=None):
+        self.application_key = application_key
+        self.api_key = api_key
+        self.base_url = (base_url or settings.ECOWITT_BASE_URL).rstrip('/')
+
+    @classmethod
+    def from_config(cls, config):
+        """Construit un client depuis la configuration de WeatherViewSet.get_ecowitt_config()."""
+        return cls(config['application_key'], config['api_key'], config.get('base_url'))
+
+    def fallback_key(self, endpoint, params):
+        """Clé de cache de la dernière réponse valide (indépendante des clés secrètes en clair)."""
+        raw = json.dumps([self.api_key, endpoint, sorted(params.items())])
+        return f"ecowitt:last-good:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+    def get(self, endpoint, **params):
+        """
+        Appelle un endpoint et retourne le corps JSON (code == 0).
+        En cas d'échec, sert la dernière réponse valide marquée `stale` si elle existe,
+        sinon lève EcowittError.
+        """
+        breaker = get_breaker(self.api_key)
+        fallback_key = self.fallback_key(endpoint, params)
+
+        if not breaker.allow_request():
+            return self.serve_fallback(fallback_key, EcowittUnavailable(
+                "Service Ecowitt temporairement indisponible", status_code=503
+            ))
+
+        try:
+            data = self.request_with_retries(endpoint, params)
+        except EcowittError as e:
+            # Une erreur applicative (code != 0) ne traduit pas une panne du service
+            if e.upstream_message is None:
+                breaker.record_failure()
+                return self.serve_fallback(fallback_key, e)
+            breaker.record_success()
+            raise
+        except Exception:
+            # Erreur imprévue : comptée comme un échec pour ne pas bloquer l'essai semi-ouvert
+            breaker.record_failure()
+            raise
+
+        breaker.record_success()
+        cache.set(fallback_key, data, settings.ECOWITT_FALLBACK_TTL)
+        return data
+
+    def serve_fallback(self, fallback_key, error):
+        data = cache.get(fallback_key)
+        if data is None:
+            raise error
+        logger.warning(f"Ecowitt: réponse de secours servie ({error})")
+        return dict(data, stale=True)
+
+    def request_with_retries(self, endpoint, params):
+        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        query = dict(params, application_key=self.application_key, api_key=self.api_key)
+        timeout = (settings.ECOWITT_CONNECT_TIMEOUT, settings.ECOWITT_READ_TIMEOUT)
+        attempts = settings.ECOWITT_MAX_RETRIES + 1
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            try:
+                with get_semaphore(self.api_key):
+                    response = get_session().get(url, params=query, timeout=timeout)
+            except requests.RequestException as e:
+                logger.warning(f"Ecowitt API {endpoint}: {e.__class__.__name__} (tentative {attempt + 1}/{attempts})")
+                if last_attempt:
+                    raise EcowittError(f"Ecowitt injoignable : {e}", status_code=503)
+                self.backoff(attempt)
+                continue
+
+            if response.status_code in RETRYABLE_STATUSES and not last_attempt:
+                logger.warning(f"Ecowitt API {endpoint}: HTTP {response.status_code} (tentative {attempt + 1}/{attempts})")
+                self.backoff(attempt)
+                continue
+
+            if response.status_code != 200:
+                logger.error(f"Ecowitt API {endpoint} error: {response.status_code}, {response.text[:500]}")
+                raise EcowittError(f"HTTP {response.status_code}", status_code=response.status_code)
+
+            try:
+                data = response.json()
+            except ValueError:
+                raise EcowittError("Réponse Ecowitt invalide", status_code=502)
+            if not isinstance(data, dict):
+                raise EcowittError("Réponse Ecowitt invalide", status_code=502)
+
+            if data.get('code') != 0:
+                logger.error(f"Ecowitt API {endpoint} error: code {data.get('code')}, {data.get('msg')}")
+                raise EcowittError(
+                    data.get('msg', 'Erreur inconnue'),
+                    status_code=502,
+                    upstream_message=data.get('msg', 'Erreur inconnue')
+                )
+
+            logger.debug(f"Ecowitt API {endpoint} response: {response.status_code}")
+            return data
+
+    def backoff(self, attempt):
+        """Attente exponentielle avec gigue complète."""
+        delay = min(settings.ECOWITT_BACKOFF_MAX, settings.ECOWITT_BACKOFF_BASE * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def device_list(self):
+        return self.get('device/list')
+
+    def real_time(self, device_id, call_back='all'):
+        return self.get('device/real_time', call_back=call_back, **device_params(device_id))
+
+    def history(self, device_id, start, end, cycle_type, call_back):
+        """Historique entre deux horodatages « YYYY-MM-DD HH:MM:SS »."""
+        return self.get(
+            'device/history',
+            start_date=start,
+            end_date=end,
+            cycle_type=cycle_type,
+            call_back=call_back,
+            **device_params(device_id)
+        )
@@ -0,0 +1,201 @@
+"""
+Altitudes depuis des modèles numériques de terrain locaux (dalles GeoTIFF IGN RGE ALTI,
+SRTM…). Chaque dalle est convertie une fois en tableau NumPy (.npy) projeté en mémoire
+(memmap) ; un nombre borné de dalles reste ouvert (LRU). Tous les points d'une requête
+sont échantillonnés en une passe d'interpolation bilinéaire vectorisée par dalle.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.gdal import CoordTransform, GDALException, GDALRaster, OGRGeometry, SpatialReference
+
+logger = logging.getLogger(__name__)
+
+DEM_EXTENSIONS = ('*.tif', '*.tiff', '*.TIF', '*.TIFF')
+
+
+class DemTile:
+    """Dalle MNT ouverte : grille d'altitudes (memmap, NaN hors données) et géoréférencement."""
+
+    def __init__(self, path):
+        raster = GDALRaster(path)
+        self.path = path
+        self.width, self.height = raster.width, raster.height
+        self.origin_x, self.pixel_width, _, self.origin_y, _, self.pixel_height = raster.geotransform
+        self.data = np.load(self.sidecar(path, raster), mmap_mode='r')
+
+    @staticmethod
+    def sidecar(path, raster):
+        """Chemin du .npy de la dalle, créé au premier accès (float32, valeurs manquantes à NaN)."""
+        stat = os.stat(path)
+        digest = hashlib.sha1(f'{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}'.encode()).hexdigest()
+        sidecar = os.path.join(settings.DEM_CACHE_DIR, f'{digest}.npy')
+        if not os.path.exists(sidecar):
+            band = raster.bands[0]
+            data = np.asarray(band.data(), dtype=np.float32).reshape(raster.height, raster.width)
+            if band.nodata_value is not None:
+                data[data == np.float32(band.nodata_value)] = np.nan
+            os.makedirs(settings.DEM_CACHE_DIR, exist_ok=True)
+            temporary = f'{sidecar}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+            np.save(temporary, data)
+            os.replace(temporary, sidecar)
+        return sidecar
+
+    def sample(self, x, y):
+        """Interpolation bilinéaire aux coordonnées (dans le système de la dalle) ; NaN hors dalle ou sans donnée."""
+        # Position en pixels, origine au centre du premier pixel
+        col = (x - self.origin_x) / self.pixel_width - 0.5
+        row = (y - self.origin_y) / self.pixel_height - 0.5
+        inside = (col >= -0.5) & (col <= self.width - 0.5) & (row >= -0.5) & (row <= self.height - 0.5)
+
+        col = np.clip(col, 0, self.width - 1)
+        row = np.clip(row, 0, self.height - 1)
+        col0 = np.minimum(np.floor(col).astype(np.int64), max(self.width - 2, 0))
+        row0 = np.minimum(np.floor(row).astype(np.int64), max(self.height - 2, 0))
+        col1 = np.minimum(col0 + 1, self.width - 1)
+        row1 = np.minimum(row0 + 1, self.height - 1)
+        fx, fy = col - col0, row - row0
+
+        values = np.stack([
+            self.data[row0, col0], self.data[row0, col1],
+            self.data[row1, col0], self.data[row1, col1],
+        ]).astype(np.float64)
+        weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy])
+
+        # Voisins sans donnée écartés, poids des autres renormalisés
+        weights = np.where(np.isnan(values), 0.0, weights)
+        total = weights.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = (weights * np.nan_to_num(values)).sum(axis=0) / total
+        return np.where(inside & (total > 0), result, np.nan)
+
+
+class DemIndex:
+    """
+    Index des dalles du répertoire DEM_DIR (emprise en WGS84, système de coordonnées,
+    résolution), reconstruit si le répertoire change, et cache LRU des dalles ouvertes.
+    Un point couvert par plusieurs dalles prend l'altitude de la plus fine.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.signature = None
+        self.checked_at = 0
+        self.entries = []
+        self.tiles = OrderedDict()
+
+    def refresh(self):
+        # Parcours du répertoire au plus une fois par minute
+        now = time.monotonic()
+        if self.signature is not None and now - self.checked_at < 60:
+            return
+        self.checked_at = now
+
+        paths = sorted({
+            path
+            for pattern in DEM_EXTENSIONS
+            for path in glob.glob(os.path.join(settings.DEM_DIR, '**', pattern), recursive=True)
+        })
+        signature = tuple((path, os.path.getmtime(path)) for path in paths)
+        if signature == self.signature:
+            return
+
+        wgs84 = SpatialReference(4326)
+        entries = []
+        for path in paths:
+            try:
+                raster = GDALRaster(path)
+                srs = raster.srs or wgs84
+                xmin, ymin, xmax, ymax = raster.extent
+                bounds = OGRGeometry.from_bbox((xmin, ymin, xmax, ymax))
+                bounds.srs = srs
+                if srs.srid != 4326:
+                    bounds.transform(CoordTransform(srs, wgs84))
+                # Taille de pixel approximative en mètres : les dalles les plus fines sont interrogées en premier
+                resolution = abs(raster.geotransform[1]) * (111320 if srs.geographic else 1)
+                entries.append({'path': path, 'srs': srs, 'bounds': bounds.extent, 'resolution': resolution})
+            except GDALException as e:
+                logger.warning(f"Dalle MNT illisible {path}: {e}")
+        self.entries = sorted(entries, key=lambda entry: entry['resolution'])
+        self.signature = signature
+        self.tiles.clear()
+        logger.info(f"Index MNT: {len(entries)} dalle(s)")
+
+    def open(self, path):
+        """Dalle ouverte depuis le cache LRU (DEM_OPEN_TILES dalles au plus)."""
+        tile = self.tiles.pop(path, None)
+        if tile is None:
+            tile = DemTile(path)
+            while len(self.tiles) >= settings.DEM_OPEN_TILES:
+                self.tiles.popitem(last=False)
+        self.tiles[path] = tile
+        return tile
+
+    def covering(self, bbox):
+        """
+        Dalles ouvertes de la résolution la plus fine intersectant l'emprise WGS84
+        (xmin, ymin, xmax, ymax) : [(entrée d'index, DemTile)].
+        """
+        xmin, ymin, xmax, ymax = bbox
+        with self.lock:
+            self.refresh()
+            hits = [
+                entry for entry in self.entries
+                if entry['bounds'][0] <= xmax and entry['bounds'][2] >= xmin
+                and entry['bounds'][1] <= ymax and entry['bounds'][3] >= ymin
+            ]
+            if not hits:
+                return []
+            finest = hits[0]['resolution']
+            return [(entry, self.open(entry['path'])) for entry in hits if entry['resolution'] <= finest * 1.01]
+
+    def sample(self, longitudes, latitudes):
+        """Altitudes (m) des points WGS84 ; NaN là où aucune dalle ne couvre le point."""
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        elevations = np.full(len(longitudes), np.nan)
+        if not len(longitudes):
+            return elevations
+
+        with self.lock:
+            self.refresh()
+            for entry in self.entries:
+                xmin, ymin, xmax, ymax = entry['bounds']
+                pending = (
+                    np.isnan(elevations)
+                    & (longitudes >= xmin) & (longitudes <= xmax)
+                    & (latitudes >= ymin) & (latitudes <= ymax)
+                )
+                if not pending.any():
+                    continue
+                x, y = transform_points(longitudes[pending], latitudes[pending], entry['srs'])
+                elevations[pending] = self.open(entry['path']).sample(x, y)
+                if not np.isnan(elevations).any():
+                    break
+        return elevations
+
+
+def transform_points(longitudes, latitudes, srs):
+    """Reprojette des points WGS84 dans le système d'une dalle, en un seul appel GDAL."""
+    if srs.srid == 4326:
+        return longitudes, latitudes
+    points = ', '.join(f'({x!r} {y!r})' for x, y in zip(longitudes.tolist(), latitudes.tolist()))
+    geometry = OGRGeometry(f'MULTIPOINT ({points})', srs=4326)
+    geometry.transform(srs)
+    coords = np.array(geometry.tuple, dtype=np.float64).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+
+dem_index = DemIndex()
+
+
+def sample_elevations(longitudes, latitudes):
+    return dem_index.sample(longitudes, latitudes)
@@ -0,0 +1,199 @@
+"""
+Calcul hydraulique d'un plan : débits, pertes de charge (Hazen-Williams) et pressions
+aux extrémités de chaque forme, en suivant les connexions de l'amont vers l'aval.
+Les conduites sont les lignes du plan, décrites par leurs données (`diameter` en mm,
+`material`) ; les besoins (`demand`, m³/h) sont portés par les formes desservies.
+Les formules sont évaluées sur tous les tronçons à la fois avec NumPy.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from plans.models import FormeGeometrique
+
+from .elevation import sample_elevations
+from .network import line_lengths, network_indexes
+
+# Coefficients de Hazen-Williams par matériau de conduite
+HAZEN_WILLIAMS_C = {
+    'PE': 140,
+    'PEBD': 140,
+    'PEHD': 150,
+    'PVC': 150,
+    'FONTE': 130,
+    'ACIER': 120,
+    'GALVANISE': 120,
+    'BETON': 120,
+    'CUIVRE': 140,
+}
+
+# Hauteur d'eau (m) correspondant à 1 bar
+METERS_PER_BAR = 10.197
+
+
+def hazen_williams(length, flow, diameter, coefficient):
+    """Perte de charge (m) : longueur (m), débit (m³/s), diamètre intérieur (m), coefficient C."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 10.67 * length * flow ** 1.852 / (coefficient ** 1.852 * diameter ** 4.8704)
+
+
+def node_levels(count, parents, children):
+    """
+    Niveau de chaque nœud (plus long chemin depuis une racine) par tri topologique ;
+    lève ValueError si les connexions forment un cycle.
+    """
+    indegree = np.bincount(children, minlength=count)
+    outgoing = [[] for _ in range(count)]
+    for parent, child in zip(parents.tolist(), children.tolist()):
+        outgoing[parent].append(child)
+
+    levels = np.zeros(count, dtype=np.int64)
+    remaining = indegree.copy()
+    queue = np.flatnonzero(indegree == 0).tolist()
+    visited = 0
+    while queue:
+        node = queue.pop()
+        visited += 1
+        for child in outgoing[node]:
+            levels[child] = max(levels[child], levels[node] + 1)
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                queue.append(child)
+    if visited < count:
+        raise ValueError('Les connexions du plan forment une boucle : calcul hydraulique impossible')
+    return levels, indegree
+
+
+def rounded(values, digits):
+    return [None if np.isnan(value) else round(value, digits) for value in values.tolist()]
+
+
+def compute_hydraulics(plan, inlet_pressure):
+    """
+    Calcul hydraulique du plan pour une pression d'alimentation (bar) des formes sans
+    connexion entrante (la donnée `pressure` d'une forme source prévaut).
+    Le débit d'une forme est son besoin plus celui de l'aval, partagé à parts égales
+    entre les formes qui alimentent un même nœud ; la pression d'entrée d'un nœud
+    alimenté par plusieurs formes est la plus faible. Les connexions sont sans perte.
+    """
+    formes = [
+        forme for forme in plan.formes.only('id', 'type_forme', 'data')
+        if forme.type_forme != FormeGeometrique.TypeForme.TEXTE
+    ]
+    count = len(formes)
+    position = {forme.id: i for i, forme in enumerate(formes)}
+    index = network_indexes.get(plan)
+    edges = np.array([
+        (position[source], position[destination])
+        for source in position
+        for destination, length, connexion_id in index.outgoing.get(source, [])
+        if destination in position
+    ], dtype=np.int64).reshape(-1, 2)
+    parents, children = edges[:, 0], edges[:, 1]
+    levels, indegree = node_levels(count, parents, children)
+
+    # Attributs des formes ; extrémités d'entrée et de sortie pour les altitudes
+    demand = np.zeros(count)
+    diameter = np.full(count, np.nan)
+    coefficient = np.full(count, float(settings.HYDRAULIC_DEFAULT_C))
+    source_pressure = np.full(count, float(inlet_pressure))
+    endpoints = np.full((count, 4), np.nan)
+    lines, line_index = [], []
+    for i, forme in enumerate(formes):
+        data = forme.data or {}
+        try:
+            demand[i] = float(data.get('demand') or 0)
+            if data.get('diameter'):
+                diameter[i] = float(data['diameter']) / 1000
+            if data.get('pressure') is not None:
+                source_pressure[i] = float(data['pressure'])
+        except (TypeError, ValueError):
+            pass
+        coefficient[i] = HAZEN_WILLIAMS_C.get(str(data.get('material', '')).upper(), coefficient[i])
+
+        geometry = forme.geometry
+        if geometry is None:
+            continue
+        if geometry.geom_type == 'LineString':
+            lines.append(geometry.coords)
+            line_index.append(i)
+            endpoints[i] = (*geometry.coords[0], *geometry.coords[-1])
+        else:
+            centroid = geometry.centroid
+            endpoints[i] = (centroid.x, centroid.y, centroid.x, centroid.y)
+
+    is_line = np.zeros(count, dtype=bool)
+    is_line[line_index] = True
+    length = np.zeros(count)
+    length[line_index] = line_lengths(lines)
+
+    # Débits : de l'aval vers l'amont, un niveau à la fois
+    flow = demand.copy()
+    share = 1 / np.maximum(indegree, 1)
+    edge_levels = levels[parents]
+    for level in range(int(levels.max(initial=0)), -1, -1):
+        mask = edge_levels == level
+        np.add.at(flow, parents[mask], flow[children[mask]] * share[children[mask]])
+
+    # Pertes de charge et vitesses de toutes les conduites en une passe
+    flow_m3s = flow / 3600
+    head_loss = np.where(is_line, hazen_williams(length, flow_m3s, diameter, coefficient), 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        velocity = np.where(is_line, flow_m3s / (np.pi * diameter ** 2 / 4), np.nan)
+
+    # Altitudes des extrémités ; ignorées si le MNT ne couvre pas tout le réseau
+    located = ~np.isnan(endpoints[:, 0])
+    inlet_z, outlet_z = np.zeros(count), np.zeros(count)
+    elevations = sample_elevations(
+        np.concatenate([endpoints[located, 0], endpoints[located, 2]]),
+        np.concatenate([endpoints[located, 1], endpoints[located, 3]]),
+    )
+    use_elevation = bool(located.any()) and not np.isnan(elevations).any()
+    if use_elevation:
+        inlet_z[located], outlet_z[located] = np.split(elevations, 2)
+
+    # Charges : de l'amont vers l'aval, un niveau à la fois
+    inlet_head = np.where(indegree == 0, source_pressure * METERS_PER_BAR + inlet_z, np.inf)
+    outlet_head = np.full(count, np.nan)
+    child_levels = levels[children]
+    for level in range(int(levels.max(initial=0)) + 1):
+        if level:
+            mask = child_levels == level
+            np.minimum.at(inlet_head, children[mask], outlet_head[parents[mask]])
+        nodes = levels == level
+        outlet_head[nodes] = inlet_head[nodes] - head_loss[nodes]
+
+    pressure_in = (inlet_head - inlet_z) / METERS_PER_BAR
+    pressure_out = (outlet_head - outlet_z) / METERS_PER_BAR
+    columns = {
+        'length': rounded(length, 2),
+        'diameter': rounded(diameter * 1000, 1),
+        'coefficient': rounded(np.where(is_line, coefficient, np.nan), 0),
+        'flow': rounded(flow, 3),
+        'velocity': rounded(velocity, 3),
+        'head_loss': rounded(head_loss, 3),
+        'pressure_in': rounded(pressure_in, 3),
+        'pressure_out': rounded(pressure_out, 3),
+    }
+    return {
+        'inlet_pressure': inlet_pressure,
+        'elevation': use_elevation,
+        'total_demand': round(float(demand.sum()), 3),
+        'min_pressure': None if np.isnan(pressure_out).all() else round(float(np.nanmin(pressure_out)), 3),
+        'missing_diameter': [formes[i].id for i in np.flatnonzero(is_line & np.isnan(diameter)).tolist()],
+        'formes': [
+            {'id': forme.id, 'line': bool(is_line[i]), **{name: values[i] for name, values in columns.items()}}
+            for i, forme in enumerate(formes)
+        ],
+    }
+
+
+def plan_hydraulics(plan, inlet_pressure):
+    """Calcul hydraulique mis en cache pour la version courante du plan (date de modification)."""
+    cache_key = f'hydraulics:{plan.pk}:{plan.date_modification.timestamp()}:{inlet_pressure}'
+    result = cache.get(cache_key)
+    if result is None:
+        result = compute_hydraulics(plan, inlet_pressure)
+        cache.set(cache_key, result, settings.HYDRAULIC_CACHE_TTL)
+    return result
@@ -0,0 +1,58 @@
+"""
+Interpolation spatiale des mesures des stations (pondération inverse à la distance)
+sur une grille régulière, entièrement vectorisée avec NumPy.
+"""
+
+import numpy as np
+
+EARTH_RADIUS = 6371008.8
+
+
+def grid_shape(bbox, max_cells):
+    """Dimensions (largeur, hauteur) d'une grille de `max_cells` cellules sur le plus grand côté."""
+    xmin, ymin, xmax, ymax = bbox
+    mid_latitude = np.radians((ymin + ymax) / 2)
+    width_m = max(xmax - xmin, 1e-9) * np.cos(mid_latitude)
+    height_m = max(ymax - ymin, 1e-9)
+    if width_m >= height_m:
+        return max_cells, max(1, int(round(max_cells * height_m / width_m)))
+    return max(1, int(round(max_cells * width_m / height_m))), max_cells
+
+
+def idw_grid(station_x, station_y, values, bbox, width, height, power=2.0, clip_boxes=None):
+    """
+    Interpole les valeurs des stations (lon, lat) au centre de chaque cellule de la grille
+    couvrant `bbox`, par pondération inverse à la distance (distances équirectangulaires
+    en mètres). Les cellules hors de toutes les `clip_boxes` valent NaN.
+    Retourne un tableau (hauteur, largeur), première ligne au nord.
+    """
+    xmin, ymin, xmax, ymax = bbox
+    cell_x = xmin + (np.arange(width) + 0.5) * (xmax - xmin) / width
+    cell_y = ymax - (np.arange(height) + 0.5) * (ymax - ymin) / height
+    grid_x, grid_y = np.meshgrid(cell_x, cell_y)
+
+    station_x = np.asarray(station_x, dtype=np.float64)
+    station_y = np.asarray(station_y, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    # Distances (cellules × stations)
+    mid_latitude = np.radians((ymin + ymax) / 2)
+    dx = np.radians(grid_x[..., None] - station_x) * np.cos(mid_latitude) * EARTH_RADIUS
+    dy = np.radians(grid_y[..., None] - station_y) * EARTH_RADIUS
+    distance = np.hypot(dx, dy)
+
+    with np.errstate(divide='ignore'):
+        weights = 1.0 / distance ** power
+    # Cellule confondue avec une station : la valeur de la station
+    exact = distance < 1.0
+    weights = np.where(exact.any(axis=-1, keepdims=True), exact.astype(np.float64), weights)
+
+    grid = (weights * values).sum(axis=-1) / weights.sum(axis=-1)
+
+    if clip_boxes:
+        inside = np.zeros(grid.shape, dtype=bool)
+        for box_xmin, box_ymin, box_xmax, box_ymax in clip_boxes:
+            inside |= (grid_x >= box_xmin) & (grid_x <= box_xmax) & (grid_y >= box_ymin) & (grid_y <= box_ymax)
+        grid = np.where(inside, grid, np.nan)
+
+    return grid
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.offline_packs import OfflinePackError, build_pack, count_tiles, pack_bbox, tile_ranges
+from api.tiles import TILE_SOURCES
+from plans.models import Plan
+
+
+class Command(BaseCommand):
+    help = (
+        "Construit (ou met à jour si leur emprise a changé) les paquets de tuiles hors ligne "
+        "MBTiles des plans, pour que les équipes de terrain puissent les télécharger sans attente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plan', type=int, action='append', help="Plan(s) à traiter (défaut : tous)")
+        parser.add_argument('--layers', default='ign', help="Couches séparées par des virgules (hybrid, cadastre, ign)")
+        parser.add_argument('--min-zoom', type=int, default=settings.OFFLINE_PACK_MIN_ZOOM)
+        parser.add_argument('--max-zoom', type=int, default=settings.OFFLINE_PACK_MAX_ZOOM)
+
+    def handle(self, *args, **options):
+        layers = [layer.strip().lower() for layer in options['layers'].split(',') if layer.strip()]
+        unknown = [layer for layer in layers if layer not in TILE_SOURCES]
+        if unknown:
+            raise CommandError(f"Couche(s) inconnue(s) : {', '.join(unknown)}")
+        min_zoom, max_zoom = options['min_zoom'], options['max_zoom']
+        if not 0 <= min_zoom <= max_zoom <= settings.OFFLINE_PACK_MAX_ZOOM:
+            raise CommandError(f"Zooms invalides (0 ≤ min ≤ max ≤ {settings.OFFLINE_PACK_MAX_ZOOM})")
+
+        plans = Plan.objects.all()
+        if options['plan']:
+            plans = plans.filter(id__in=options['plan'])
+
+        built = 0
+        for plan in plans.iterator():
+            extent = plan.extent()
+            if extent is None:
+                continue
+            bbox = pack_bbox(extent)
+            tiles = count_tiles(tile_ranges(bbox, min_zoom, max_zoom))
+            if tiles > settings.OFFLINE_PACK_MAX_TILES:
+                self.stderr.write(f"Plan {plan.id} ignoré : {tiles} tuiles (maximum {settings.OFFLINE_PACK_MAX_TILES})")
+                continue
+            for layer in layers:
+                try:
+                    path = build_pack(plan.id, plan.nom, layer, min_zoom, max_zoom, bbox)
+                except OfflinePackError as e:
+                    self.stderr.write(f"Plan {plan.id} ({layer}) : {e}")
+                    continue
+                built += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Plan {plan.id} ({layer}) : {path}")
+
+        self.stdout.write(self.style.SUCCESS(f"{built} paquet(s) à jour"))
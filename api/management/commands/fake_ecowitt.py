@@ -0,0 +1,192 @@
+import hashlib
+import json
+import math
+import random
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+
+# Pas de temps des cycles d'historique Ecowitt (secondes)
+CYCLE_STEPS = {'5min': 300, '30min': 1800, '4hour': 14400, '1day': 86400}
+
+# Séries simulées : (groupe, champ, unité, fonction(t, graine) -> valeur en unités impériales)
+SERIES = [
+    ('outdoor', 'temperature', 'ºF', lambda t, s: 59 + 14 * math.sin((t / 86400 + s) * 2 * math.pi)),
+    ('outdoor', 'humidity', '%', lambda t, s: 65 - 20 * math.sin((t / 86400 + s) * 2 * math.pi)),
+    ('outdoor', 'dew_point', 'ºF', lambda t, s: 48 + 6 * math.sin((t / 86400 + s) * 2 * math.pi)),
+    ('indoor', 'temperature', 'ºF', lambda t, s: 68 + math.sin(t / 7200)),
+    ('indoor', 'humidity', '%', lambda t, s: 45 + 3 * math.sin(t / 10800)),
+    ('pressure', 'relative', 'inHg', lambda t, s: 29.92 + 0.2 * math.sin(t / 172800 + s)),
+    ('pressure', 'absolute', 'inHg', lambda t, s: 29.5 + 0.2 * math.sin(t / 172800 + s)),
+    ('wind', 'wind_speed', 'mph', lambda t, s: abs(6 + 5 * math.sin(t / 5400 + s))),
+    ('wind', 'wind_gust', 'mph', lambda t, s: abs(10 + 8 * math.sin(t / 5400 + s))),
+    ('wind', 'wind_direction', 'º', lambda t, s: (t / 600 + s * 360) % 360),
+    ('rainfall', 'rain_rate', 'in/hr', lambda t, s: max(0.0, 0.2 * math.sin(t / 20000 + s))),
+    ('rainfall', 'hourly', 'in', lambda t, s: max(0.0, 0.05 * math.sin(t / 20000 + s))),
+    ('rainfall', 'daily', 'in', lambda t, s: max(0.0, 0.01 * ((t % 86400) / 3600) * math.sin(t / 200000 + s))),
+    ('solar_and_uvi', 'solar', 'W/m²', lambda t, s: max(0.0, 800 * math.sin(((t % 86400) / 86400 - 0.25) * 2 * math.pi))),
+    ('solar_and_uvi', 'uvi', '', lambda t, s: max(0.0, 8 * math.sin(((t % 86400) / 86400 - 0.25) * 2 * math.pi))),
+    ('battery', 'console', 'V', lambda t, s: 4.1),
+]
+
+
+def device_mac(index):
+    return ':'.join(f'{b:02X}' for b in hashlib.md5(f'tagmap-fake-{index}'.encode()).digest()[:6])
+
+
+def device_seed(device_id):
+    return int(hashlib.md5(device_id.encode()).hexdigest()[:8], 16) / 0xFFFFFFFF
+
+
+def selected_series(call_back):
+    """Filtre les séries selon call_back (« all », « outdoor », « outdoor.temperature »…)."""
+    if not call_back or call_back == 'all':
+        return SERIES
+    wanted = [item.strip() for item in call_back.split(',') if item.strip()]
+    return [
+        serie for serie in SERIES
+        if any(item == serie[0] or item == f'{serie[0]}.{serie[1]}' for item in wanted)
+    ]
+
+
+class FakeEcowittHandler(BaseHTTPRequestHandler):
+    """Émule les endpoints device/list, device/real_time et device/history de l'API v3."""
+
+    server_version = 'FakeEcowitt/1.0'
+
+    def do_GET(self):
+        options = self.server.options
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if options['latency']:
+            time.sleep(options['latency'] / 1000)
+
+        if options['failure_rate'] and random.random() < options['failure_rate']:
+            return self.send_json({'error': 'simulated failure'}, status=503)
+
+        if params.get('api_key') == 'invalid':
+            return self.send_json({'code': 40010, 'msg': 'Illegal Api Key', 'time': str(int(time.time())), 'data': []})
+
+        endpoint = url.path.rstrip('/').split('/api/v3/')[-1]
+        handlers = {
+            'device/list': self.device_list,
+            'device/real_time': self.real_time,
+            'device/history': self.history,
+        }
+        handler = handlers.get(endpoint)
+        if handler is None:
+            return self.send_json({'code': 404, 'msg': 'Not found'}, status=404)
+
+        try:
+            data = handler(params)
+        except ValueError as e:
+            return self.send_json({'code': 40000, 'msg': str(e), 'time': str(int(time.time())), 'data': []})
+
+        self.send_json({'code': 0, 'msg': 'success', 'time': str(int(time.time())), 'data': data})
+
+    def device_list(self, params):
+        devices = [
+            {
+                'id': index + 1,
+                'name': f'Station test {index + 1}',
+                'mac': device_mac(index),
+                'type': 1,
+                'date_zone_id': 'Europe/Paris',
+                'createtime': 1700000000,
+                'longitude': 3.87 + 0.05 * index,
+                'latitude': 43.61 + 0.03 * index,
+                'stationtype': 'GW1100B_V2.3.1',
+                'iotdevice_list': [],
+            }
+            for index in range(self.server.options['devices'])
+        ]
+        return {'total': len(devices), 'totalPage': 1, 'pageNum': 1, 'list': devices}
+
+    def real_time(self, params):
+        device_id = self.device_id(params)
+        seed = device_seed(device_id)
+        now = int(time.time())
+        data = {}
+        for group, field, unit, value in selected_series(params.get('call_back')):
+            data.setdefault(group, {})[field] = {
+                'time': str(now), 'unit': unit, 'value': f'{value(now, seed):.1f}'
+            }
+        return data
+
+    def history(self, params):
+        device_id = self.device_id(params)
+        seed = device_seed(device_id)
+        step = CYCLE_STEPS.get(params.get('cycle_type', '5min'))
+        if step is None:
+            raise ValueError('cycle_type invalide')
+
+        start = self.parse_date(params.get('start_date'))
+        end = self.parse_date(params.get('end_date'))
+        timestamps = range(start - start % step, end + 1, step)
+
+        data = {}
+        for group, field, unit, value in selected_series(params.get('call_back')):
+            data.setdefault(group, {})[field] = {
+                'unit': unit,
+                'list': {str(t): f'{value(t, seed):.2f}' for t in timestamps if t >= start},
+            }
+        return data
+
+    def device_id(self, params):
+        device_id = params.get('mac') or params.get('imei')
+        if not device_id:
+            raise ValueError('mac ou imei requis')
+        return device_id
+
+    def parse_date(self, value):
+        if not value:
+            raise ValueError('start_date et end_date requis')
+        return int(datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp())
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.options['verbosity'] > 1:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Lance un faux serveur Ecowitt local (données déterministes) pour les tests et le "
+        "développement. Utiliser ECOWITT_BASE_URL=http://127.0.0.1:<port>/api/v3."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765, help="Port d'écoute")
+        parser.add_argument('--devices', type=int, default=3, help="Nombre d'appareils simulés")
+        parser.add_argument('--latency', type=int, default=0, help="Latence ajoutée à chaque réponse (ms)")
+        parser.add_argument(
+            '--failure-rate',
+            type=float,
+            default=0.0,
+            help="Proportion de réponses HTTP 503 (pour exercer les nouvelles tentatives et le disjoncteur)"
+        )
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), FakeEcowittHandler)
+        server.options = options
+        self.stdout.write(self.style.SUCCESS(
+            f"Faux serveur Ecowitt sur http://127.0.0.1:{options['port']}/api/v3 "
+            f"({options['devices']} appareil(s))"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
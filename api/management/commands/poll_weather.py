@@ -0,0 +1,118 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from api.ecowitt import EcowittClient, EcowittError
+from api.models import WeatherStation
+from api.weather_store import account_key, extract_devices, register_stations, store_snapshots
+from authentication.models import Utilisateur
+
+logger = logging.getLogger(__name__)
+
+# Identifiant du verrou consultatif PostgreSQL : une seule instance du poller travaille à la fois
+POLL_LOCK_ID = 0x7A6D6574
+
+
+class Command(BaseCommand):
+    help = (
+        "Rafraîchit en continu les relevés temps réel de tous les appareils Ecowitt des "
+        "entreprises configurées, pour que /weather/ les serve sans appel amont."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=settings.WEATHER_POLL_INTERVAL,
+            help="Cadence de rafraîchissement (secondes)"
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Effectue un seul passage puis s'arrête (pour cron)"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            if self.acquire_lock():
+                try:
+                    refreshed = self.poll()
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"{refreshed} relevé(s) rafraîchi(s)")
+                finally:
+                    self.release_lock()
+            else:
+                logger.info("poll_weather: une autre instance est active, passage ignoré")
+
+            if options['once']:
+                break
+            time.sleep(max(0, options['interval'] - (time.monotonic() - started)))
+
+    def acquire_lock(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [POLL_LOCK_ID])
+            return cursor.fetchone()[0]
+
+    def release_lock(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [POLL_LOCK_ID])
+
+    def poll(self):
+        # Une entrée par clé API : des entreprises partageant un compte ne sont interrogées qu'une fois
+        accounts = dict(
+            Utilisateur.objects.filter(role='ENTREPRISE', is_active=True)
+            .exclude(ecowitt_api_key__isnull=True).exclude(ecowitt_api_key='')
+            .exclude(ecowitt_application_key__isnull=True).exclude(ecowitt_application_key='')
+            .values_list('ecowitt_api_key', 'ecowitt_application_key')
+            .distinct()
+        )
+
+        refreshed = 0
+        for api_key, application_key in accounts.items():
+            client = EcowittClient(application_key, api_key)
+            try:
+                refreshed += self.poll_account(client)
+            except EcowittError as e:
+                logger.warning(f"poll_weather: compte {account_key(api_key)[:8]} ignoré ({e})")
+        return refreshed
+
+    def poll_account(self, client):
+        devices = extract_devices(client.device_list())
+        account = account_key(client.api_key)
+        register_stations(account, devices)
+
+        # Les stations en envoi direct récent n'ont pas besoin du cloud
+        pushing = set(
+            WeatherStation.objects.filter(
+                account=account,
+                last_push_at__gte=timezone.now() - timedelta(seconds=settings.WEATHER_SNAPSHOT_MAX_AGE)
+            ).values_list('device_id', flat=True)
+        )
+        device_ids = [device.get('mac') or device.get('imei') for device in devices]
+        device_ids = [device_id for device_id in device_ids if device_id and device_id not in pushing]
+        if not device_ids:
+            return 0
+
+        def fetch(device_id):
+            try:
+                return device_id, client.real_time(device_id)
+            except EcowittError as e:
+                logger.warning(f"poll_weather: appareil {device_id} ignoré ({e})")
+                return device_id, None
+
+        # Appels HTTP en parallèle (plafonnés par clé API dans le client), écriture groupée ensuite
+        workers = min(len(device_ids), settings.ECOWITT_MAX_CONCURRENCY_PER_KEY)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ecowitt-poll') as executor:
+            results = dict(executor.map(fetch, device_ids))
+
+        # Une réponse de secours ne doit pas rajeunir un relevé
+        fresh = {device_id: data for device_id, data in results.items() if data and not data.get('stale')}
+        store_snapshots(account, fresh)
+        return len(fresh)
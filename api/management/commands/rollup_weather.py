@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.weather_store import ROLLUP_TARGETS, rollup_observations
+
+
+class Command(BaseCommand):
+    help = (
+        "Applique les paliers de rétention des observations météo locales : les lignes "
+        "plus anciennes que WEATHER_RETENTION_DAYS sont agrégées dans la résolution "
+        "supérieure (5min → 30min → 4hour → 1day) puis supprimées."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Affiche ce qui serait agrégé sans rien modifier"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help="Nombre d'agrégats insérés par lot"
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        # Du plus fin au plus grossier : les agrégats 30min produits alimentent le palier suivant
+        for source, target in ROLLUP_TARGETS.items():
+            days = settings.WEATHER_RETENTION_DAYS.get(source)
+            if not days:
+                continue
+
+            created, deleted = rollup_observations(
+                source,
+                now - timedelta(days=days),
+                dry_run=options['dry_run'],
+                batch_size=options['batch_size']
+            )
+            verb = "seraient agrégées" if options['dry_run'] else "agrégées"
+            self.stdout.write(
+                f"{source} → {target} (> {days} j) : {deleted} ligne(s) {verb} en {created} créneau(x)"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Rétention météo appliquée"))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from api.agronomy import update_rollups
+from api.models import WeatherObservation
+
+
+class Command(BaseCommand):
+    help = (
+        "Met à jour incrémentalement les indicateurs agronomiques journaliers (ET0, pluie, "
+        "degrés-jours) de tous les appareils ayant des observations locales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', help="Limiter à un appareil (MAC ou IMEI)")
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help="Recalcule tout l'historique au lieu de repartir du dernier jour calculé"
+        )
+
+    def handle(self, *args, **options):
+        if options['device']:
+            device_ids = [options['device']]
+        else:
+            device_ids = WeatherObservation.objects.values_list('device_id', flat=True).distinct().order_by()
+
+        total = 0
+        for device_id in device_ids:
+            since = None
+            if options['full']:
+                first = WeatherObservation.objects.filter(device_id=device_id).order_by('timestamp').first()
+                since = first.timestamp.date() if first else None
+            days = update_rollups(device_id, since=since)
+            total += days
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{device_id} : {days} jour(s)")
+
+        self.stdout.write(self.style.SUCCESS(f"{total} jour(s) recalculé(s)"))
@@ -0,0 +1,205 @@
+# Generated by Django 5.1.6 on 2025-05-16 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeatherObservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "device_id",
+                    models.CharField(
+                        max_length=64,
+                        verbose_name="Identifiant de l'appareil (MAC ou IMEI)",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[
+                            ("5min", "5 minutes"),
+                            ("30min", "30 minutes"),
+                            ("4hour", "4 heures"),
+                            ("1day", "1 jour"),
+                        ],
+                        max_length=8,
+                        verbose_name="Résolution",
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(verbose_name="Horodatage")),
+                (
+                    "temperature",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Température extérieure (°C)"
+                    ),
+                ),
+                (
+                    "humidity",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Humidité extérieure (%)"
+                    ),
+                ),
+                (
+                    "dew_point",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Point de rosée (°C)"
+                    ),
+                ),
+                (
+                    "indoor_temperature",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Température intérieure (°C)"
+                    ),
+                ),
+                (
+                    "indoor_humidity",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Humidité intérieure (%)"
+                    ),
+                ),
+                (
+                    "pressure_relative",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Pression relative (hPa)"
+                    ),
+                ),
+                (
+                    "pressure_absolute",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Pression absolue (hPa)"
+                    ),
+                ),
+                (
+                    "wind_speed",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Vitesse du vent (km/h)"
+                    ),
+                ),
+                (
+                    "wind_gust",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Rafales (km/h)"
+                    ),
+                ),
+                (
+                    "wind_direction",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Direction du vent (°)"
+                    ),
+                ),
+                (
+                    "rain_rate",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Intensité de pluie (mm/h)"
+                    ),
+                ),
+                (
+                    "rain_hourly",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Pluie horaire (mm)"
+                    ),
+                ),
+                (
+                    "rain_daily",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Pluie journalière (mm)"
+                    ),
+                ),
+                (
+                    "solar",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Rayonnement solaire (W/m²)"
+                    ),
+                ),
+                (
+                    "uvi",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Indice UV"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Observation météo",
+                "verbose_name_plural": "Observations météo",
+            },
+        ),
+        migrations.CreateModel(
+            name="WeatherSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "device_id",
+                    models.CharField(
+                        max_length=64,
+                        verbose_name="Identifiant de l'appareil (MAC ou IMEI)",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[
+                            ("5min", "5 minutes"),
+                            ("30min", "30 minutes"),
+                            ("4hour", "4 heures"),
+                            ("1day", "1 jour"),
+                        ],
+                        max_length=8,
+                        verbose_name="Résolution",
+                    ),
+                ),
+                (
+                    "synced_from",
+                    models.DateTimeField(verbose_name="Début de la plage synchronisée"),
+                ),
+                (
+                    "synced_until",
+                    models.DateTimeField(verbose_name="Fin de la plage synchronisée"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Date de modification"),
+                ),
+            ],
+            options={
+                "verbose_name": "État de synchronisation météo",
+                "verbose_name_plural": "États de synchronisation météo",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="weatherobservation",
+            constraint=models.UniqueConstraint(
+                fields=("device_id", "resolution", "timestamp"),
+                name="unique_weather_observation",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="weathersyncstate",
+            constraint=models.UniqueConstraint(
+                fields=("device_id", "resolution"), name="unique_weather_sync_state"
+            ),
+        ),
+    ]
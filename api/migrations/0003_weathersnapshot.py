@@ -0,0 +1,55 @@
+# Generated by Django 5.1.6 on 2025-05-17 10:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_weatherobservation_weathersyncstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeatherSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "account",
+                    models.CharField(
+                        max_length=64, verbose_name="Empreinte de la clé API Ecowitt"
+                    ),
+                ),
+                (
+                    "device_id",
+                    models.CharField(
+                        max_length=64,
+                        verbose_name="Identifiant de l'appareil (MAC ou IMEI)",
+                    ),
+                ),
+                ("data", models.JSONField(verbose_name="Réponse Ecowitt")),
+                (
+                    "fetched_at",
+                    models.DateTimeField(verbose_name="Date de récupération"),
+                ),
+            ],
+            options={
+                "verbose_name": "Relevé temps réel",
+                "verbose_name_plural": "Relevés temps réel",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="weathersnapshot",
+            constraint=models.UniqueConstraint(
+                fields=("account", "device_id"), name="unique_weather_snapshot"
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.6 on 2025-05-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_weathersnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeatherStation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "account",
+                    models.CharField(
+                        max_length=64, verbose_name="Empreinte de la clé API Ecowitt"
+                    ),
+                ),
+                (
+                    "device_id",
+                    models.CharField(
+                        max_length=64,
+                        verbose_name="Identifiant de l'appareil (MAC ou IMEI)",
+                    ),
+                ),
+                (
+                    "passkey",
+                    models.CharField(
+                        db_index=True,
+                        max_length=32,
+                        verbose_name="Clé de passe (PASSKEY)",
+                    ),
+                ),
+                (
+                    "last_push_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Dernier envoi reçu"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Date de création"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Station météo",
+                "verbose_name_plural": "Stations météo",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="weatherstation",
+            constraint=models.UniqueConstraint(
+                fields=("account", "device_id"), name="unique_weather_station"
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.1.6 on 2025-05-19 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_weatherstation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeatherDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "device_id",
+                    models.CharField(
+                        max_length=64,
+                        verbose_name="Identifiant de l'appareil (MAC ou IMEI)",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Jour")),
+                (
+                    "samples",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Nombre d'observations"
+                    ),
+                ),
+                (
+                    "complete",
+                    models.BooleanField(default=False, verbose_name="Journée complète"),
+                ),
+                (
+                    "t_min",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Température minimale (°C)"
+                    ),
+                ),
+                (
+                    "t_max",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Température maximale (°C)"
+                    ),
+                ),
+                (
+                    "t_mean",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Température moyenne (°C)"
+                    ),
+                ),
+                (
+                    "rain",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Pluie (mm)"
+                    ),
+                ),
+                (
+                    "et0",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Évapotranspiration de référence ET0 (mm)"
+                    ),
+                ),
+                (
+                    "gdd",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Degrés-jours de croissance"
+                    ),
+                ),
+                ("computed_at", models.DateTimeField(verbose_name="Date de calcul")),
+            ],
+            options={
+                "verbose_name": "Agrégat météo journalier",
+                "verbose_name_plural": "Agrégats météo journaliers",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="weatherdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("device_id", "date"), name="unique_weather_daily_rollup"
+            ),
+        ),
+    ]
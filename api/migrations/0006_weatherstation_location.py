@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2025-05-20 09:51
+
+import django.contrib.gis.db.models.fields
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_weatherdailyrollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="weatherstation",
+            name="name",
+            field=models.CharField(blank=True, max_length=200, verbose_name="Nom"),
+        ),
+        migrations.AddField(
+            model_name="weatherstation",
+            name="location",
+            field=django.contrib.gis.db.models.fields.PointField(
+                blank=True, null=True, srid=4326, verbose_name="Position"
+            ),
+        ),
+        migrations.AddField(
+            model_name="weatherstation",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True,
+                default=django.utils.timezone.now,
+                verbose_name="Date de modification",
+            ),
+            preserve_default=False,
+        ),
+    ]
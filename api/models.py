@@ -1,4 +1,6 @@
-from django.db import models
+import hashlib
+
+from django.contrib.gis.db import models
 
 class ApplicationSetting(models.Model):
     """
@@ -38,4 +40,167 @@ class ApplicationSetting(models.Model):
         verbose_name_plural = "Paramètres d'application"
         
     def __str__(self):
-        return f"{self.key}: {self.value[:30]}{'...' if len(self.value or '') > 30 else ''}" 
\ No newline at end of file
+        return f"{self.key}: {self.value[:30]}{'...' if len(self.value or '') > 30 else ''}" 
+
+class WeatherObservation(models.Model):
+    """
+    Observation météo d'un appareil Ecowitt, stockée en unités métriques.
+    Une ligne par appareil, résolution (cycle Ecowitt) et horodatage.
+    """
+    RESOLUTION_CHOICES = [
+        ('5min', '5 minutes'),
+        ('30min', '30 minutes'),
+        ('4hour', '4 heures'),
+        ('1day', '1 jour'),
+    ]
+
+    device_id = models.CharField(max_length=64, verbose_name="Identifiant de l'appareil (MAC ou IMEI)")
+    resolution = models.CharField(max_length=8, choices=RESOLUTION_CHOICES, verbose_name="Résolution")
+    timestamp = models.DateTimeField(verbose_name="Horodatage")
+    temperature = models.FloatField(null=True, blank=True, verbose_name="Température extérieure (°C)")
+    humidity = models.FloatField(null=True, blank=True, verbose_name="Humidité extérieure (%)")
+    dew_point = models.FloatField(null=True, blank=True, verbose_name="Point de rosée (°C)")
+    indoor_temperature = models.FloatField(null=True, blank=True, verbose_name="Température intérieure (°C)")
+    indoor_humidity = models.FloatField(null=True, blank=True, verbose_name="Humidité intérieure (%)")
+    pressure_relative = models.FloatField(null=True, blank=True, verbose_name="Pression relative (hPa)")
+    pressure_absolute = models.FloatField(null=True, blank=True, verbose_name="Pression absolue (hPa)")
+    wind_speed = models.FloatField(null=True, blank=True, verbose_name="Vitesse du vent (km/h)")
+    wind_gust = models.FloatField(null=True, blank=True, verbose_name="Rafales (km/h)")
+    wind_direction = models.FloatField(null=True, blank=True, verbose_name="Direction du vent (°)")
+    rain_rate = models.FloatField(null=True, blank=True, verbose_name="Intensité de pluie (mm/h)")
+    rain_hourly = models.FloatField(null=True, blank=True, verbose_name="Pluie horaire (mm)")
+    rain_daily = models.FloatField(null=True, blank=True, verbose_name="Pluie journalière (mm)")
+    solar = models.FloatField(null=True, blank=True, verbose_name="Rayonnement solaire (W/m²)")
+    uvi = models.FloatField(null=True, blank=True, verbose_name="Indice UV")
+
+    class Meta:
+        verbose_name = "Observation météo"
+        verbose_name_plural = "Observations météo"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device_id', 'resolution', 'timestamp'],
+                name='unique_weather_observation'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} {self.resolution} {self.timestamp:%Y-%m-%d %H:%M}"
+
+
+class WeatherSyncState(models.Model):
+    """
+    Intervalle contigu déjà synchronisé depuis Ecowitt pour un appareil et une résolution.
+    Seules les portions de plage hors de cet intervalle sont redemandées à l'API.
+    """
+    device_id = models.CharField(max_length=64, verbose_name="Identifiant de l'appareil (MAC ou IMEI)")
+    resolution = models.CharField(
+        max_length=8,
+        choices=WeatherObservation.RESOLUTION_CHOICES,
+        verbose_name="Résolution"
+    )
+    synced_from = models.DateTimeField(verbose_name="Début de la plage synchronisée")
+    synced_until = models.DateTimeField(verbose_name="Fin de la plage synchronisée")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de modification")
+
+    class Meta:
+        verbose_name = "État de synchronisation météo"
+        verbose_name_plural = "États de synchronisation météo"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device_id', 'resolution'],
+                name='unique_weather_sync_state'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} {self.resolution} [{self.synced_from} → {self.synced_until}]"
+
+
+
+class WeatherSnapshot(models.Model):
+    """
+    Dernière réponse temps réel Ecowitt d'un appareil, tenue à jour par la commande
+    `poll_weather` et servie par WeatherViewSet.list sans appel amont.
+    Le compte est une empreinte de la clé API (jamais la clé en clair).
+    """
+    account = models.CharField(max_length=64, verbose_name="Empreinte de la clé API Ecowitt")
+    device_id = models.CharField(max_length=64, verbose_name="Identifiant de l'appareil (MAC ou IMEI)")
+    data = models.JSONField(verbose_name="Réponse Ecowitt")
+    fetched_at = models.DateTimeField(verbose_name="Date de récupération")
+
+    class Meta:
+        verbose_name = "Relevé temps réel"
+        verbose_name_plural = "Relevés temps réel"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account', 'device_id'],
+                name='unique_weather_snapshot'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} ({self.fetched_at:%Y-%m-%d %H:%M:%S})"
+
+
+class WeatherStation(models.Model):
+    """
+    Appareil Ecowitt connu, enregistré à partir des listes d'appareils des comptes
+    (nom et position mis à jour à chaque liste). La clé de passe (MD5 de l'adresse MAC) authentifie les envois directs des passerelles.
+    """
+    account = models.CharField(max_length=64, verbose_name="Empreinte de la clé API Ecowitt")
+    device_id = models.CharField(max_length=64, verbose_name="Identifiant de l'appareil (MAC ou IMEI)")
+    name = models.CharField(max_length=200, blank=True, verbose_name="Nom")
+    location = models.PointField(srid=4326, null=True, blank=True, verbose_name="Position")
+    passkey = models.CharField(max_length=32, db_index=True, verbose_name="Clé de passe (PASSKEY)")
+    last_push_at = models.DateTimeField(null=True, blank=True, verbose_name="Dernier envoi reçu")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de modification")
+
+    class Meta:
+        verbose_name = "Station météo"
+        verbose_name_plural = "Stations météo"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account', 'device_id'],
+                name='unique_weather_station'
+            )
+        ]
+
+    def __str__(self):
+        return self.device_id
+
+    @staticmethod
+    def passkey_for(device_id):
+        """PASSKEY envoyée par une passerelle Ecowitt : MD5 hexadécimal majuscule de sa MAC."""
+        return hashlib.md5(device_id.upper().encode()).hexdigest().upper()
+
+
+class WeatherDailyRollup(models.Model):
+    """
+    Indicateurs agronomiques journaliers d'un appareil (jour local), calculés
+    incrémentalement depuis les observations stockées.
+    """
+    device_id = models.CharField(max_length=64, verbose_name="Identifiant de l'appareil (MAC ou IMEI)")
+    date = models.DateField(verbose_name="Jour")
+    samples = models.PositiveIntegerField(default=0, verbose_name="Nombre d'observations")
+    complete = models.BooleanField(default=False, verbose_name="Journée complète")
+    t_min = models.FloatField(null=True, blank=True, verbose_name="Température minimale (°C)")
+    t_max = models.FloatField(null=True, blank=True, verbose_name="Température maximale (°C)")
+    t_mean = models.FloatField(null=True, blank=True, verbose_name="Température moyenne (°C)")
+    rain = models.FloatField(null=True, blank=True, verbose_name="Pluie (mm)")
+    et0 = models.FloatField(null=True, blank=True, verbose_name="Évapotranspiration de référence ET0 (mm)")
+    gdd = models.FloatField(null=True, blank=True, verbose_name="Degrés-jours de croissance")
+    computed_at = models.DateTimeField(verbose_name="Date de calcul")
+
+    class Meta:
+        verbose_name = "Agrégat météo journalier"
+        verbose_name_plural = "Agrégats météo journaliers"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device_id', 'date'],
+                name='unique_weather_daily_rollup'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} {self.date}"
@@ -0,0 +1,253 @@
+"""
+Réseau d'irrigation d'un plan. Index en mémoire : les formes sont les nœuds, les
+connexions les arcs orientés (source -> destination) ; les distances suivent les
+conduites, c'est-à-dire les lignes traversées (et les connexions qui les relient).
+L'index est construit à la première question sur le plan puis conservé par le
+processus tant que la date de modification du plan (avancée à chaque modification
+d'une forme ou d'une connexion) ne change pas.
+Les connexions entre formes qui se touchent peuvent être détectées côté serveur par
+une jointure spatiale PostGIS.
+"""
+
+import heapq
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.gis.db.models.functions import Length
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection, transaction
+
+from plans.models import Connexion, FormeGeometrique
+
+from .interpolation import EARTH_RADIUS
+
+
+def line_lengths(lines):
+    """Longueurs (m, grand cercle) de plusieurs polylignes [(lon, lat)], en une passe sur tous les segments."""
+    if not lines:
+        return np.zeros(0)
+    counts = np.array([len(coords) for coords in lines])
+    starts = np.cumsum(counts) - counts
+    points = np.radians(np.array([point for coords in lines for point in coords], dtype=np.float64))
+    lon, lat = points[:, 0], points[:, 1]
+
+    # Haversine entre points consécutifs ; les paires à cheval sur deux lignes sont annulées
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    segments = np.append(2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1))), 0.0)
+    segments[starts[1:] - 1] = 0.0
+    return np.add.reduceat(segments, starts)
+
+
+class NetworkIndex:
+    """
+    Listes d'adjacence sortantes et entrantes d'un plan ; composantes calculées à la demande.
+    `lengths` donne la longueur (m) des lignes, coût d'entrée dans le nœud correspondant.
+    """
+
+    def __init__(self, nodes, edges, lengths=None):
+        self.nodes = set(nodes)
+        self.lengths = lengths or {}
+        self.outgoing = {node: [] for node in self.nodes}
+        self.incoming = {node: [] for node in self.nodes}
+        for connexion_id, source, destination, length in edges:
+            self.nodes.update((source, destination))
+            self.outgoing.setdefault(source, []).append((destination, length, connexion_id))
+            self.incoming.setdefault(destination, []).append((source, length, connexion_id))
+            self.outgoing.setdefault(destination, [])
+            self.incoming.setdefault(source, [])
+        self._components = None
+
+    @classmethod
+    def build(cls, plan):
+        edges = [
+            (connexion_id, source, destination, length.m if length is not None else 0.0)
+            for connexion_id, source, destination, length in (
+                Connexion.objects.filter(plan=plan)
+                .annotate(length=Length('geometrie'))
+                .values_list('id', 'forme_source_id', 'forme_destination_id', 'length')
+            )
+        ]
+        formes = list(plan.formes.only('id', 'type_forme', 'data'))
+        lines = {}
+        for forme in formes:
+            geometry = forme.geometry
+            if geometry is not None and geometry.geom_type == 'LineString':
+                lines[forme.id] = geometry.coords
+        lengths = dict(zip(lines, line_lengths(list(lines.values())).tolist()))
+        return cls([forme.id for forme in formes], edges, lengths)
+
+    def components(self):
+        """Composantes connexes (arcs pris sans orientation), de la plus grande à la plus petite."""
+        if self._components is None:
+            seen = set()
+            components = []
+            for start in sorted(self.nodes):
+                if start in seen:
+                    continue
+                seen.add(start)
+                component = [start]
+                queue = deque([start])
+                while queue:
+                    node = queue.popleft()
+                    for neighbour, length, connexion_id in self.outgoing[node] + self.incoming[node]:
+                        if neighbour not in seen:
+                            seen.add(neighbour)
+                            component.append(neighbour)
+                            queue.append(neighbour)
+                components.append(sorted(component))
+            self._components = sorted(components, key=len, reverse=True)
+        return self._components
+
+    def traverse(self, start, downstream=True):
+        """Formes atteignables depuis `start` vers l'aval (ou l'amont) : [(forme, profondeur)] par largeur."""
+        adjacency = self.outgoing if downstream else self.incoming
+        depths = {start: 0}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbour, length, connexion_id in adjacency[node]:
+                if neighbour not in depths:
+                    depths[neighbour] = depths[node] + 1
+                    queue.append(neighbour)
+        del depths[start]
+        return list(depths.items())
+
+    def shortest_path(self, source, target, directed=False):
+        """
+        Plus court chemin (Dijkstra) : (formes, connexions, longueur en mètres), ou None si
+        `target` n'est pas atteignable. La longueur est celle des lignes du chemin, extrémités
+        comprises, plus celle des connexions qui les relient.
+        """
+        distances = {source: self.lengths.get(source, 0.0)}
+        previous = {}
+        heap = [(0.0, source)]
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if distance > distances[node]:
+                continue
+            neighbours = self.outgoing[node] if directed else self.outgoing[node] + self.incoming[node]
+            for neighbour, length, connexion_id in neighbours:
+                candidate = distance + length + self.lengths.get(neighbour, 0.0)
+                if candidate < distances.get(neighbour, float('inf')):
+                    distances[neighbour] = candidate
+                    previous[neighbour] = (node, connexion_id)
+                    heapq.heappush(heap, (candidate, neighbour))
+
+        if target not in distances:
+            return None
+        formes, connexions = [target], []
+        node = target
+        while node != source:
+            node, connexion_id = previous[node]
+            formes.append(node)
+            connexions.append(connexion_id)
+        return formes[::-1], connexions[::-1], distances[target]
+
+
+class NetworkIndexes:
+    """Index des plans récemment interrogés (LRU de NETWORK_INDEX_MAX_PLANS plans) et leur version."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+
+    def get(self, plan):
+        version = plan.date_modification
+        with self.lock:
+            entry = self.indexes.pop(plan.pk, None)
+            if entry is not None and entry[0] == version:
+                self.indexes[plan.pk] = entry
+                return entry[1]
+
+        index = NetworkIndex.build(plan)
+        with self.lock:
+            self.indexes[plan.pk] = (version, index)
+            while len(self.indexes) > settings.NETWORK_INDEX_MAX_PLANS:
+                self.indexes.popitem(last=False)
+        return index
+
+
+network_indexes = NetworkIndexes()
+
+
+# Extrémités des lignes rapprochées de la forme la plus proche à moins de %s mètres
+# (formes transmises en WKB : leur géométrie n'est stockée qu'en JSON dans `data`)
+DETECT_CONNEXIONS_SQL = """
+    WITH shapes AS (
+        SELECT id, ST_SetSRID(ST_GeomFromWKB(wkb), 4326) AS geom
+        FROM unnest(%s::integer[], %s::bytea[]) AS shape(id, wkb)
+    ),
+    endpoints AS (
+        SELECT id AS line_id, TRUE AS is_start, ST_StartPoint(geom) AS point
+        FROM shapes WHERE GeometryType(geom) = 'LINESTRING'
+        UNION ALL
+        SELECT id, FALSE, ST_EndPoint(geom)
+        FROM shapes WHERE GeometryType(geom) = 'LINESTRING'
+    )
+    SELECT DISTINCT ON (e.line_id, e.is_start)
+        e.line_id, e.is_start, s.id, ST_AsBinary(ST_MakeLine(e.point, ST_ClosestPoint(s.geom, e.point)))
+    FROM endpoints e
+    JOIN shapes s ON s.id <> e.line_id AND ST_DWithin(e.point::geography, s.geom::geography, %s)
+    ORDER BY e.line_id, e.is_start, ST_Distance(e.point::geography, s.geom::geography)
+"""
+
+
+def detect_connexions(plan, tolerance):
+    """
+    Crée ou met à jour les connexions des lignes du plan dont une extrémité est à moins de
+    `tolerance` mètres d'une autre forme : le début d'une ligne est alimenté par la forme
+    la plus proche, la fin alimente la forme la plus proche. Les connexions existantes ne
+    sont jamais supprimées. Retourne (connexions créées, connexions mises à jour).
+    """
+    shapes = [
+        (forme.id, geometry)
+        for forme in plan.formes.exclude(type_forme=FormeGeometrique.TypeForme.TEXTE).only('id', 'type_forme', 'data')
+        if (geometry := forme.geometry) is not None
+    ]
+    if not shapes:
+        return 0, 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(DETECT_CONNEXIONS_SQL, [
+            [forme_id for forme_id, geometry in shapes],
+            [bytes(geometry.wkb) for forme_id, geometry in shapes],
+            tolerance,
+        ])
+        rows = cursor.fetchall()
+
+    candidates = {}
+    for line_id, is_start, shape_id, wkb in rows:
+        pair = (shape_id, line_id) if is_start else (line_id, shape_id)
+        # Deux lignes bout à bout ne sont reliées que dans un sens
+        if pair[::-1] not in candidates:
+            candidates.setdefault(pair, GEOSGeometry(bytes(wkb), srid=4326))
+
+    with transaction.atomic():
+        existing = {
+            (connexion.forme_source_id, connexion.forme_destination_id): connexion
+            for connexion in plan.connexions.select_for_update()
+        }
+        created, updated = [], []
+        for (source, destination), geometry in candidates.items():
+            connexion = existing.get((source, destination))
+            if (destination, source) in existing:
+                continue
+            if connexion is None:
+                created.append(Connexion(
+                    plan=plan, forme_source_id=source, forme_destination_id=destination, geometrie=geometry
+                ))
+            elif not connexion.geometrie.equals_exact(geometry, 1e-9):
+                connexion.geometrie = geometry
+                updated.append(connexion)
+
+        Connexion.objects.bulk_create(created)
+        Connexion.objects.bulk_update(updated, ['geometrie'])
+        # Les opérations groupées n'émettent pas de signaux : version du plan avancée ici
+        if created or updated:
+            plan.touch()
+    return len(created), len(updated)
@@ -0,0 +1,300 @@
+"""
+Paquets de tuiles hors ligne (MBTiles) couvrant l'emprise d'un plan.
+Les tuiles sont obtenues via le proxy (api/tiles.py) : celles déjà présentes dans le
+cache disque sont réutilisées. Un paquet est identifié par l'emprise du plan, la couche
+et les niveaux de zoom ; il n'est reconstruit que si l'emprise change.
+"""
+
+import glob
+import hashlib
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from .tiles import TileError, TileNotFound, get_tile, tile_content_type
+
+logger = logging.getLogger(__name__)
+
+# Latitude maximale de la projection Web Mercator
+MAX_LATITUDE = 85.05112878
+
+MBTILES_FORMATS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/webp': 'webp'}
+
+# Nouvelles tentatives pour une tuile en erreur (5xx, délai dépassé) avant de l'omettre du paquet
+TILE_RETRIES = 2
+
+
+class OfflinePackError(Exception):
+    """Le paquet demandé ne peut pas être construit."""
+
+
+class PackInProgress(OfflinePackError):
+    """Le paquet est déjà en cours de construction dans un autre processus."""
+
+
+def pack_bbox(extent):
+    """Emprise (lon/lat) élargie de la marge OFFLINE_PACK_MARGIN, arrondie pour stabiliser l'identifiant du paquet."""
+    xmin, ymin, xmax, ymax = extent
+    margin_x = max((xmax - xmin) * settings.OFFLINE_PACK_MARGIN, 0.001)
+    margin_y = max((ymax - ymin) * settings.OFFLINE_PACK_MARGIN, 0.001)
+    return (
+        round(max(xmin - margin_x, -180), 5),
+        round(max(ymin - margin_y, -MAX_LATITUDE), 5),
+        round(min(xmax + margin_x, 180), 5),
+        round(min(ymax + margin_y, MAX_LATITUDE), 5),
+    )
+
+
+def tile_xy(lon, lat, z):
+    """Tuile XYZ (Web Mercator) contenant un point."""
+    n = 2 ** z
+    lat = math.radians(max(min(lat, MAX_LATITUDE), -MAX_LATITUDE))
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_ranges(bbox, min_zoom, max_zoom):
+    """Plages de tuiles (z, x0, x1, y0, y1) couvrant l'emprise à chaque niveau de zoom."""
+    xmin, ymin, xmax, ymax = bbox
+    ranges = []
+    for z in range(min_zoom, max_zoom + 1):
+        x0, y0 = tile_xy(xmin, ymax, z)
+        x1, y1 = tile_xy(xmax, ymin, z)
+        ranges.append((z, x0, x1, y0, y1))
+    return ranges
+
+
+def count_tiles(ranges):
+    return sum((x1 - x0 + 1) * (y1 - y0 + 1) for z, x0, x1, y0, y1 in ranges)
+
+
+def iter_tiles(ranges):
+    for z, x0, x1, y0, y1 in ranges:
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def pack_path(plan_id, layer, min_zoom, max_zoom, bbox):
+    """Chemin du paquet : le nom contient une empreinte de l'emprise."""
+    digest = hashlib.sha1(f'{bbox}'.encode()).hexdigest()[:12]
+    return os.path.join(settings.OFFLINE_PACK_DIR, f'plan-{plan_id}-{layer}-z{min_zoom}-{max_zoom}-{digest}.mbtiles')
+
+
+def lock_path(path):
+    return f'{path}.lock'
+
+
+def build_locked(path):
+    """Indique si un processus construit le paquet : verrou présent et rafraîchi depuis moins de OFFLINE_PACK_LOCK_TIMEOUT s."""
+    try:
+        age = time.time() - os.path.getmtime(lock_path(path))
+    except FileNotFoundError:
+        return False
+    return age < settings.OFFLINE_PACK_LOCK_TIMEOUT
+
+
+def acquire_build_lock(path):
+    """
+    Verrou de construction partagé entre processus : fichier créé avec O_EXCL à côté du
+    paquet. Un verrou qui n'est plus rafraîchi (processus arrêté) est repris.
+    Retourne False si un autre processus construit le paquet.
+    """
+    for attempt in range(2):
+        try:
+            fd = os.open(lock_path(path), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if attempt or build_locked(path):
+                return False
+            try:
+                os.remove(lock_path(path))
+            except FileNotFoundError:
+                pass
+            continue
+        with os.fdopen(fd, 'w') as lock:
+            lock.write(f'{os.getpid()}\n')
+        return True
+    return False
+
+
+def release_build_lock(path):
+    try:
+        os.remove(lock_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def build_pack(plan_id, name, layer, min_zoom, max_zoom, bbox):
+    """
+    Construit le paquet MBTiles (tuiles téléchargées par un nombre borné de threads,
+    écrites par le seul thread appelant), puis supprime les paquets du même plan
+    devenus obsolètes. Une tuile encore en erreur après TILE_RETRIES nouvelles tentatives
+    est omise et comptée dans la métadonnée `failed_tiles`. Retourne le chemin du paquet ;
+    lève PackInProgress si un autre processus le construit déjà.
+    """
+    path = pack_path(plan_id, layer, min_zoom, max_zoom, bbox)
+    if os.path.exists(path):
+        return path
+
+    try:
+        os.makedirs(settings.OFFLINE_PACK_DIR, exist_ok=True)
+        locked = acquire_build_lock(path)
+    except OSError as e:
+        raise OfflinePackError(f"Construction du paquet impossible: {e}")
+    if not locked:
+        raise PackInProgress(f"Paquet {os.path.basename(path)} déjà en construction")
+    try:
+        # Construit par un autre processus entre le premier contrôle et la prise du verrou
+        if not os.path.exists(path):
+            write_pack(path, plan_id, name, layer, min_zoom, max_zoom, bbox)
+    finally:
+        release_build_lock(path)
+    return path
+
+
+def write_pack(path, plan_id, name, layer, min_zoom, max_zoom, bbox):
+    """Télécharge les tuiles dans un fichier temporaire, renommé en `path` une fois complet."""
+    ranges = tile_ranges(bbox, min_zoom, max_zoom)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    def fetch(tile):
+        for attempt in range(TILE_RETRIES + 1):
+            try:
+                return tile, get_tile(layer, *tile)
+            except TileNotFound:
+                return tile, None
+            except TileError as e:
+                error = e
+                if attempt < TILE_RETRIES:
+                    time.sleep(0.5 * 2 ** attempt)
+        return tile, error
+
+    started = time.monotonic()
+    try:
+        db = sqlite3.connect(temporary)
+        try:
+            db.executescript("""
+                CREATE TABLE metadata (name TEXT, value TEXT);
+                CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+                CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+            """)
+            image_format = None
+            written = failed = 0
+            tiles = iter_tiles(ranges)
+            with ThreadPoolExecutor(max_workers=settings.OFFLINE_PACK_WORKERS, thread_name_prefix='offline-pack') as executor:
+                # Par lots : seules les tuiles d'un lot sont en mémoire en attendant leur écriture
+                while batch := list(itertools.islice(tiles, settings.OFFLINE_PACK_WORKERS * 8)):
+                    for (z, x, y), content in executor.map(fetch, batch):
+                        if isinstance(content, TileError):
+                            failed += 1
+                            continue
+                        if content is None:
+                            continue
+                        image_format = image_format or MBTILES_FORMATS.get(tile_content_type(content), 'png')
+                        # MBTiles suit le schéma TMS : lignes numérotées depuis le sud
+                        db.execute('INSERT INTO tiles VALUES (?, ?, ?, ?)', (z, x, 2 ** z - 1 - y, content))
+                        written += 1
+                    # Verrou rafraîchi à chaque lot : les autres processus le savent actif
+                    os.utime(lock_path(path))
+
+            if failed and not written:
+                raise TileError(f"aucune tuile obtenue ({failed} en erreur)")
+
+            xmin, ymin, xmax, ymax = bbox
+            db.executemany('INSERT INTO metadata VALUES (?, ?)', [
+                ('name', name),
+                ('format', image_format or 'png'),
+                ('type', 'baselayer'),
+                ('version', '1'),
+                ('bounds', f'{xmin},{ymin},{xmax},{ymax}'),
+                ('center', f'{(xmin + xmax) / 2},{(ymin + ymax) / 2},{min_zoom}'),
+                ('minzoom', str(min_zoom)),
+                ('maxzoom', str(max_zoom)),
+                ('failed_tiles', str(failed)),
+            ])
+            db.commit()
+        finally:
+            db.close()
+        os.replace(temporary, path)
+    except (TileError, sqlite3.Error, OSError) as e:
+        try:
+            os.remove(temporary)
+        except FileNotFoundError:
+            pass
+        raise OfflinePackError(f"Construction du paquet impossible: {e}")
+
+    # Paquets du même plan, de la même couche et des mêmes zooms pour une ancienne emprise
+    prefix = os.path.join(settings.OFFLINE_PACK_DIR, f'plan-{plan_id}-{layer}-z{min_zoom}-{max_zoom}-')
+    for previous in glob.glob(f'{prefix}*.mbtiles'):
+        if previous != path:
+            try:
+                os.remove(previous)
+            except FileNotFoundError:
+                pass
+
+    logger.info(
+        f"Paquet hors ligne plan {plan_id} ({layer}, z{min_zoom}-{max_zoom}): "
+        f"{written} tuile(s) en {time.monotonic() - started:.1f} s"
+        + (f", {failed} omise(s) après erreurs" if failed else "")
+    )
+
+
+class PackBuilds:
+    """
+    Constructions lancées par le processus, une par paquet, exécutées dans un thread
+    d'arrière-plan ; les autres processus sont coordonnés par le verrou de construction.
+    La dernière erreur de chaque paquet est conservée pour être signalée.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = set()
+        self.errors = {}
+
+    def start(self, plan_id, name, layer, min_zoom, max_zoom, bbox):
+        path = pack_path(plan_id, layer, min_zoom, max_zoom, bbox)
+        with self.lock:
+            if path in self.running or build_locked(path):
+                return
+            self.running.add(path)
+            self.errors.pop(path, None)
+
+        def run():
+            try:
+                build_pack(plan_id, name, layer, min_zoom, max_zoom, bbox)
+            except PackInProgress:
+                pass
+            except (OfflinePackError, OSError) as e:
+                logger.warning(str(e))
+                with self.lock:
+                    self.errors[path] = str(e)
+            finally:
+                with self.lock:
+                    self.running.discard(path)
+                connection.close()
+
+        threading.Thread(target=run, name='offline-pack-build', daemon=True).start()
+
+    def status(self, path):
+        with self.lock:
+            if path in self.running:
+                return 'building', None
+            if path in self.errors:
+                # Erreur signalée une fois : la demande suivante relance la construction
+                return 'failed', self.errors.pop(path)
+        if os.path.exists(path):
+            return 'ready', None
+        # Construction en cours dans un autre processus (autre worker, build_offline_packs)
+        return ('building', None) if build_locked(path) else ('missing', None)
+
+
+pack_builds = PackBuilds()
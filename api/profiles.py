@@ -0,0 +1,101 @@
+"""
+Profils altimétriques le long des lignes : densification géodésique (grand cercle)
+au pas demandé, altitudes échantillonnées en un lot, puis distances cumulées,
+dénivelés et pente maximale, le tout vectorisé avec NumPy.
+"""
+
+import hashlib
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .elevation import sample_elevations
+from .interpolation import EARTH_RADIUS
+
+
+def densify(coords, spacing, max_points=None):
+    """
+    Points (lon, lat) le long de la polyligne espacés d'au plus `spacing` mètres sur
+    chaque segment (sommets conservés), interpolés sur le grand cercle.
+    Retourne (longitudes, latitudes, distances cumulées en mètres) ; lève ValueError
+    au-delà de `max_points` points.
+    """
+    lon = np.radians(np.asarray([coord[0] for coord in coords], dtype=np.float64))
+    lat = np.radians(np.asarray([coord[1] for coord in coords], dtype=np.float64))
+    vectors = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+    start, end = vectors[:-1], vectors[1:]
+    angles = np.arctan2(np.linalg.norm(np.cross(start, end), axis=1), np.einsum('ij,ij->i', start, end))
+    steps = np.maximum(np.ceil(angles * EARTH_RADIUS / spacing).astype(np.int64), 1)
+    if max_points is not None and steps.sum() + 1 > max_points:
+        raise ValueError(f'Le profil compterait {steps.sum() + 1} points (maximum {max_points}) : augmentez le pas')
+
+    # Fractions 0, 1/n, …, (n-1)/n de chaque segment, puis le dernier sommet
+    segment = np.repeat(np.arange(len(steps)), steps)
+    offsets = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+    fraction = offsets / steps[segment]
+
+    # Interpolation sphérique (slerp) ; segments de longueur nulle : premier sommet
+    omega = angles[segment]
+    sin_omega = np.sin(omega)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight_start = np.where(sin_omega > 0, np.sin((1 - fraction) * omega) / sin_omega, 1 - fraction)
+        weight_end = np.where(sin_omega > 0, np.sin(fraction * omega) / sin_omega, fraction)
+    points = weight_start[:, None] * start[segment] + weight_end[:, None] * end[segment]
+    points = np.vstack([points, vectors[-1]])
+
+    distances = np.concatenate([[0.0], np.cumsum(angles[segment] / steps[segment] * EARTH_RADIUS)])
+    longitudes = np.degrees(np.arctan2(points[:, 1], points[:, 0]))
+    latitudes = np.degrees(np.arctan2(points[:, 2], np.hypot(points[:, 0], points[:, 1])))
+    return longitudes, latitudes, distances
+
+
+def profile_stats(distances, elevations):
+    """Dénivelés positif et négatif (m) et pente maximale (%) entre échantillons d'altitude connue."""
+    valid = ~np.isnan(elevations)
+    distances, elevations = distances[valid], elevations[valid]
+    if len(elevations) < 2:
+        return {'ascent': None, 'descent': None, 'max_slope': None, 'min_elevation': None, 'max_elevation': None}
+
+    rise = np.diff(elevations)
+    run = np.diff(distances)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slopes = np.where(run > 0, np.abs(rise) / run * 100, 0)
+    return {
+        'ascent': round(float(rise[rise > 0].sum()), 2),
+        'descent': round(float(-rise[rise < 0].sum()), 2),
+        'max_slope': round(float(slopes.max()), 2),
+        'min_elevation': round(float(elevations.min()), 2),
+        'max_elevation': round(float(elevations.max()), 2),
+    }
+
+
+def line_profile(coords, spacing):
+    """
+    Profil d'une polyligne [(lon, lat)], mis en cache sous une empreinte de sa géométrie
+    et du pas : toute modification de la ligne donne une nouvelle clé.
+    Lève ValueError si la densification dépasse DEM_MAX_POINTS points.
+    """
+    geometry = json.dumps([[round(float(x), 8), round(float(y), 8)] for x, y in coords])
+    cache_key = 'profile:' + hashlib.sha256(f'{geometry}:{spacing}'.encode()).hexdigest()
+    profile = cache.get(cache_key)
+    if profile is not None:
+        return profile
+
+    longitudes, latitudes, distances = densify(coords, spacing, settings.DEM_MAX_POINTS)
+    elevations = sample_elevations(longitudes, latitudes)
+    profile = {
+        'spacing': spacing,
+        'length': round(float(distances[-1]), 2),
+        **profile_stats(distances, elevations),
+        'points': {
+            'distance': np.round(distances, 2).tolist(),
+            'elevation': [None if np.isnan(value) else round(value, 2) for value in elevations.tolist()],
+            'longitude': np.round(longitudes, 7).tolist(),
+            'latitude': np.round(latitudes, 7).tolist(),
+        },
+    }
+    cache.set(cache_key, profile, settings.PROFILE_CACHE_TTL)
+    return profile
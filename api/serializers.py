@@ -168,14 +168,15 @@ class ConnexionSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         """
-        Vérifie que les formes appartiennent au même plan
+        Vérifie que les formes appartiennent au même plan (comparaison des clés, sans charger les plans)
         """
         plan = data.get('plan')
         forme_source = data.get('forme_source')
         forme_destination = data.get('forme_destination')
 
         if forme_source and forme_destination:
-            if forme_source.plan != plan or forme_destination.plan != plan:
+            plan_id = plan.pk if plan else None
+            if forme_source.plan_id != plan_id or forme_destination.plan_id != plan_id:
                 raise serializers.ValidationError(
                     "Les formes source et destination doivent appartenir au même plan"
                 )
@@ -189,6 +190,28 @@ class TexteAnnotationSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
+def compress_image(source, ext, filename):
+    """
+    Redimensionne et compresse une image (fichier ou flux binaire).
+    Retourne un ContentFile prêt à être enregistré.
+    """
+    img = Image.open(source)
+    img_io = BytesIO()
+
+    # Redimensionner si l'image est trop grande
+    max_size = (1200, 1200)
+    if img.width > max_size[0] or img.height > max_size[1]:
+        img.thumbnail(max_size, Image.LANCZOS)
+
+    # Sauvegarder avec compression
+    if ext.lower() == 'png':
+        img.save(img_io, format='PNG', optimize=True)
+    else:
+        img.save(img_io, format='JPEG', quality=70, optimize=True)
+
+    return ContentFile(img_io.getvalue(), name=filename)
+
+
 class Base64ImageField(serializers.ImageField):
     """
     Champ personnalisé pour gérer les images en base64.
@@ -202,26 +225,8 @@ class Base64ImageField(serializers.ImageField):
             # Générer un nom de fichier unique
             filename = f"{uuid.uuid4()}.{ext}"
 
-            # Décoder l'image base64
-            data = ContentFile(base64.b64decode(imgstr), name=filename)
-
-            # Compresser l'image
-            img = Image.open(data)
-            img_io = BytesIO()
-
-            # Redimensionner si l'image est trop grande
-            max_size = (1200, 1200)
-            if img.width > max_size[0] or img.height > max_size[1]:
-                img.thumbnail(max_size, Image.LANCZOS)
-
-            # Sauvegarder avec compression
-            if ext.lower() == 'png':
-                img.save(img_io, format='PNG', optimize=True)
-            else:
-                img.save(img_io, format='JPEG', quality=70, optimize=True)
-
-            # Créer un nouveau ContentFile avec l'image compressée
-            data = ContentFile(img_io.getvalue(), name=filename)
+            # Décoder puis compresser l'image
+            data = compress_image(BytesIO(base64.b64decode(imgstr)), ext, filename)
 
         return super().to_internal_value(data)
 
@@ -275,13 +280,13 @@ class NotePhotoSerializer(serializers.ModelSerializer):
         # Vérifier le quota de l'utilisateur
         user = data.get('user') or self.context['request'].user
 
-        # Estimer la taille de l'image (en MB)
         if 'image' in data and hasattr(data['image'], 'size'):
-            # Convertir octets en MB
-            estimated_size_mb = data['image'].size / (1024 * 1024)
+            # Une image déjà stockée par l'utilisateur n'est pas comptée deux fois
+            if NotePhoto.is_stored_for(user, data['image']):
+                return data
 
-            # Vérifier si l'ajout dépasserait le quota
-            if user.storage_used + round(estimated_size_mb) > user.storage_quota:
+            # Vérifier si l'ajout dépasserait le quota (en octets)
+            if not user.has_storage_for(data['image'].size):
                 raise serializers.ValidationError({
                     'image': f"Quota de stockage dépassé. Vous avez utilisé {user.storage_used}MB sur {user.storage_quota}MB."
                 })
@@ -0,0 +1,234 @@
+"""
+Statistiques de terrain par polygone (altitudes, pente, exposition) calculées sur les
+MNT locaux : le polygone est rastérisé sur la fenêtre de la dalle qui le contient,
+pente et exposition sont dérivées des gradients, le tout vectorisé avec NumPy.
+Les calculs d'un plan entier sont répartis sur un pool de processus.
+"""
+
+import hashlib
+import json
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .elevation import dem_index, transform_points
+
+# Secteurs d'exposition (direction vers laquelle la pente descend), de 45° centrés sur le nord
+ASPECT_SECTORS = ['N', 'NE', 'E', 'SE', 'S', 'SO', 'O', 'NO']
+
+# En dessous de cette pente (degrés), un pixel est considéré plat et n'a pas d'exposition
+FLAT_SLOPE = 1.0
+
+METERS_PER_DEGREE = 111320
+
+# Valeur mise en cache pour un polygone qu'aucun MNT ne couvre (None ne se distingue pas d'une absence)
+NO_DEM = 'no-dem'
+
+
+def inside_rings(x, y, rings):
+    """Pixels (centres x, y) à l'intérieur des anneaux, règle pair-impair (les trous sont exclus)."""
+    inside = np.zeros(x.shape, dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)
+        x0, y0 = ring[:-1, 0], ring[:-1, 1]
+        x1, y1 = ring[1:, 0], ring[1:, 1]
+        for ax, ay, bx, by in zip(x0, y0, x1, y1):
+            crosses = (ay > y) != (by > y)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                intersect_x = ax + (y - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (x < intersect_x)
+    return inside
+
+
+def tile_samples(tile, srs, rings):
+    """
+    Altitudes, pentes (degrés) et expositions (degrés) des pixels de la dalle dans le
+    polygone, ou None si le polygone ne recouvre aucun pixel de la dalle.
+    """
+    rings = [np.column_stack(transform_points(ring[:, 0], ring[:, 1], srs)) for ring in rings]
+    exterior = rings[0]
+    xmin, ymin = exterior.min(axis=0)
+    xmax, ymax = exterior.max(axis=0)
+
+    # Fenêtre de pixels couvrant le polygone, élargie d'un pixel pour les gradients
+    cols = sorted(((xmin - tile.origin_x) / tile.pixel_width, (xmax - tile.origin_x) / tile.pixel_width))
+    rows = sorted(((ymin - tile.origin_y) / tile.pixel_height, (ymax - tile.origin_y) / tile.pixel_height))
+    col0, col1 = max(int(math.floor(cols[0])) - 1, 0), min(int(math.ceil(cols[1])) + 1, tile.width)
+    row0, row1 = max(int(math.floor(rows[0])) - 1, 0), min(int(math.ceil(rows[1])) + 1, tile.height)
+    if col1 - col0 < 3 or row1 - row0 < 3:
+        return None
+
+    # Sous-échantillonnage des très grandes parcelles
+    stride = max(1, math.ceil(math.sqrt((col1 - col0) * (row1 - row0) / settings.TERRAIN_MAX_CELLS)))
+    window = np.asarray(tile.data[row0:row1:stride, col0:col1:stride], dtype=np.float64)
+    col_index = np.arange(col0, col1, stride)
+    row_index = np.arange(row0, row1, stride)
+
+    centers_x = tile.origin_x + (col_index + 0.5) * tile.pixel_width
+    centers_y = tile.origin_y + (row_index + 0.5) * tile.pixel_height
+    grid_x, grid_y = np.meshgrid(centers_x, centers_y)
+
+    # Taille de pixel en mètres (dalles géographiques : approximation locale)
+    step_x, step_y = tile.pixel_width * stride, tile.pixel_height * stride
+    if srs.geographic:
+        latitude = math.radians(float(centers_y.mean()))
+        step_x *= METERS_PER_DEGREE * math.cos(latitude)
+        step_y *= METERS_PER_DEGREE
+
+    # Gradients est et nord (pixel_height est négatif pour les dalles orientées nord en haut)
+    grad_row, grad_col = np.gradient(window)
+    dz_east = grad_col / step_x
+    dz_north = grad_row / step_y
+    slope = np.degrees(np.arctan(np.hypot(dz_east, dz_north)))
+    aspect = np.degrees(np.arctan2(-dz_east, -dz_north)) % 360
+
+    mask = inside_rings(grid_x, grid_y, rings) & ~np.isnan(window) & ~np.isnan(slope)
+    if not mask.any():
+        return None
+    cell_area = abs(step_x * step_y)
+    return window[mask], slope[mask], aspect[mask], cell_area
+
+
+def zonal_stats(rings):
+    """
+    Statistiques de terrain d'un polygone donné par ses anneaux [(lon, lat)] (extérieur
+    puis trous). Retourne None si aucun MNT ne couvre le polygone.
+    """
+    rings = [np.asarray(ring, dtype=np.float64) for ring in rings]
+    xmin, ymin = rings[0].min(axis=0)
+    xmax, ymax = rings[0].max(axis=0)
+
+    samples = [
+        result for result in (
+            tile_samples(tile, entry['srs'], rings)
+            for entry, tile in dem_index.covering((xmin, ymin, xmax, ymax))
+        )
+        if result is not None
+    ]
+    if not samples:
+        return None
+
+    elevation = np.concatenate([sample[0] for sample in samples])
+    slope = np.concatenate([sample[1] for sample in samples])
+    aspect = np.concatenate([sample[2] for sample in samples])
+    cell_area = samples[0][3]
+
+    # Exposition : secteurs des pixels non plats, moyenne circulaire
+    sloped = slope >= FLAT_SLOPE
+    sectors = ((aspect[sloped] + 22.5) // 45).astype(np.int64) % 8
+    counts = np.bincount(sectors, minlength=8)
+    total = int(counts.sum())
+    mean_aspect = None
+    if total:
+        radians = np.radians(aspect[sloped])
+        mean_aspect = round(float(np.degrees(np.arctan2(np.sin(radians).mean(), np.cos(radians).mean())) % 360), 1)
+
+    return {
+        'cells': int(elevation.size),
+        'cell_area': round(cell_area, 2),
+        'elevation': {
+            'min': round(float(elevation.min()), 2),
+            'max': round(float(elevation.max()), 2),
+            'mean': round(float(elevation.mean()), 2),
+            'range': round(float(elevation.max() - elevation.min()), 2),
+        },
+        'slope': {
+            'mean': round(float(slope.mean()), 2),
+            'mean_percent': round(float(np.tan(np.radians(slope)).mean() * 100), 2),
+            'max': round(float(slope.max()), 2),
+        },
+        'aspect': {
+            'dominant': ASPECT_SECTORS[int(counts.argmax())] if total else None,
+            'mean': mean_aspect,
+            'flat_share': round(float(1 - sloped.mean()), 3),
+            'sectors': {
+                sector: round(int(count) / total, 3) if total else 0
+                for sector, count in zip(ASPECT_SECTORS, counts)
+            },
+        },
+    }
+
+
+def polygon_rings(polygon):
+    return [list(ring) for ring in polygon.coords]
+
+
+def stats_cache_key(rings):
+    geometry = json.dumps([[[round(x, 8), round(y, 8)] for x, y in ring] for ring in rings])
+    return 'terrain:' + hashlib.sha256(geometry.encode()).hexdigest()
+
+
+def cached_zonal_stats(rings):
+    """Statistiques d'un polygone, mises en cache sous une empreinte de sa géométrie (version de l'élément)."""
+    key = stats_cache_key(rings)
+    stats = cache.get(key)
+    if stats is None:
+        stats = zonal_stats(rings)
+        cache.set(key, NO_DEM if stats is None else stats, settings.TERRAIN_CACHE_TTL)
+    return None if stats == NO_DEM else stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Pool de processus partagé par le processus serveur, créé au premier calcul réparti :
+    chaque processus fils n'importe Django, NumPy et GDAL et n'indexe les MNT qu'une fois.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Processus lancés à neuf : ils n'héritent ni des connexions à la base ni des threads du serveur
+            context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=settings.TERRAIN_WORKERS, mp_context=context)
+        return _pool
+
+
+def reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def batch_zonal_stats(polygons):
+    """
+    Statistiques de plusieurs polygones {identifiant: anneaux} : les résultats en cache
+    sont réutilisés ; les autres sont calculés dans le processus courant, ou répartis sur
+    le pool de processus au-delà de TERRAIN_PARALLEL_MIN polygones.
+    """
+    keys = {identifier: stats_cache_key(rings) for identifier, rings in polygons.items()}
+    cached = cache.get_many(list(keys.values()))
+    results = {
+        identifier: None if cached[key] == NO_DEM else cached[key]
+        for identifier, key in keys.items() if key in cached
+    }
+    missing = [identifier for identifier in polygons if identifier not in results]
+
+    if len(missing) < settings.TERRAIN_PARALLEL_MIN:
+        results.update((identifier, zonal_stats(polygons[identifier])) for identifier in missing)
+    else:
+        pool = get_pool()
+        try:
+            results.update(zip(missing, pool.map(zonal_stats, [polygons[identifier] for identifier in missing])))
+        except BrokenProcessPool:
+            # Processus fils tué (mémoire…) : pool recréé au prochain appel, calcul terminé ici
+            reset_pool(pool)
+            results.update(
+                (identifier, zonal_stats(polygons[identifier])) for identifier in missing if identifier not in results
+            )
+
+    cache.set_many(
+        {keys[identifier]: NO_DEM if results[identifier] is None else results[identifier] for identifier in missing},
+        settings.TERRAIN_CACHE_TTL
+    )
+    return results
@@ -0,0 +1,63 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+from django.core.cache import cache
+
+from api import ecowitt
+from api.management.commands.fake_ecowitt import FakeEcowittHandler
+
+
+class CountingHandler(FakeEcowittHandler):
+    """Faux Ecowitt instrumenté : compte les requêtes et peut échouer (503) sur les N suivantes."""
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            fail = self.server.fail_next > 0
+            if fail:
+                self.server.fail_next -= 1
+        if fail:
+            return self.send_json({'error': 'simulated failure'}, status=503)
+        return super().do_GET()
+
+
+@pytest.fixture(autouse=True)
+def isolated_ecowitt_state():
+    """Disjoncteurs et réponses de secours propres à chaque test."""
+    ecowitt._breakers.clear()
+    cache.clear()
+    yield
+    ecowitt._breakers.clear()
+    cache.clear()
+
+
+@pytest.fixture
+def fake_ecowitt(settings):
+    """Faux serveur Ecowitt local (commande fake_ecowitt) sur un port libre, client configuré pour l'utiliser."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    server.options = {'devices': 2, 'latency': 0, 'failure_rate': 0.0, 'verbosity': 0}
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.fail_next = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    settings.ECOWITT_BASE_URL = f'http://127.0.0.1:{server.server_port}/api/v3'
+    settings.ECOWITT_MAX_RETRIES = 1
+    settings.ECOWITT_BACKOFF_BASE = 0
+    settings.ECOWITT_BACKOFF_MAX = 0
+    settings.ECOWITT_BREAKER_THRESHOLD = 2
+    settings.ECOWITT_BREAKER_RESET_TIMEOUT = 0.2
+    yield server
+
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def client_factory(fake_ecowitt):
+    def make(api_key='test-api-key'):
+        return ecowitt.EcowittClient('test-application-key', api_key)
+    return make
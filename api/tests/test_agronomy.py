@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from api.agronomy import et0_fao56, growing_degree_days
+
+
+def test_et0_fao56_example_18(settings):
+    # FAO-56, exemple 18 : Bruxelles (50°48' N, 100 m), 6 juillet, vent mesuré à 10 m
+    settings.WEATHER_ANEMOMETER_HEIGHT = 10
+    et0 = et0_fao56(
+        t_min=np.array([12.3]),
+        t_max=np.array([21.5]),
+        rh_min=np.array([63.0]),
+        rh_max=np.array([84.0]),
+        solar=np.array([22.07 / 0.0864]),
+        wind=np.array([10.0]),
+        pressure=np.array([1001.0]),
+        latitude=50.8,
+        day_of_year=np.array([187]),
+    )
+
+    assert et0[0] == pytest.approx(3.9, abs=0.1)
+
+
+def test_et0_fao56_is_never_negative(settings):
+    settings.WEATHER_ANEMOMETER_HEIGHT = 2
+    et0 = et0_fao56(
+        t_min=np.array([-5.0]),
+        t_max=np.array([-1.0]),
+        rh_min=np.array([100.0]),
+        rh_max=np.array([100.0]),
+        solar=np.array([0.0]),
+        wind=np.array([0.0]),
+        pressure=np.array([1013.0]),
+        latitude=50.8,
+        day_of_year=np.array([355]),
+    )
+
+    assert et0[0] >= 0
+
+
+def test_growing_degree_days(settings):
+    settings.WEATHER_GDD_CAP = 30
+
+    gdd = growing_degree_days(np.array([5.0, 12.0, 20.0]), np.array([9.0, 24.0, 36.0]), 10)
+
+    np.testing.assert_allclose(gdd, [0.0, 8.0, 15.0])
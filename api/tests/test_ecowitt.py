@@ -0,0 +1,235 @@
+import threading
+import time
+
+import pytest
+
+from api import ecowitt
+from api.ecowitt import CircuitBreaker, EcowittError, EcowittUnavailable, SingleFlight
+
+
+def test_device_list(fake_ecowitt, client_factory):
+    data = client_factory().device_list()
+
+    assert data['code'] == 0
+    assert len(data['data']['list']) == 2
+    assert 'stale' not in data
+    assert fake_ecowitt.requests == 1
+
+
+def test_retry_then_success(fake_ecowitt, client_factory):
+    fake_ecowitt.fail_next = 1
+
+    data = client_factory().device_list()
+
+    assert data['code'] == 0
+    assert fake_ecowitt.requests == 2
+    assert not ecowitt.get_breaker('test-api-key').is_open
+
+
+def test_transport_errors_open_breaker(fake_ecowitt, client_factory):
+    client = client_factory()
+    fake_ecowitt.fail_next = 10
+
+    for _ in range(2):
+        with pytest.raises(EcowittError) as excinfo:
+            client.device_list()
+        assert excinfo.value.status_code == 503
+        assert excinfo.value.upstream_message is None
+    # Chaque appel épuise ses tentatives (1 + ECOWITT_MAX_RETRIES)
+    assert fake_ecowitt.requests == 4
+    assert ecowitt.get_breaker('test-api-key').is_open
+
+    # Disjoncteur ouvert : aucune requête émise
+    with pytest.raises(EcowittUnavailable):
+        client.device_list()
+    assert fake_ecowitt.requests == 4
+
+
+def test_unreachable_server_is_transport_error(fake_ecowitt, settings, client_factory):
+    settings.ECOWITT_BASE_URL = 'http://127.0.0.1:1/api/v3'
+
+    with pytest.raises(EcowittError) as excinfo:
+        client_factory().device_list()
+
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.upstream_message is None
+    assert ecowitt.get_breaker('test-api-key').failures == 1
+
+
+def test_app_error_is_not_retried_and_keeps_breaker_closed(fake_ecowitt, client_factory):
+    client = client_factory(api_key='invalid')
+
+    for _ in range(3):
+        with pytest.raises(EcowittError) as excinfo:
+            client.device_list()
+        assert excinfo.value.upstream_message == 'Illegal Api Key'
+
+    assert fake_ecowitt.requests == 3
+    breaker = ecowitt.get_breaker('invalid')
+    assert not breaker.is_open
+    assert breaker.failures == 0
+
+
+def test_half_open_trial_closes_breaker(fake_ecowitt, client_factory):
+    client = client_factory()
+    fake_ecowitt.fail_next = 4
+    for _ in range(2):
+        with pytest.raises(EcowittError):
+            client.device_list()
+    assert ecowitt.get_breaker('test-api-key').is_open
+
+    time.sleep(0.25)
+    data = client.device_list()
+
+    assert data['code'] == 0
+    assert not ecowitt.get_breaker('test-api-key').is_open
+
+
+def test_half_open_trial_failure_reopens_breaker(fake_ecowitt, client_factory):
+    client = client_factory()
+    fake_ecowitt.fail_next = 10
+    for _ in range(2):
+        with pytest.raises(EcowittError):
+            client.device_list()
+
+    time.sleep(0.25)
+    with pytest.raises(EcowittError) as excinfo:
+        client.device_list()
+    assert not isinstance(excinfo.value, EcowittUnavailable)
+
+    requests_before = fake_ecowitt.requests
+    with pytest.raises(EcowittUnavailable):
+        client.device_list()
+    assert fake_ecowitt.requests == requests_before
+
+
+def test_unexpected_error_releases_trial(fake_ecowitt, client_factory, monkeypatch):
+    client = client_factory()
+    breaker = ecowitt.get_breaker('test-api-key')
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.opened_at -= 1
+
+    def explode(*args, **kwargs):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(client, 'request_with_retries', explode)
+    with pytest.raises(RuntimeError):
+        client.device_list()
+
+    assert not breaker.trial_in_progress
+    assert breaker.is_open
+
+
+def test_breaker_allows_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_stale_fallback_after_success(fake_ecowitt, client_factory):
+    client = client_factory()
+    fresh = client.device_list()
+
+    fake_ecowitt.fail_next = 10
+    stale = client.device_list()
+
+    assert stale['stale'] is True
+    assert stale['data'] == fresh['data']
+
+    # Disjoncteur ouvert : la réponse de secours est servie sans requête
+    client.device_list()
+    requests_before = fake_ecowitt.requests
+    assert client.device_list()['stale'] is True
+    assert fake_ecowitt.requests == requests_before
+
+
+def test_app_error_does_not_serve_fallback(fake_ecowitt, client_factory):
+    client = client_factory(api_key='invalid')
+    key = client.fallback_key('device/list', {})
+    ecowitt.cache.set(key, {'code': 0, 'data': {}}, 60)
+
+    with pytest.raises(EcowittError):
+        client.device_list()
+
+
+def test_backoff_is_capped(settings, monkeypatch):
+    settings.ECOWITT_BACKOFF_BASE = 0.5
+    settings.ECOWITT_BACKOFF_MAX = 2
+    bounds, sleeps = [], []
+    monkeypatch.setattr(ecowitt.random, 'uniform', lambda low, high: bounds.append((low, high)) or high)
+    monkeypatch.setattr(ecowitt.time, 'sleep', sleeps.append)
+
+    client = ecowitt.EcowittClient('app', 'key', base_url='http://127.0.0.1:1')
+    for attempt in range(5):
+        client.backoff(attempt)
+
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2), (0, 2), (0, 2)]
+    assert sleeps == [0.5, 1.0, 2, 2, 2]
+
+
+def test_single_flight_runs_once():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', work)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(flight.do('key', work))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(2)
+
+    assert calls == [1]
+    assert results == ['result'] * 4
+    assert flight.calls == {}
+
+
+def test_single_flight_propagates_error():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def work():
+        started.set()
+        release.wait(2)
+        raise EcowittError('échec', status_code=503)
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', work)
+        except EcowittError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+    assert flight.calls == {}
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from api.hydraulics import hazen_williams, node_levels
+
+
+def test_hazen_williams():
+    # 100 m de PE (C = 140), Ø 100 mm, 10 l/s
+    assert hazen_williams(100, 0.01, 0.1, 140) == pytest.approx(1.6593, abs=1e-4)
+
+
+def test_hazen_williams_vectorised():
+    losses = hazen_williams(np.array([100.0, 200.0]), np.array([0.01, 0.01]), np.array([0.1, np.nan]), 140)
+
+    assert losses[0] == pytest.approx(1.6593, abs=1e-4)
+    assert np.isnan(losses[1])
+
+
+def test_node_levels_chain():
+    levels, indegree = node_levels(3, np.array([0, 1]), np.array([1, 2]))
+
+    assert levels.tolist() == [0, 1, 2]
+    assert indegree.tolist() == [0, 1, 1]
+
+
+def test_node_levels_diamond():
+    levels, indegree = node_levels(4, np.array([0, 0, 1, 2]), np.array([1, 2, 3, 3]))
+
+    assert levels.tolist() == [0, 1, 1, 2]
+    assert indegree.tolist() == [0, 1, 1, 2]
+
+
+def test_node_levels_rejects_cycles():
+    with pytest.raises(ValueError):
+        node_levels(3, np.array([0, 1, 2]), np.array([1, 2, 1]))
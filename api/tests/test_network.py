@@ -0,0 +1,56 @@
+import pytest
+
+from api.network import NetworkIndex, line_lengths
+
+
+@pytest.fixture
+def index():
+    # 1 -> 2 -> 3 <- 4, 5 isolée ; lignes 1 à 4 de longueurs connues
+    edges = [(10, 1, 2, 5.0), (11, 2, 3, 0.0), (12, 4, 3, 0.0)]
+    lengths = {1: 100.0, 2: 50.0, 3: 20.0, 4: 10.0}
+    return NetworkIndex([1, 2, 3, 4, 5], edges, lengths)
+
+
+def test_components(index):
+    assert index.components() == [[1, 2, 3, 4], [5]]
+
+
+def test_traverse(index):
+    assert index.traverse(1) == [(2, 1), (3, 2)]
+    assert index.traverse(3, downstream=False) == [(2, 1), (4, 1), (1, 2)]
+    assert index.traverse(5) == []
+
+
+def test_shortest_path_counts_lines_and_connexions(index):
+    formes, connexions, length = index.shortest_path(1, 4)
+
+    assert formes == [1, 2, 3, 4]
+    assert connexions == [10, 11, 12]
+    assert length == pytest.approx(100 + 5 + 50 + 20 + 10)
+
+
+def test_shortest_path_directed(index):
+    assert index.shortest_path(1, 4, directed=True) is None
+    assert index.shortest_path(1, 3, directed=True)[0] == [1, 2, 3]
+    assert index.shortest_path(1, 5) is None
+
+
+def test_shortest_path_prefers_shorter_lines():
+    # Deux chemins de 1 à 4 : par la ligne longue 2 ou par la ligne courte 3
+    edges = [(10, 1, 2, 0.0), (11, 2, 4, 0.0), (12, 1, 3, 0.0), (13, 3, 4, 0.0)]
+    index = NetworkIndex([1, 2, 3, 4], edges, {2: 500.0, 3: 40.0})
+
+    formes, connexions, length = index.shortest_path(1, 4)
+
+    assert formes == [1, 3, 4]
+    assert connexions == [12, 13]
+    assert length == pytest.approx(40.0)
+
+
+def test_line_lengths():
+    lengths = line_lengths([[(0, 0), (0.01, 0)], [(0, 0), (0, 0.01), (0.01, 0.01)], [(1, 1), (1, 1)]])
+
+    assert lengths[0] == pytest.approx(1111.95, abs=0.01)
+    assert lengths[1] == pytest.approx(1111.95 * 2, abs=0.05)
+    assert lengths[2] == 0.0
+    assert len(line_lengths([])) == 0
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from api.profiles import densify, profile_stats
+
+
+def test_densify_spacing():
+    longitudes, latitudes, distances = densify([(0, 0), (0.01, 0)], 100)
+
+    # 1111,95 m au pas de 100 m : 12 segments, sommets conservés
+    assert len(distances) == 13
+    assert distances[0] == 0.0
+    assert distances[-1] == pytest.approx(1111.95, abs=0.01)
+    assert np.all(np.diff(distances) <= 100)
+    assert longitudes[0] == pytest.approx(0.0) and longitudes[-1] == pytest.approx(0.01)
+    np.testing.assert_allclose(latitudes, 0.0, atol=1e-12)
+
+
+def test_densify_keeps_vertices_and_zero_length_segments():
+    longitudes, latitudes, distances = densify([(0, 0), (0, 0), (0, 0.001)], 1000)
+
+    assert len(distances) == 3
+    assert distances.tolist()[:2] == [0.0, 0.0]
+    assert latitudes[-1] == pytest.approx(0.001)
+
+
+def test_densify_max_points():
+    with pytest.raises(ValueError):
+        densify([(0, 0), (0.01, 0)], 100, max_points=10)
+
+
+def test_profile_stats():
+    stats = profile_stats(np.array([0.0, 100.0, 200.0, 300.0]), np.array([10.0, 15.0, np.nan, 5.0]))
+
+    assert stats['ascent'] == 5.0
+    assert stats['descent'] == 10.0
+    assert stats['max_slope'] == 5.0
+    assert stats['min_elevation'] == 5.0
+    assert stats['max_elevation'] == 15.0
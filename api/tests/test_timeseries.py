@@ -0,0 +1,52 @@
+import numpy as np
+
+from api.timeseries import cumulative_increments, lttb, resample, series_arrays
+
+
+def test_series_arrays_sorts_and_drops_invalid():
+    x, y = series_arrays({'20': '2.5', '10': '1', '30': '-', '40': None})
+
+    assert x.tolist() == [10000, 20000]
+    assert y.tolist() == [1.0, 2.5]
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    x = np.arange(100, dtype=np.int64)
+    y = np.zeros(100)
+    y[50] = 10.0
+
+    sx, sy = lttb(x, y, 10)
+
+    assert len(sx) == 10
+    assert sx[0] == 0 and sx[-1] == 99
+    assert np.all(np.diff(sx) > 0)
+    assert 50 in sx.tolist()
+    assert sy.max() == 10.0
+
+
+def test_lttb_returns_short_series_unchanged():
+    x, y = np.arange(5), np.arange(5, dtype=np.float64)
+
+    sx, sy = lttb(x, y, 10)
+
+    assert sx is x and sy is y
+
+
+def test_resample():
+    buckets = [0, 0, 1, 3, -1, 4]
+    values = [1.0, 3.0, 5.0, np.nan, 7.0, 9.0]
+
+    np.testing.assert_array_equal(resample(buckets, values, 4), [2.0, 5.0, np.nan, np.nan])
+    np.testing.assert_array_equal(resample(buckets, values, 4, how='sum'), [4.0, 5.0, np.nan, np.nan])
+    np.testing.assert_array_equal(resample(buckets, values, 4, how='max'), [3.0, 5.0, np.nan, np.nan])
+
+
+def test_cumulative_increments():
+    values = [0.0, 1.0, 3.0, 0.5, 2.0, 1.0]
+    periods = [1, 1, 1, 2, 2, 2]
+
+    increments = cumulative_increments(values, periods)
+
+    # Changement de période : la valeur elle-même ; baisse dans la période : nouveau départ
+    np.testing.assert_allclose(increments, [0.0, 1.0, 2.0, 0.5, 1.5, 1.0])
+    assert len(cumulative_increments([], [])) == 0
@@ -0,0 +1,307 @@
+"""
+Proxy des tuiles de fond de carte (hybride Google, cadastre et plan IGN).
+La clé Google reste côté serveur : un jeton de session Map Tiles est créé puis
+réutilisé jusqu'à son expiration. Les tuiles sont conservées dans un cache disque
+réparti en sous-répertoires, borné en taille (éviction des moins récemment lues) ;
+les tuiles inexistantes sont mémorisées un temps pour ne pas être redemandées, et
+les requêtes simultanées pour une même tuile ne donnent lieu qu'à un appel amont.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+from .ecowitt import SingleFlight
+from .models import ApplicationSetting
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_TILES_URL = 'https://tile.googleapis.com/v1'
+
+GEOPF_WMTS_URL = (
+    'https://data.geopf.fr/wmts?SERVICE=WMTS&REQUEST=GetTile&VERSION=1.0.0&LAYER={layer}'
+    '&STYLE=normal&FORMAT=image/png&TILEMATRIXSET=PM&TILEMATRIX={z}&TILEROW={y}&TILECOL={x}'
+)
+
+# Type de tuile -> couche WMTS Géoplateforme (None : tuiles Google hybrides)
+TILE_SOURCES = {
+    'hybrid': None,
+    'cadastre': 'CADASTRALPARCELS.PARCELLAIRE_EXPRESS',
+    'ign': 'GEOGRAPHICALGRIDSYSTEMS.PLANIGNV2',
+}
+
+MAX_ZOOM = 22
+
+# Clé de cache de la clé API Google (relue en base au plus une fois par minute)
+GOOGLE_API_KEY_CACHE = 'tiles:google-api-key'
+
+# Marge avant expiration à partir de laquelle le jeton de session est renouvelé (secondes)
+SESSION_RENEW_MARGIN = 300
+
+
+class TileError(Exception):
+    """Le service amont n'a pas pu fournir la tuile (erreur non mise en cache)."""
+
+
+class TileNotFound(TileError):
+    """La tuile n'existe pas chez le fournisseur (mise en cache négatif)."""
+
+
+_session = None
+_session_lock = threading.Lock()
+_google_session = {'api_key': None, 'token': None, 'expires_at': 0}
+_google_session_lock = threading.Lock()
+tile_flight = SingleFlight()
+
+
+def get_session():
+    """Session HTTP partagée par le processus (pool de connexions keep-alive vers les fournisseurs)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.TILE_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def google_api_key():
+    def load():
+        setting = ApplicationSetting.objects.filter(key='google_maps_api_key').first()
+        return setting.value if setting and setting.value else ''
+    return cache.get_or_set(GOOGLE_API_KEY_CACHE, load, 60)
+
+
+def google_session_token(api_key, renew=False):
+    """
+    Jeton de session Map Tiles (satellite + libellés routiers), créé une seule fois
+    par processus et réutilisé jusqu'à son expiration ou un changement de clé.
+    """
+    with _google_session_lock:
+        current = _google_session
+        if (
+            not renew and current['api_key'] == api_key
+            and current['expires_at'] - SESSION_RENEW_MARGIN > time.time()
+        ):
+            return current['token']
+
+        try:
+            response = get_session().post(
+                f'{GOOGLE_TILES_URL}/createSession',
+                params={'key': api_key},
+                json={
+                    'mapType': 'satellite',
+                    'layerTypes': ['layerRoadmap'],
+                    'language': 'fr-FR',
+                    'region': 'FR',
+                },
+                timeout=(settings.TILE_CONNECT_TIMEOUT, settings.TILE_READ_TIMEOUT)
+            )
+            response.raise_for_status()
+            data = response.json()
+            token = data['session']
+            expires_at = int(data.get('expiry') or time.time() + 3600)
+        except (requests.RequestException, ValueError, KeyError, TypeError, AttributeError) as e:
+            raise TileError(f"Création de la session Google Map Tiles impossible: {e!r}")
+
+        current.update({
+            'api_key': api_key,
+            'token': token,
+            'expires_at': expires_at,
+        })
+        logger.info("Nouvelle session Google Map Tiles créée")
+        return current['token']
+
+
+def fetch_upstream(tile_type, z, x, y):
+    """Télécharge une tuile chez son fournisseur. Retourne son contenu ; lève TileNotFound ou TileError."""
+    layer = TILE_SOURCES[tile_type]
+    try:
+        if layer is None:
+            api_key = google_api_key()
+            if not api_key:
+                raise TileError("Clé API Google Maps non configurée")
+            url = f'{GOOGLE_TILES_URL}/2dtiles/{z}/{x}/{y}'
+            response = get_session().get(
+                url,
+                params={'session': google_session_token(api_key), 'key': api_key},
+                timeout=(settings.TILE_CONNECT_TIMEOUT, settings.TILE_READ_TIMEOUT)
+            )
+            # Jeton expiré ou révoqué : une seule nouvelle tentative avec un jeton neuf
+            if response.status_code in (400, 401, 403):
+                response = get_session().get(
+                    url,
+                    params={'session': google_session_token(api_key, renew=True), 'key': api_key},
+                    timeout=(settings.TILE_CONNECT_TIMEOUT, settings.TILE_READ_TIMEOUT)
+                )
+        else:
+            response = get_session().get(
+                GEOPF_WMTS_URL.format(layer=layer, z=z, x=x, y=y),
+                timeout=(settings.TILE_CONNECT_TIMEOUT, settings.TILE_READ_TIMEOUT)
+            )
+    except requests.RequestException as e:
+        raise TileError(f"Tuile {tile_type}/{z}/{x}/{y} indisponible: {e}")
+
+    if response.status_code in (204, 404):
+        raise TileNotFound(f"Tuile {tile_type}/{z}/{x}/{y} inexistante")
+    if response.status_code != 200 or not response.content:
+        raise TileError(f"Tuile {tile_type}/{z}/{x}/{y}: réponse HTTP {response.status_code}")
+    return response.content
+
+
+def tile_path(tile_type, z, x, y):
+    """Chemin de base d'une tuile dans le cache disque, réparti sur deux niveaux de sous-répertoires."""
+    digest = hashlib.sha1(f'{tile_type}/{z}/{x}/{y}'.encode()).hexdigest()
+    return os.path.join(settings.TILE_CACHE_DIR, digest[:2], digest[2:4], digest)
+
+
+def read_cached(path):
+    """
+    Contenu d'une tuile en cache encore valide, None si absente ou expirée.
+    Lève TileNotFound si la tuile est mémorisée comme inexistante.
+    La date d'accès est mise à jour pour l'éviction (la date de modification sert à l'expiration).
+    """
+    now = time.time()
+    try:
+        stat = os.stat(f'{path}.tile')
+        if now - stat.st_mtime < settings.TILE_CACHE_TTL:
+            with open(f'{path}.tile', 'rb') as f:
+                content = f.read()
+            os.utime(f'{path}.tile', (now, stat.st_mtime))
+            return content
+    except OSError:
+        pass
+
+    try:
+        if now - os.stat(f'{path}.missing').st_mtime < settings.TILE_NEGATIVE_TTL:
+            raise TileNotFound(path)
+    except OSError:
+        pass
+    return None
+
+
+def write_cached(path, suffix, content=b''):
+    """Écriture atomique (fichier temporaire puis renommage) d'une entrée du cache."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(content)
+    os.replace(temporary, f'{path}.{suffix}')
+    cache_usage.record(len(content))
+
+
+class TileCacheUsage:
+    """
+    Suivi de la taille du cache disque. Dès que la limite est dépassée, un thread
+    d'arrière-plan parcourt le cache et supprime les entrées les moins récemment lues
+    jusqu'à redescendre à 90 % de la limite. La taille est recalculée à chaque parcours,
+    ce qui corrige les écarts entre processus.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.size = None
+        self.running = False
+
+    def record(self, nbytes):
+        with self.lock:
+            if self.size is not None:
+                self.size += nbytes
+                if self.size <= settings.TILE_CACHE_MAX_BYTES:
+                    return
+            if self.running:
+                return
+            self.running = True
+        threading.Thread(target=self.run, name='tile-cache-eviction', daemon=True).start()
+
+    def run(self):
+        try:
+            size = evict(settings.TILE_CACHE_DIR, settings.TILE_CACHE_MAX_BYTES, int(settings.TILE_CACHE_MAX_BYTES * 0.9))
+        except OSError as e:
+            logger.warning(f"Éviction du cache de tuiles impossible: {e}")
+            size = None
+        with self.lock:
+            self.size = size
+            self.running = False
+
+
+def evict(root, max_bytes, target_bytes):
+    """Supprime les entrées les moins récemment lues si le cache dépasse `max_bytes`. Retourne la taille finale."""
+    entries = []
+    total = 0
+    for shard in os.scandir(root):
+        if not shard.is_dir():
+            continue
+        for subshard in os.scandir(shard.path):
+            if not subshard.is_dir():
+                continue
+            for entry in os.scandir(subshard.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total += stat.st_size
+
+    if total <= max_bytes:
+        return total
+
+    entries.sort()
+    removed = 0
+    for atime, size, path in entries:
+        if total <= target_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    logger.info(f"Cache de tuiles: {removed} entrée(s) évincée(s), {total} octets conservés")
+    return total
+
+
+cache_usage = TileCacheUsage()
+
+
+def get_tile(tile_type, z, x, y):
+    """
+    Contenu d'une tuile, depuis le cache disque ou son fournisseur. Les requêtes
+    simultanées pour une même tuile partagent un seul téléchargement.
+    Lève TileNotFound (mis en cache) ou TileError.
+    """
+    path = tile_path(tile_type, z, x, y)
+    content = read_cached(path)
+    if content is not None:
+        return content
+
+    def load():
+        # Une requête concurrente a pu la déposer entre-temps
+        content = read_cached(path)
+        if content is not None:
+            return content
+        try:
+            content = fetch_upstream(tile_type, z, x, y)
+        except TileNotFound:
+            write_cached(path, 'missing')
+            raise
+        write_cached(path, 'tile', content)
+        return content
+
+    return tile_flight.do(path, load)
+
+
+def tile_content_type(content):
+    if content.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if content.startswith(b'RIFF') and content[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/png'
@@ -0,0 +1,115 @@
+"""
+Outils NumPy pour les séries temporelles météo : conversion vectorisée des listes
+Ecowitt, réduction du nombre de points (Largest-Triangle-Three-Buckets) et
+rééchantillonnage sur une grille temporelle commune.
+"""
+
+import numpy as np
+
+
+def series_arrays(values):
+    """
+    Convertit une liste Ecowitt {epoch: valeur} en deux tableaux triés par horodatage :
+    horodatages en millisecondes (int64) et valeurs (float64). Les valeurs non
+    numériques sont écartées.
+    """
+    if not values:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    x = np.fromiter((int(epoch) for epoch in values.keys()), dtype=np.int64, count=len(values)) * 1000
+    raw = list(values.values())
+    try:
+        y = np.asarray(raw, dtype=np.float64)
+    except (TypeError, ValueError):
+        y = np.array([to_float(value) for value in raw], dtype=np.float64)
+
+    valid = np.isfinite(y)
+    x, y = x[valid], y[valid]
+    order = np.argsort(x, kind='stable')
+    return x[order], y[order]
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def lttb(x, y, threshold):
+    """
+    Réduit une série triée à `threshold` points par Largest-Triangle-Three-Buckets :
+    le premier et le dernier point sont conservés, puis dans chaque seau on garde le
+    point formant le plus grand triangle avec le point retenu précédemment et la
+    moyenne du seau suivant. Préserve pics et creux visuels.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    xf = x.astype(np.float64)
+    # Bornes des threshold - 2 seaux intérieurs (premier et dernier points exclus)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = next_start + 1
+        avg_x = xf[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Aire (au facteur 1/2 près) des triangles (précédent, candidat, moyenne suivante)
+        areas = np.abs(
+            (xf[previous] - avg_x) * (y[start:end] - y[previous])
+            - (xf[previous] - xf[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return x[selected], y[selected]
+
+
+def resample(buckets, values, count, how='mean'):
+    """
+    Agrège des valeurs dans `count` seaux d'une grille temporelle commune, d'après
+    l'indice de seau de chaque valeur (hors grille ou non finie : ignorée).
+    `how` : 'mean', 'sum' ou 'max'. Un seau sans valeur vaut NaN (et non 0).
+    """
+    buckets = np.asarray(buckets, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = (buckets >= 0) & (buckets < count) & np.isfinite(values)
+    buckets, values = buckets[valid], values[valid]
+
+    if how == 'max':
+        result = np.full(count, np.nan)
+        np.fmax.at(result, buckets, values)
+        return result
+
+    totals = np.bincount(buckets, weights=values, minlength=count)
+    samples = np.bincount(buckets, minlength=count)
+    if how == 'sum':
+        return np.where(samples > 0, totals, np.nan)
+    return np.where(samples > 0, totals / np.maximum(samples, 1), np.nan)
+
+
+def cumulative_increments(values, periods):
+    """
+    Incréments d'un cumul remis à zéro à chaque changement de période (pluie journalière) :
+    différence avec la valeur précédente, ou la valeur elle-même au début d'une période
+    (le premier élément est considéré comme tel : la série doit commencer en début de période).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    periods = np.asarray(periods)
+    if not len(values):
+        return values
+    increments = np.empty_like(values)
+    increments[0] = values[0]
+    increments[1:] = np.where(periods[1:] != periods[:-1], values[1:], values[1:] - values[:-1])
+    # Une baisse dans une même période (remise à zéro manuelle) compte comme un nouveau départ
+    increments[1:] = np.where(increments[1:] < 0, values[1:], increments[1:])
+    return increments
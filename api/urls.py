@@ -11,9 +11,13 @@ from .views import (
     GeoNoteViewSet,
     NoteCommentViewSet,
     NotePhotoViewSet,
+    StorageUsageViewSet,
     NoteColumnViewSet,
     MapFilterViewSet,
     WeatherViewSet,
+    WeatherIngestView,
+    ElevationView,
+    tile_proxy,
     ApplicationSettingViewSet,
 )
 
@@ -28,6 +32,7 @@ router.register(r'annotations', TexteAnnotationViewSet, basename='annotation')
 router.register(r'notes', GeoNoteViewSet, basename='note')
 router.register(r'note-comments', NoteCommentViewSet, basename='note-comment')
 router.register(r'note-photos', NotePhotoViewSet, basename='note-photo')
+router.register(r'storage-usage', StorageUsageViewSet, basename='storage-usage')
 router.register(r'columns', NoteColumnViewSet, basename='column')
 router.register(r'map-filters', MapFilterViewSet, basename='map-filters')
 router.register(r'settings', ApplicationSettingViewSet, basename='settings')
@@ -43,7 +48,20 @@ notes_router = NestedDefaultRouter(router, r'notes', lookup='note')
 notes_router.register(r'comments', NoteCommentViewSet, basename='note-comments')
 notes_router.register(r'photos', NotePhotoViewSet, basename='note-photos')
 
+# Envois directs des passerelles Ecowitt (avant le routeur : « ingest » serait pris pour un identifiant)
+ingest_path = path('weather/ingest/', WeatherIngestView.as_view(), name='weather-ingest')
+
+# Export CSV à l'URL attendue par les tableurs (le routeur interpréterait « .csv » comme suffixe de format)
+export_path = path('weather/export.csv', WeatherViewSet.as_view({'get': 'export'}), name='weather-export')
+
+# Proxy des tuiles de fond de carte
+tiles_path = path('tiles/<str:tile_type>/<int:z>/<int:x>/<int:y>.png', tile_proxy, name='tile-proxy')
+
 urlpatterns = [
+    path('elevation/', ElevationView.as_view(), name='elevation'),
+    ingest_path,
+    export_path,
+    tiles_path,
     path('', include(router.urls)),
     path('', include(notes_router.urls)),  # Include nested routes
     devices_path,  # Add explicit devices path
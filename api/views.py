@@ -5,11 +5,20 @@ Gère les endpoints REST pour les utilisateurs, plans, notes et autres ressource
 
 # Imports Django
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from django.db.models import Q, Count
-from django.http import HttpResponse
+from django.db.models import Q, Count, Max, Sum
+from django.db.models.functions import Coalesce
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.contrib.gis.geos import Point
+from django.utils._os import safe_join
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
 from django.shortcuts import get_object_or_404, render
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Imports DRF
 from rest_framework import viewsets, permissions, status
@@ -17,12 +26,21 @@ from rest_framework.decorators import action, api_view
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework.views import APIView
+from rest_framework.parsers import FormParser, MultiPartParser
 
 # Imports tiers
-import requests
 import time
 import logging
 import json
+import os
+import base64
+import csv
+import itertools
+import hashlib
+import mimetypes
+from io import BytesIO
+from PIL import Image
+import numpy as np
 
 # Imports locaux
 from .permissions import IsAdmin, IsSalarie, IsEntreprise
@@ -32,13 +50,34 @@ from .serializers import (
     TexteAnnotationSerializer, PlanDetailSerializer, GeoNoteSerializer,
     NoteCommentSerializer, NotePhotoSerializer, NoteColumnSerializer,
     WeatherDataSerializer, WeatherHistoryDataSerializer, WeatherChartDataSerializer,
-    EcowittDeviceSerializer, MapFilterSerializer, ApplicationSettingSerializer
+    EcowittDeviceSerializer, MapFilterSerializer, ApplicationSettingSerializer,
+    compress_image
 )
 from plans.models import (
     Plan, FormeGeometrique, Connexion, TexteAnnotation,
-    GeoNote, NoteComment, NotePhoto, MapFilter
+    GeoNote, NoteComment, NotePhoto, PhotoUpload, MapFilter
 )
-from .models import ApplicationSetting
+from plans.signals import plan_modifications_deferred
+from .models import ApplicationSetting, WeatherDailyRollup, WeatherStation
+from .agronomy import growing_degree_days, pending_rollup_days, update_rollups, week_start
+from .interpolation import grid_shape, idw_grid
+from .hydraulics import plan_hydraulics
+from .network import detect_connexions, network_indexes
+from .offline_packs import count_tiles, pack_bbox, pack_builds, pack_path, tile_ranges
+from .profiles import line_profile
+from .terrain import batch_zonal_stats, cached_zonal_stats, polygon_rings
+from .ecowitt import EcowittClient, EcowittError
+from .elevation import sample_elevations
+from .tiles import GOOGLE_API_KEY_CACHE, MAX_ZOOM, TILE_SOURCES, TileError, TileNotFound, get_tile, tile_content_type
+from .timeseries import lttb, series_arrays
+from .weather_store import (
+    COMPARE_FIELDS, COMPARE_STEPS, compare_series, compare_source_resolution,
+    HISTORY_WINDOW_DAYS, INCH_TO_MM, INHG_TO_HPA, MPH_TO_KMH,
+    account_key, day_bounds, export_header, extract_devices, fahrenheit_to_celsius, get_history, get_realtime, get_realtime_many,
+    identity, ingest_push, iter_export_rows, nearest_stations, parse_realtime, register_stations, sync_range
+)
+from authentication.models import MEGABYTE, StorageQuotaExceeded
+from authentication.middleware import get_user_jwt
 
 # Configuration
 User = get_user_model()
@@ -49,6 +88,9 @@ ROLE_USINE = 'ENTREPRISE'
 ROLE_DEALER = 'SALARIE'
 ROLE_AGRICULTEUR = 'VISITEUR'
 
+# Indicateurs journaliers interpolables par /weather/grid/
+GRID_VARIABLES = ['rain', 'et0', 't_min', 't_max', 't_mean', 'gdd']
+
 # Configure logger
 logger = logging.getLogger(__name__)
 
@@ -397,6 +439,218 @@ class PlanViewSet(viewsets.ModelViewSet):
 
         return context
 
+    @action(detail=True, methods=['get'], url_path='weather-stations')
+    def weather_stations(self, request, pk=None):
+        """Stations météo les plus proches du centre de l'emprise du plan (?limit=3)."""
+        plan = self.get_object()
+        extent = plan.extent()
+        center = Point((extent[0] + extent[2]) / 2, (extent[1] + extent[3]) / 2, srid=4326) if extent else None
+        return nearest_stations_response(plan_entreprise(plan), center, request)
+
+    @action(detail=True, methods=['get'], url_path='offline-pack')
+    def offline_pack(self, request, pk=None):
+        """
+        Paquet MBTiles de l'emprise du plan pour un usage hors ligne
+        (?layer=ign&min_zoom=12&max_zoom=17). Construit en arrière-plan à la première
+        demande (202), puis servi tant que l'emprise du plan ne change pas.
+        """
+        plan = self.get_object()
+        layer = request.query_params.get('layer', 'ign').lower()
+        if layer not in TILE_SOURCES:
+            return Response(
+                {'error': f'Couche invalide. Valeurs acceptées: {", ".join(TILE_SOURCES)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            min_zoom = int(request.query_params.get('min_zoom', settings.OFFLINE_PACK_MIN_ZOOM))
+            max_zoom = int(request.query_params.get('max_zoom', settings.OFFLINE_PACK_MAX_ZOOM))
+        except ValueError:
+            return Response({'error': 'Niveaux de zoom invalides'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= min_zoom <= max_zoom <= settings.OFFLINE_PACK_MAX_ZOOM:
+            return Response(
+                {'error': f'Les niveaux de zoom doivent vérifier 0 ≤ min_zoom ≤ max_zoom ≤ {settings.OFFLINE_PACK_MAX_ZOOM}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        extent = plan.extent()
+        if extent is None:
+            return Response({'error': 'Le plan ne contient aucun élément'}, status=status.HTTP_404_NOT_FOUND)
+        bbox = pack_bbox(extent)
+        tiles = count_tiles(tile_ranges(bbox, min_zoom, max_zoom))
+        if tiles > settings.OFFLINE_PACK_MAX_TILES:
+            return Response(
+                {'error': f'Le paquet compterait {tiles} tuiles (maximum {settings.OFFLINE_PACK_MAX_TILES}) : réduisez le zoom maximal'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        path = pack_path(plan.id, layer, min_zoom, max_zoom, bbox)
+        build_status, error = pack_builds.status(path)
+        if build_status == 'ready':
+            return FileResponse(
+                open(path, 'rb'),
+                as_attachment=True,
+                filename=f'plan-{plan.id}-{layer}.mbtiles',
+                content_type='application/vnd.sqlite3'
+            )
+        if build_status == 'failed':
+            return Response({'error': error}, status=status.HTTP_502_BAD_GATEWAY)
+        if build_status == 'missing':
+            pack_builds.start(plan.id, plan.nom, layer, min_zoom, max_zoom, bbox)
+        return Response({'status': 'building', 'tiles': tiles, 'bbox': bbox}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], url_path=r'elements/(?P<element_id>\d+)/profile')
+    def element_profile(self, request, pk=None, element_id=None):
+        """
+        Profil altimétrique d'une ligne du plan (?spacing=10, en mètres) : distances
+        cumulées, altitudes, dénivelés et pente maximale. Mis en cache par géométrie.
+        """
+        plan = self.get_object()
+        forme = get_object_or_404(FormeGeometrique, plan=plan, id=element_id)
+        geometry = forme.geometry
+        if geometry is None or geometry.geom_type != 'LineString':
+            return Response(
+                {'error': "Le profil n'est disponible que pour les lignes"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            spacing = float(request.query_params.get('spacing', settings.PROFILE_DEFAULT_SPACING))
+        except ValueError:
+            return Response({'error': 'Pas invalide'}, status=status.HTTP_400_BAD_REQUEST)
+        if not spacing >= settings.PROFILE_MIN_SPACING:
+            return Response(
+                {'error': f'Le pas doit être d\'au moins {settings.PROFILE_MIN_SPACING} m'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            profile = line_profile(geometry.coords, spacing)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'element': forme.id, **profile})
+
+    @action(detail=True, methods=['get'], url_path=r'elements/(?P<element_id>\d+)/terrain')
+    def element_terrain(self, request, pk=None, element_id=None):
+        """Statistiques de terrain (altitudes, pente, exposition) d'un polygone du plan."""
+        plan = self.get_object()
+        forme = get_object_or_404(FormeGeometrique, plan=plan, id=element_id)
+        geometry = forme.geometry
+        if geometry is None or geometry.geom_type != 'Polygon':
+            return Response(
+                {'error': "Les statistiques de terrain ne sont disponibles que pour les polygones"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        stats = cached_zonal_stats(polygon_rings(geometry))
+        if stats is None:
+            return Response({'error': 'Aucun MNT ne couvre cet élément'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'element': forme.id, **stats})
+
+    @action(detail=True, methods=['get'])
+    def terrain(self, request, pk=None):
+        """Statistiques de terrain de tous les polygones du plan (calcul réparti sur plusieurs processus)."""
+        plan = self.get_object()
+        polygons = {}
+        for forme in plan.formes.all():
+            geometry = forme.geometry
+            if geometry is not None and geometry.geom_type == 'Polygon':
+                polygons[forme.id] = polygon_rings(geometry)
+
+        results = batch_zonal_stats(polygons)
+        return Response({
+            'results': [
+                {'element': element_id, **stats} if stats else {'element': element_id, 'error': 'Aucun MNT ne couvre cet élément'}
+                for element_id, stats in ((element_id, results.get(element_id)) for element_id in polygons)
+            ]
+        })
+
+    @action(detail=True, methods=['get'])
+    def hydraulics(self, request, pk=None):
+        """
+        Calcul hydraulique du réseau du plan (?pressure=bar à l'alimentation) : débit,
+        perte de charge Hazen-Williams et pressions de chaque forme. Mis en cache jusqu'à
+        la prochaine modification du plan.
+        """
+        plan = self.get_object()
+        try:
+            inlet_pressure = float(request.query_params.get('pressure', settings.HYDRAULIC_INLET_PRESSURE))
+        except ValueError:
+            return Response({'error': 'Pression invalide'}, status=status.HTTP_400_BAD_REQUEST)
+        if not inlet_pressure > 0:
+            return Response({'error': 'La pression doit être positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = plan_hydraulics(plan, inlet_pressure)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'plan': plan.id, **result})
+
+    @action(detail=True, methods=['post'], url_path='network/detect')
+    def network_detect(self, request, pk=None):
+        """
+        Détecte les connexions des lignes du plan (extrémités à moins de ?tolerance= mètres
+        d'une autre forme) et crée ou met à jour les connexions correspondantes.
+        """
+        plan = self.get_object()
+        try:
+            tolerance = float(request.query_params.get('tolerance', settings.CONNEXION_TOLERANCE))
+        except ValueError:
+            return Response({'error': 'Tolérance invalide'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < tolerance <= settings.CONNEXION_MAX_TOLERANCE:
+            return Response(
+                {'error': f'La tolérance doit être comprise entre 0 et {settings.CONNEXION_MAX_TOLERANCE} m'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        created, updated = detect_connexions(plan, tolerance)
+        return Response({'tolerance': tolerance, 'created': created, 'updated': updated})
+
+    @action(detail=True, methods=['get'], url_path='network/components')
+    def network_components(self, request, pk=None):
+        """Composantes connexes du réseau de formes du plan (connexions sans orientation)."""
+        index = network_indexes.get(self.get_object())
+        components = index.components()
+        return Response({'count': len(components), 'components': components})
+
+    @action(detail=True, methods=['get'], url_path=r'network/(?P<direction>upstream|downstream)')
+    def network_traversal(self, request, pk=None, direction=None):
+        """Formes en aval (ou en amont) d'une forme (?forme=ID), avec leur profondeur."""
+        index = network_indexes.get(self.get_object())
+        try:
+            forme_id = int(request.query_params.get('forme', ''))
+        except ValueError:
+            return Response({'error': 'Le paramètre forme est obligatoire'}, status=status.HTTP_400_BAD_REQUEST)
+        if forme_id not in index.nodes:
+            return Response({'error': 'Forme introuvable dans ce plan'}, status=status.HTTP_404_NOT_FOUND)
+
+        reached = index.traverse(forme_id, downstream=direction == 'downstream')
+        return Response({
+            'forme': forme_id,
+            'direction': direction,
+            'count': len(reached),
+            'formes': [{'id': forme, 'depth': depth} for forme, depth in reached],
+        })
+
+    @action(detail=True, methods=['get'], url_path='network/path')
+    def network_path(self, request, pk=None):
+        """
+        Plus court chemin entre deux formes (?from=ID&to=ID), pondéré par la longueur des
+        connexions ; ?directed=true pour ne suivre les connexions que de la source vers la destination.
+        """
+        index = network_indexes.get(self.get_object())
+        try:
+            source = int(request.query_params.get('from', ''))
+            target = int(request.query_params.get('to', ''))
+        except ValueError:
+            return Response({'error': 'Les paramètres from et to sont obligatoires'}, status=status.HTTP_400_BAD_REQUEST)
+        if source not in index.nodes or target not in index.nodes:
+            return Response({'error': 'Forme introuvable dans ce plan'}, status=status.HTTP_404_NOT_FOUND)
+
+        directed = request.query_params.get('directed', '').lower() in ('1', 'true', 'yes')
+        path = index.shortest_path(source, target, directed=directed)
+        if path is None:
+            return Response({'error': 'Aucun chemin entre ces formes'}, status=status.HTTP_404_NOT_FOUND)
+        formes, connexions, length = path
+        return Response({'formes': formes, 'connexions': connexions, 'length': round(length, 2)})
+
     @action(detail=True, methods=['patch'])
     @transaction.atomic
     def elements(self, request, pk=None):
@@ -470,43 +724,49 @@ class PlanViewSet(viewsets.ModelViewSet):
         elements_to_delete = request.data.get('elementsToDelete', [])
 
         try:
-            # Supprimer les éléments existants si demandé
-            if request.data.get('clear_existing', False):
-                plan.formes.all().delete()
-                plan.connexions.all().delete()
-                plan.annotations.all().delete()
-
-            # Supprimer les éléments spécifiques demandés
-            if elements_to_delete:
-                deleted_count = FormeGeometrique.objects.filter(
-                    id__in=elements_to_delete,
-                    plan=plan
-                ).delete()[0]
-
-            # Créer/Mettre à jour les formes
-            for forme_data in formes_data:
-                forme_id = forme_data.pop('id', None)
-                type_forme = forme_data.get('type_forme')
-                data = forme_data.get('data', {})
-
-                if forme_id:
-                    try:
-                        forme = FormeGeometrique.objects.get(id=forme_id, plan=plan)
-                        forme.type_forme = type_forme
-                        forme.data = data
-                        forme.save()
-                    except FormeGeometrique.DoesNotExist:
+            # Une seule mise à jour de la date de modification, à la fin (plan.touch())
+            with plan_modifications_deferred():
+                # Supprimer les éléments existants si demandé
+                if request.data.get('clear_existing', False):
+                    plan.formes.all().delete()
+                    plan.connexions.all().delete()
+                    plan.annotations.all().delete()
+
+                # Supprimer les éléments spécifiques demandés
+                if elements_to_delete:
+                    deleted_count = FormeGeometrique.objects.filter(
+                        id__in=elements_to_delete,
+                        plan=plan
+                    ).delete()[0]
+
+                # Créer/Mettre à jour les formes
+                for forme_data in formes_data:
+                    forme_id = forme_data.pop('id', None)
+                    type_forme = forme_data.get('type_forme')
+                    data = forme_data.get('data', {})
+
+                    if forme_id:
+                        try:
+                            forme = FormeGeometrique.objects.get(id=forme_id, plan=plan)
+                            forme.type_forme = type_forme
+                            forme.data = data
+                            forme.save()
+                        except FormeGeometrique.DoesNotExist:
+                            FormeGeometrique.objects.create(
+                                plan=plan,
+                                type_forme=type_forme,
+                                data=data
+                            )
+                    else:
                         FormeGeometrique.objects.create(
                             plan=plan,
                             type_forme=type_forme,
                             data=data
                         )
-                else:
-                    FormeGeometrique.objects.create(
-                        plan=plan,
-                        type_forme=type_forme,
-                        data=data
-                    )
+
+                # Connexions des lignes dont les extrémités touchent une autre forme
+                if settings.CONNEXION_AUTO_DETECT and formes_data:
+                    detect_connexions(plan, settings.CONNEXION_TOLERANCE)
 
             # Sauvegarder les préférences
             if preferences := request.data.get('preferences'):
@@ -652,6 +912,13 @@ class GeoNoteViewSet(viewsets.ModelViewSet):
         # car le filtrage est déjà fait au niveau de l'API
         serializer.save(createur=user, enterprise_id=enterprise_id)
 
+    @action(detail=True, methods=['get'], url_path='weather-stations')
+    def weather_stations(self, request, pk=None):
+        """Stations météo les plus proches de la note (?limit=3)."""
+        note = self.get_object()
+        entreprise = note.enterprise_id or (plan_entreprise(note.plan) if note.plan_id else None)
+        return nearest_stations_response(entreprise, note.location, request)
+
 class NoteCommentViewSet(viewsets.ModelViewSet):
     """ViewSet pour la gestion des commentaires sur les notes."""
     serializer_class = NoteCommentSerializer
@@ -776,6 +1043,60 @@ class NoteCommentViewSet(viewsets.ModelViewSet):
 
         raise PermissionDenied('Vous n\'avez pas accès à cette note')
 
+def plan_entreprise(plan):
+    """Entreprise dont dépend un plan : assignée, celle du salarié, ou le créateur s'il est une entreprise."""
+    if plan.entreprise_id:
+        return plan.entreprise
+    if plan.salarie_id and plan.salarie.entreprise_id:
+        return plan.salarie.entreprise
+    if plan.createur.role == ROLE_USINE:
+        return plan.createur
+    return None
+
+
+def nearest_stations_response(entreprise, point, request):
+    """Réponse listant les stations météo de l'entreprise les plus proches d'un point."""
+    if point is None:
+        return Response({'error': 'Aucune position connue'}, status=status.HTTP_404_NOT_FOUND)
+    if entreprise is None or not entreprise.ecowitt_api_key:
+        return Response({'stations': []})
+
+    try:
+        limit = min(max(int(request.query_params.get('limit', 3)), 1), 20)
+    except ValueError:
+        limit = 3
+
+    stations = nearest_stations(account_key(entreprise.ecowitt_api_key), point, limit)
+    return Response({
+        'stations': [
+            {
+                'device_id': station.device_id,
+                'name': station.name,
+                'latitude': station.location.y,
+                'longitude': station.location.x,
+                'distance': round(station.distance.m),
+            }
+            for station in stations
+        ]
+    })
+
+
+def photo_notes_filter(user):
+    """
+    Filtre des notes dont l'utilisateur (non admin) peut voir les photos :
+    - Entreprises et salariés : notes des plans auxquels ils ont accès
+    - Visiteurs : notes de leurs plans
+    """
+    if user.role in [ROLE_USINE, ROLE_DEALER]:
+        return (
+            Q(plan__entreprise=user) |
+            Q(plan__salarie=user) |
+            Q(plan__salarie__entreprise=user) |
+            Q(plan__visiteur__salarie=user) |
+            Q(plan__visiteur__salarie__entreprise=user)
+        )
+    return Q(plan__visiteur=user)
+
 class NotePhotoViewSet(viewsets.ModelViewSet):
     """ViewSet pour la gestion des photos des notes."""
     serializer_class = NotePhotoSerializer
@@ -796,20 +1117,8 @@ class NotePhotoViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.role == ROLE_ADMIN:
             return queryset
-        elif user.role in [ROLE_USINE, ROLE_DEALER]:
-            # Entreprises et salariés peuvent voir toutes les photos des notes auxquelles ils ont accès
-            note_ids = GeoNote.objects.filter(
-                Q(plan__entreprise=user) |
-                Q(plan__salarie=user) |
-                Q(plan__salarie__entreprise=user) |
-                Q(plan__visiteur__salarie=user) |
-                Q(plan__visiteur__salarie__entreprise=user)
-            ).values_list('id', flat=True)
-            return queryset.filter(note_id__in=note_ids)
-        else:  # visiteur
-            # Les visiteurs ne peuvent voir que les photos des notes de leurs plans
-            note_ids = GeoNote.objects.filter(plan__visiteur=user).values_list('id', flat=True)
-            return queryset.filter(note_id__in=note_ids)
+        note_ids = GeoNote.objects.filter(photo_notes_filter(user)).values_list('id', flat=True)
+        return queryset.filter(note_id__in=note_ids)
 
     def create(self, request, *args, **kwargs):
         """
@@ -859,6 +1168,28 @@ class NotePhotoViewSet(viewsets.ModelViewSet):
         note = serializer.validated_data['note']
         user = self.request.user
 
+        self.check_note_access(note, user)
+
+        # Vérifier le quota de stockage
+        if 'image' in serializer.validated_data:
+            image = serializer.validated_data['image']
+
+            # Une image déjà stockée par l'utilisateur n'est pas comptée deux fois
+            already_stored = NotePhoto.is_stored_for(user, image)
+
+            if not already_stored and not user.has_storage_for(image.size):
+                raise ValidationError({
+                    'image': f"Quota de stockage dépassé. Vous avez utilisé {user.storage_used}MB sur {user.storage_quota}MB."
+                })
+
+        # Contrôle ci-dessus indicatif : l'admission définitive est atomique (NotePhoto.save)
+        try:
+            serializer.save(user=user)
+        except StorageQuotaExceeded as e:
+            raise ValidationError({'image': str(e)})
+
+    def check_note_access(self, note, user):
+        """Vérifie que l'utilisateur peut ajouter des photos à la note."""
         # 1. Vérifier si l'utilisateur est le créateur de la note
         creator_access = False
         if hasattr(note, 'createur') and note.createur == user:
@@ -891,26 +1222,284 @@ class NotePhotoViewSet(viewsets.ModelViewSet):
             if not (creator_access or plan_access or user.role == ROLE_ADMIN):
                 raise PermissionDenied('Vous n\'avez pas accès à cette note')
 
-        # Vérifier le quota de stockage
-        if 'image' in serializer.validated_data:
-            image = serializer.validated_data['image']
-            # Estimer la taille en MB
-            estimated_size_mb = image.size / (1024 * 1024)
+    # Upload reprenable (protocole de type tus) :
+    # 1. POST   /notes/{id}/photos/uploads/        en-tête Upload-Length -> Location
+    # 2. HEAD   /notes/{id}/photos/uploads/{uid}/  -> Upload-Offset courant
+    # 3. PATCH  /notes/{id}/photos/uploads/{uid}/  en-tête Upload-Offset, corps brut
+    #    La photo est créée à la réception du dernier morceau.
+    TUS_VERSION = '1.0.0'
+
+    def tus_headers(self, response, upload=None):
+        """Ajoute les en-têtes du protocole à une réponse."""
+        response['Tus-Resumable'] = self.TUS_VERSION
+        response['Cache-Control'] = 'no-store'
+        if upload is not None:
+            response['Upload-Offset'] = str(upload.offset)
+            response['Upload-Length'] = str(upload.length)
+        return response
+
+    def parse_upload_metadata(self, request):
+        """
+        Lit les métadonnées de l'upload : en-tête tus Upload-Metadata
+        (paires « clé valeur_base64 » séparées par des virgules) ou corps de la requête.
+        """
+        metadata = {}
+        for pair in request.META.get('HTTP_UPLOAD_METADATA', '').split(','):
+            key, _, value = pair.strip().partition(' ')
+            if not key:
+                continue
+            try:
+                metadata[key] = base64.b64decode(value).decode('utf-8') if value else ''
+            except (ValueError, UnicodeDecodeError):
+                continue
+
+        if hasattr(request.data, 'get'):
+            for key in ('filename', 'caption'):
+                if request.data.get(key) and key not in metadata:
+                    metadata[key] = request.data.get(key)
+        return metadata
+
+    def get_upload(self, request, upload_id):
+        """Récupère un upload en cours de l'utilisateur pour la note de l'URL."""
+        return get_object_or_404(
+            PhotoUpload,
+            id=upload_id,
+            note_id=self.kwargs.get('note_pk'),
+            user=request.user
+        )
 
-            if user.storage_used + round(estimated_size_mb) > user.storage_quota:
-                raise ValidationError({
-                    'image': f"Quota de stockage dépassé. Vous avez utilisé {user.storage_used}MB sur {user.storage_quota}MB."
-                })
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def create_upload(self, request, note_pk=None):
+        """Ouvre un upload reprenable après vérification des droits et du quota."""
+        note = get_object_or_404(GeoNote, pk=note_pk)
+        user = request.user
+        self.check_note_access(note, user)
+
+        try:
+            length = int(request.META.get('HTTP_UPLOAD_LENGTH') or request.data.get('length'))
+        except (TypeError, ValueError):
+            return self.tus_headers(Response(
+                {'detail': 'En-tête Upload-Length manquant ou invalide.'},
+                status=status.HTTP_400_BAD_REQUEST
+            ))
+
+        if length <= 0 or length > settings.PHOTO_UPLOAD_MAX_LENGTH:
+            return self.tus_headers(Response(
+                {'detail': f'La taille doit être comprise entre 1 et {settings.PHOTO_UPLOAD_MAX_LENGTH} octets.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            ))
+
+        # La taille finale (après compression) sera inférieure : contrôle prudent, l'admission
+        # atomique dans le quota a lieu à la création de la photo
+        if not user.has_storage_for(length):
+            raise ValidationError({
+                'image': f"Quota de stockage dépassé. Vous avez utilisé {user.storage_used}MB sur {user.storage_quota}MB."
+            })
+
+        metadata = self.parse_upload_metadata(request)
+        upload = PhotoUpload.objects.create(
+            note=note,
+            user=user,
+            length=length,
+            filename=metadata.get('filename', '')[:255],
+            caption=metadata.get('caption', '')[:200]
+        )
+
+        response = Response({'id': str(upload.id)}, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{upload.id}/')
+        return self.tus_headers(response, upload)
+
+    @action(
+        detail=False,
+        methods=['head', 'get', 'patch', 'delete'],
+        url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)'
+    )
+    def upload(self, request, note_pk=None, upload_id=None):
+        """Consulte, complète ou abandonne un upload reprenable."""
+        if request.method in ('HEAD', 'GET'):
+            upload = self.get_upload(request, upload_id)
+            return self.tus_headers(Response({'offset': upload.offset, 'length': upload.length}), upload)
+
+        if request.method == 'DELETE':
+            self.get_upload(request, upload_id).discard()
+            return self.tus_headers(Response(status=status.HTTP_204_NO_CONTENT))
+
+        if request.content_type != 'application/offset+octet-stream':
+            return self.tus_headers(Response(
+                {'detail': 'Content-Type attendu : application/offset+octet-stream.'},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            ))
+
+        upload = self.get_upload(request, upload_id)
+        try:
+            client_offset = int(request.META.get('HTTP_UPLOAD_OFFSET'))
+        except (TypeError, ValueError):
+            return self.tus_headers(Response(
+                {'detail': 'En-tête Upload-Offset manquant ou invalide.'},
+                status=status.HTTP_400_BAD_REQUEST
+            ), upload)
+
+        if client_offset != upload.offset:
+            return self.tus_headers(Response(
+                {'detail': 'Décalage incohérent, reprendre depuis Upload-Offset.'},
+                status=status.HTTP_409_CONFLICT
+            ), upload)
+
+        # Le corps est reçu sans verrou ; seul l'ajout au fichier temporaire est sérialisé
+        try:
+            chunk_path, written = upload.stage(request.stream or BytesIO())
+        except DjangoValidationError as e:
+            return self.tus_headers(Response(
+                {'detail': ' '.join(e.messages)},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            ), upload)
+
+        try:
+            with transaction.atomic():
+                upload = get_object_or_404(
+                    PhotoUpload.objects.select_for_update(),
+                    id=upload_id,
+                    note_id=note_pk,
+                    user=request.user
+                )
+                # Un morceau concurrent a été ajouté pendant la réception de celui-ci
+                if upload.offset != client_offset:
+                    return self.tus_headers(Response(
+                        {'detail': 'Décalage incohérent, reprendre depuis Upload-Offset.'},
+                        status=status.HTTP_409_CONFLICT
+                    ), upload)
+                # Seule la requête qui reçoit le dernier octet crée la photo
+                completes = not upload.is_complete
+                upload.commit(chunk_path, written)
+        finally:
+            try:
+                os.remove(chunk_path)
+            except FileNotFoundError:
+                pass
+
+        if not (completes and upload.is_complete):
+            return self.tus_headers(Response(status=status.HTTP_204_NO_CONTENT), upload)
+
+        return self.tus_headers(self.complete_upload(upload), upload)
+
+    def complete_upload(self, upload):
+        """Décode l'image reçue une seule fois et crée la NotePhoto avec contrôle du quota."""
+        ext = os.path.splitext(upload.filename)[1].lstrip('.').lower() or 'jpg'
+        try:
+            with open(upload.temp_path, 'rb') as part:
+                image = compress_image(part, ext, f"{upload.id}.{ext}")
+        except (OSError, Image.DecompressionBombError) as e:
+            upload.discard()
+            return Response(
+                {'image': f"Image invalide : {str(e)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = self.get_serializer(data={
+            'note': upload.note_id,
+            'user': upload.user_id,
+            'image': image,
+            'caption': upload.caption
+        })
+        if not serializer.is_valid():
+            upload.discard()
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                self.perform_create(serializer)
+                upload.discard()
+        except ValidationError as e:
+            # Quota dépassé : la transaction est annulée, l'upload ne pourra pas aboutir
+            upload.discard()
+            return Response(e.detail, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except PermissionDenied:
+            upload.discard()
+            raise
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class StorageUsageViewSet(viewsets.ViewSet):
+    """ViewSet pour la consultation du stockage utilisé par entreprise."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_tenant_members(self, entreprise):
+        """Filtre des utilisateurs rattachés à une entreprise (elle-même, ses salariés et leurs visiteurs)."""
+        return Q(pk=entreprise) | Q(entreprise=entreprise) | Q(salarie__entreprise=entreprise)
+
+    def list(self, request):
+        """
+        Retourne le stockage utilisé à partir des compteurs en base, sans parcourir les fichiers :
+        - Admin : toutes les entreprises
+        - Entreprise : la sienne, détaillée par utilisateur
+        - Salarié / Visiteur : son propre stockage
+        """
+        user = request.user
+
+        if user.role not in [ROLE_ADMIN, ROLE_USINE]:
+            return Response({
+                'user': user.id,
+                'storage_used_bytes': user.storage_used_bytes,
+                'storage_used': user.storage_used,
+                'storage_quota': user.storage_quota,
+            })
+
+        entreprises = User.objects.filter(role=ROLE_USINE)
+        if user.role == ROLE_USINE:
+            entreprises = entreprises.filter(pk=user.pk)
+            totals = {
+                user.pk: User.objects.filter(self.get_tenant_members(user.pk)).aggregate(
+                    total=Sum('storage_used_bytes')
+                )['total']
+            }
+        else:
+            # Somme des compteurs par entreprise de rattachement (salarié, visiteur via son salarié), en une requête
+            totals = dict(
+                User.objects.order_by().annotate(
+                    tenant=Coalesce('salarie__entreprise', 'entreprise', 'pk')
+                ).values('tenant').annotate(total=Sum('storage_used_bytes')).values_list('tenant', 'total')
+            )
+
+        entreprises = [
+            dict(entreprise, tenant_bytes=totals.get(entreprise['id']) or 0)
+            for entreprise in entreprises.values('id', 'company_name')
+        ]
+
+        results = [
+            {
+                'entreprise': entreprise['id'],
+                'company_name': entreprise['company_name'],
+                'storage_used_bytes': entreprise['tenant_bytes'],
+                'storage_used': -(-entreprise['tenant_bytes'] // MEGABYTE),
+            }
+            for entreprise in entreprises
+        ]
+
+        if user.role == ROLE_USINE and results:
+            results[0]['users'] = list(
+                User.objects.filter(self.get_tenant_members(user.pk)).values(
+                    'id', 'username', 'role', 'storage_used_bytes', 'storage_quota'
+                ).order_by('-storage_used_bytes')
+            )
+
+        return Response(results)
+
+
+class EchoBuffer:
+    """Pseudo-fichier pour csv.writer : chaque ligne écrite est renvoyée telle quelle (réponses diffusées)."""
+
+    def write(self, value):
+        return value
 
-        serializer.save(user=user)
 
 class WeatherViewSet(viewsets.ViewSet):
     """ViewSet pour la gestion des données météo."""
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = WeatherDataSerializer
 
-    # URL de base de l'API Ecowitt
-    ECOWITT_BASE_URL = 'https://api.ecowitt.net/api/v3'
+    # URL de base de l'API Ecowitt (surchargeable pour le serveur Ecowitt local de test)
+    ECOWITT_BASE_URL = settings.ECOWITT_BASE_URL
 
     def get_serializer_class(self):
         """Retourne le sérialiseur approprié en fonction de l'action."""
@@ -920,16 +1509,6 @@ class WeatherViewSet(viewsets.ViewSet):
             return WeatherChartDataSerializer
         return WeatherDataSerializer
         
-    def log_api_response(self, endpoint, response, error=False):
-        """Enregistre les réponses de l'API dans les logs."""
-        try:
-            if error:
-                logger.error(f"Ecowitt API {endpoint} error: {response.status_code}, {response.text}")
-            else:
-                logger.debug(f"Ecowitt API {endpoint} response: {response.status_code}")
-        except Exception as e:
-            logger.error(f"Error logging API response: {str(e)}")
-
     def get_ecowitt_config(self):
         """Récupère la configuration Ecowitt pour l'utilisateur actuel."""
         user = self.request.user
@@ -1012,39 +1591,20 @@ class WeatherViewSet(viewsets.ViewSet):
             if not config:
                 return [None, error_message]
 
-            api_url = f"{config['base_url']}/device/list"
-            params = {
-                'application_key': config['application_key'],
-                'api_key': config['api_key'],
-            }
-
-            response = requests.get(api_url, params=params)
-
-            if response.status_code != 200:
-                self.log_api_response('get_devices', response, error=True)
-                return None
-
-            data = response.json()
-            if data.get('code') != 0:
-                self.log_api_response('get_devices', response, error=True)
+            try:
+                data = EcowittClient.from_config(config).device_list()
+            except EcowittError:
                 return None
 
-            self.log_api_response('get_devices', response)
+            devices = extract_devices(data)
 
-            # Récupérer la liste des appareils depuis la réponse
-            # La liste peut être soit directement dans data['devices'], soit dans data['list']
-            devices = []
-            if 'devices' in data.get('data', {}):
-                devices = data['data']['devices']
-            elif 'list' in data.get('data', {}):
-                devices = data['data']['list']
-            
             # S'assurer que tous les appareils ont un identifiant (mac ou imei)
             for device in devices:
                 # Si l'appareil n'a pas de MAC, utiliser l'IMEI comme identifiant primaire pour le frontend
                 if not device.get('mac') and device.get('imei'):
                     device['mac'] = device['imei']
 
+            register_stations(account_key(config['api_key']), devices)
             return devices
 
         except Exception as e:
@@ -1124,33 +1684,12 @@ class WeatherViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Appel à l'API Ecowitt pour les données en temps réel
-            api_url = f"{config['base_url']}/device/real_time"  # Endpoint real_time
-            
-            # Déterminer s'il s'agit d'un MAC ou d'un IMEI
-            param_key = 'mac' if ':' in device_id else 'imei'
-            
-            params = {
-                'application_key': config['application_key'],
-                'api_key': config['api_key'],
-                param_key: device_id,
-                'call_back': 'all'
-            }
-
-            response = requests.get(api_url, params=params)
-
-            if response.status_code != 200:
-                self.log_api_response('list', response, error=True)
-                return Response(
-                    {'error': 'Erreur lors de la récupération des données météo'},
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE
-                )
-
-            data = response.json()
-            if data.get('code') != 0:
-                self.log_api_response('list', response, error=True)
+            # Relevé maintenu par le poller (poll_weather), appel Ecowitt seulement s'il est trop ancien
+            try:
+                data = get_realtime(EcowittClient.from_config(config), device_id)
+            except EcowittError as e:
                 return Response(
-                    {'error': data.get('msg', 'Erreur inconnue')},
+                    {'error': e.upstream_message or 'Erreur lors de la récupération des données météo'},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
 
@@ -1163,6 +1702,285 @@ class WeatherViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'], url_path='all')
+    def all_devices(self, request):
+        """
+        Relevés temps réel de tous les appareils de l'entreprise, récupérés en parallèle
+        et normalisés en unités métriques.
+        """
+        config, error_message = self.get_ecowitt_config()
+        if not config:
+            return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+        devices = self.get_devices()
+        if devices is None:
+            return Response(
+                {'error': 'Erreur lors de la récupération des appareils'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        devices = [device for device in devices if device.get('mac') or device.get('imei')]
+        readings = get_realtime_many(
+            EcowittClient.from_config(config),
+            [device.get('mac') or device.get('imei') for device in devices]
+        )
+
+        results = []
+        for device in devices:
+            device_id = device.get('mac') or device.get('imei')
+            reading = readings.get(device_id)
+            entry = {
+                'device_id': device_id,
+                'name': device.get('name'),
+                'latitude': device.get('latitude'),
+                'longitude': device.get('longitude'),
+            }
+            if isinstance(reading, EcowittError):
+                entry['error'] = reading.upstream_message or 'Erreur lors de la récupération des données météo'
+            else:
+                entry.update({
+                    'fetched_at': reading.get('fetched_at'),
+                    'age': reading.get('age'),
+                    'stale': bool(reading.get('stale')),
+                    'readings': parse_realtime(reading.get('data') or {}),
+                })
+            results.append(entry)
+
+        return Response({'count': len(results), 'devices': results})
+
+    def unknown_devices(self, config, device_ids):
+        """
+        Appareils n'appartenant pas au compte Ecowitt configuré. Le registre des stations
+        est rafraîchi une fois si un appareil y est inconnu (appareil ajouté récemment).
+        """
+        account = account_key(config['api_key'])
+
+        def known():
+            return set(
+                WeatherStation.objects.filter(account=account, device_id__in=device_ids)
+                .values_list('device_id', flat=True)
+            )
+
+        registered = known()
+        if len(registered) < len(set(device_ids)):
+            self.get_devices()
+            registered = known()
+        return [device_id for device_id in device_ids if device_id not in registered]
+
+    @action(detail=False, methods=['get'])
+    def rollups(self, request):
+        """
+        Indicateurs agronomiques d'un appareil (ET0 FAO-56, pluie, degrés-jours),
+        par jour ou par semaine, calculés depuis les observations locales.
+        """
+        device_id = request.query_params.get('mac')
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        period = request.query_params.get('period', 'day')
+
+        if not device_id or not start_date or not end_date:
+            return Response(
+                {'error': "Les paramètres mac, start_date et end_date sont obligatoires"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if period not in ('day', 'week'):
+            return Response(
+                {'error': 'Période invalide. Valeurs acceptées: day, week'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            gdd_base = float(request.query_params.get('gdd_base', settings.WEATHER_GDD_BASE))
+            range_error = self.validate_history_range(start_date, end_date, '30min')
+        except ValueError:
+            return Response(
+                {'error': 'Format de date incorrect. Utilisez le format YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if range_error:
+            return Response({'error': range_error}, status=status.HTTP_400_BAD_REQUEST)
+
+        config, error_message = self.get_ecowitt_config()
+        if not config:
+            return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Les agrégats sont lus en base : vérifier que l'appareil appartient au compte
+        if self.unknown_devices(config, [device_id]):
+            return Response({'error': 'Appareil introuvable'}, status=status.HTTP_404_NOT_FOUND)
+
+        start, end = day_bounds(start_date, end_date)
+        try:
+            sync_range(EcowittClient.from_config(config), device_id, '30min', start, end)
+        except EcowittError as e:
+            logger.warning(f"Agrégats météo {device_id}: synchronisation impossible ({e}), données locales utilisées")
+
+        # Incrémental : seuls les jours observés sans agrégat complet, et le jour en cours,
+        # sont recalculés, dans la limite de la plage demandée
+        first_day, last_day = start.date(), end.date()
+        pending = pending_rollup_days(device_id, first_day, last_day)
+        if pending:
+            update_rollups(device_id, since=pending[0], until=last_day)
+        elif last_day >= timezone.localdate():
+            update_rollups(device_id, since=max(first_day, timezone.localdate()), until=last_day)
+
+        rollups = list(
+            WeatherDailyRollup.objects.filter(device_id=device_id, date__range=(first_day, last_day))
+            .order_by('date')
+            .values('date', 'complete', 't_min', 't_max', 't_mean', 'rain', 'et0', 'gdd')
+        )
+        if gdd_base != settings.WEATHER_GDD_BASE and rollups:
+            t_min = np.array([row['t_min'] for row in rollups], dtype=np.float64)
+            t_max = np.array([row['t_max'] for row in rollups], dtype=np.float64)
+            for row, gdd in zip(rollups, growing_degree_days(t_min, t_max, gdd_base).tolist()):
+                row['gdd'] = None if np.isnan(gdd) else round(gdd, 3)
+
+        if period == 'week':
+            weeks = {}
+            for row in rollups:
+                week = weeks.setdefault(week_start(row['date']), {
+                    'date': week_start(row['date']), 'days': 0, 'complete': True,
+                    't_min': None, 't_max': None, 'rain': 0.0, 'et0': 0.0, 'gdd': 0.0
+                })
+                week['days'] += 1
+                week['complete'] = week['complete'] and row['complete']
+                if row['t_min'] is not None:
+                    week['t_min'] = row['t_min'] if week['t_min'] is None else min(week['t_min'], row['t_min'])
+                if row['t_max'] is not None:
+                    week['t_max'] = row['t_max'] if week['t_max'] is None else max(week['t_max'], row['t_max'])
+                for key in ('rain', 'et0', 'gdd'):
+                    week[key] += row[key] or 0
+            rollups = list(weeks.values())
+
+        return Response({
+            'device_id': device_id,
+            'period': period,
+            'gdd_base': gdd_base,
+            'results': rollups,
+            'totals': {
+                key: round(sum(row[key] or 0 for row in rollups), 3)
+                for key in ('rain', 'et0', 'gdd')
+            },
+        })
+
+    def get_entreprise(self):
+        """Entreprise dont dépend l'utilisateur (paramètre ?entreprise= pour un administrateur)."""
+        user = self.request.user
+        if user.role == ROLE_ADMIN:
+            entreprise_id = self.request.query_params.get('entreprise')
+            return User.objects.filter(id=entreprise_id, role=ROLE_USINE).first() if entreprise_id else None
+        if user.role == ROLE_USINE:
+            return user
+        if user.role == ROLE_DEALER:
+            return user.entreprise
+        if user.role == ROLE_AGRICULTEUR and user.salarie:
+            return user.salarie.entreprise
+        return None
+
+    @action(detail=False, methods=['get'])
+    def grid(self, request):
+        """
+        Surface interpolée (IDW) d'un indicateur journalier sur les stations de l'entreprise,
+        sur une grille couvrant l'emprise de ses plans (cellules hors plans à null).
+        Paramètres : variable (rain, et0, t_min, t_max, t_mean, gdd), date (YYYY-MM-DD, défaut : aujourd'hui).
+        """
+        variable = request.query_params.get('variable', 'rain')
+        if variable not in GRID_VARIABLES:
+            return Response(
+                {'error': f'Variable invalide. Valeurs acceptées: {", ".join(GRID_VARIABLES)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            day = datetime.strptime(request.query_params['date'], '%Y-%m-%d').date() \
+                if request.query_params.get('date') else timezone.localdate()
+        except ValueError:
+            return Response(
+                {'error': 'Format de date incorrect. Utilisez le format YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        entreprise = self.get_entreprise()
+        if entreprise is None or not entreprise.ecowitt_api_key:
+            return Response(
+                {'error': "L'entreprise n'a pas configuré ses clés API Ecowitt."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stations = {
+            station.device_id: station
+            for station in WeatherStation.objects.filter(
+                account=account_key(entreprise.ecowitt_api_key), location__isnull=False
+            )
+        }
+        rollups = list(
+            WeatherDailyRollup.objects.filter(device_id__in=stations, date=day)
+            .exclude(**{f'{variable}__isnull': True})
+            .values_list('device_id', variable, 'computed_at')
+        )
+        plans = Plan.objects.filter(Q(entreprise=entreprise) | Q(salarie__entreprise=entreprise)).distinct()
+
+        # Recalcul uniquement si de nouveaux agrégats ou des plans modifiés sont apparus
+        version = max([row[2] for row in rollups], default=None), plans.aggregate(last=Max('date_modification'))['last']
+        cache_key = 'weather-grid:' + hashlib.sha256(
+            f'{entreprise.id}:{variable}:{day}:{version}'.encode()
+        ).hexdigest()
+        payload = cache.get(cache_key)
+        if payload is not None:
+            return Response(payload)
+
+        boxes = [extent for extent in (plan.extent() for plan in plans) if extent]
+        if not rollups or not boxes:
+            return Response({'error': 'Aucune donnée à interpoler'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Emprise des plans élargie d'une marge, stations comprises
+        xs = [stations[device_id].location.x for device_id, value, computed_at in rollups]
+        ys = [stations[device_id].location.y for device_id, value, computed_at in rollups]
+        values = [value for device_id, value, computed_at in rollups]
+        xmin, ymin = min(box[0] for box in boxes), min(box[1] for box in boxes)
+        xmax, ymax = max(box[2] for box in boxes), max(box[3] for box in boxes)
+        margin = max(xmax - xmin, ymax - ymin) * 0.05 or 0.001
+        bbox = (xmin - margin, ymin - margin, xmax + margin, ymax + margin)
+
+        width, height = grid_shape(bbox, settings.WEATHER_GRID_MAX_CELLS)
+        grid = idw_grid(xs, ys, values, bbox, width, height, settings.WEATHER_IDW_POWER, boxes)
+        finite = grid[np.isfinite(grid)]
+
+        payload = {
+            'variable': variable,
+            'date': day.isoformat(),
+            'bbox': bbox,
+            'width': width,
+            'height': height,
+            'min': round(float(finite.min()), 2) if finite.size else None,
+            'max': round(float(finite.max()), 2) if finite.size else None,
+            # Ligne par ligne depuis le nord, null hors des plans
+            'values': [None if np.isnan(value) else round(value, 2) for value in grid.ravel().tolist()],
+            'stations': [
+                {'device_id': device_id, 'name': stations[device_id].name, 'value': value}
+                for device_id, value, computed_at in rollups
+            ],
+        }
+        cache.set(cache_key, payload, settings.WEATHER_GRID_CACHE_TTL)
+        return Response(payload)
+
+    def validate_history_range(self, start_date, end_date, cycle_type):
+        """
+        Vérifie le cycle et la plage d'un historique. Les plages dépassant la limite
+        Ecowitt du cycle sont découpées en fenêtres ; seul leur nombre est borné.
+        Retourne un message d'erreur ou None.
+        """
+        if cycle_type not in HISTORY_WINDOW_DAYS:
+            return f'Type de cycle invalide. Valeurs acceptées: {", ".join(HISTORY_WINDOW_DAYS)}'
+
+        start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+        end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+        if end_dt < start_dt:
+            return 'La date de fin doit être postérieure à la date de début'
+
+        window_days = HISTORY_WINDOW_DAYS[cycle_type]
+        max_days = window_days * settings.WEATHER_HISTORY_MAX_WINDOWS
+        if (end_dt - start_dt).days + 1 > max_days:
+            return f'Pour le cycle {cycle_type}, la plage ne doit pas dépasser {max_days} jours'
+        return None
+
     @action(detail=False, methods=['get'])
     def history(self, request):
         """Récupère les données historiques pour un appareil spécifique."""
@@ -1196,33 +2014,10 @@ class WeatherViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Valider le type de cycle et vérifier que la plage de dates est conforme
-            now = datetime.now()
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d')
-            date_diff = (end_dt - start_dt).days + 1
-
-            # Règles selon la documentation Ecowitt
-            if cycle_type == '5min' and date_diff > 1:
-                return Response(
-                    {'error': 'Pour le cycle 5min, la plage ne doit pas dépasser 1 jour'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            elif cycle_type == '30min' and date_diff > 7:
-                return Response(
-                    {'error': 'Pour le cycle 30min, la plage ne doit pas dépasser 7 jours'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            elif cycle_type == '4hour' and date_diff > 31:
-                return Response(
-                    {'error': 'Pour le cycle 4hour, la plage ne doit pas dépasser 31 jours'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            elif cycle_type == '1day' and date_diff > 365:
-                return Response(
-                    {'error': 'Pour le cycle 1day, la plage ne doit pas dépasser 365 jours'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            # Valider le type de cycle et la plage (découpée en fenêtres Ecowitt si nécessaire)
+            range_error = self.validate_history_range(start_date, end_date, cycle_type)
+            if range_error:
+                return Response({'error': range_error}, status=status.HTTP_400_BAD_REQUEST)
 
             config, error_message = self.get_ecowitt_config()
 
@@ -1233,38 +2028,18 @@ class WeatherViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Appel à l'API Ecowitt pour les données historiques
-            api_url = f"{config['base_url']}/device/history"
-
-            # Déterminer s'il s'agit d'un MAC ou d'un IMEI
-            param_key = 'mac' if ':' in device_id else 'imei'
-
-            # Paramètres conformes à la documentation Ecowitt
-            # call_back doit être spécifique (outdoor, indoor, etc.) et non 'all'
-            params = {
-                'application_key': config['application_key'],
-                'api_key': config['api_key'],
-                param_key: device_id,
-                'start_date': f"{start_date} 00:00:00",  # Format ISO8601 requis
-                'end_date': f"{end_date} 23:59:59",      # Format ISO8601 requis
-                'cycle_type': cycle_type,
-                'call_back': 'outdoor,indoor,pressure,wind,rainfall,solar_and_uvi,battery'  # Valeurs spécifiques au lieu de 'all'
-            }
-
-            response = requests.get(api_url, params=params)
-
-            if response.status_code != 200:
-                self.log_api_response('history', response, error=True)
-                return Response(
-                    {'error': 'Erreur lors de la récupération des données historiques'},
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE
-                )
+            # Les observations locales ne sont indexées que par appareil : vérifier qu'il appartient au compte
+            if self.unknown_devices(config, [device_id]):
+                return Response({'error': 'Appareil introuvable'}, status=status.HTTP_404_NOT_FOUND)
 
-            data = response.json()
-            if data.get('code') != 0:
-                self.log_api_response('history', response, error=True)
+            # Historique servi depuis le stockage local, seules les portions manquantes
+            # sont demandées à Ecowitt (voir api/weather_store.py)
+            start, end = day_bounds(start_date, end_date)
+            try:
+                data = get_history(EcowittClient.from_config(config), device_id, cycle_type, start, end)
+            except EcowittError as e:
                 return Response(
-                    {'error': data.get('msg', 'Erreur inconnue')},
+                    {'error': e.upstream_message or 'Erreur lors de la récupération des données historiques'},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
 
@@ -1277,6 +2052,135 @@ class WeatherViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def compare(self, request):
+        """
+        Compare plusieurs appareils sur une grille temporelle commune : les séries sont
+        rééchantillonnées côté serveur (pluie sommée, températures moyennées) et renvoyées
+        en colonnes alignées sur un même tableau d'horodatages.
+        """
+        device_ids = [mac.strip() for mac in request.query_params.get('macs', '').split(',') if mac.strip()]
+        device_ids = list(dict.fromkeys(device_ids))
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        resolution = request.query_params.get('resolution', '1hour')
+        fields = [name.strip() for name in request.query_params.get('fields', 'temperature,rain').split(',') if name.strip()]
+
+        if not device_ids or not start_date or not end_date:
+            return Response(
+                {'error': "Les paramètres macs, start_date et end_date sont obligatoires"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(device_ids) > settings.WEATHER_COMPARE_MAX_DEVICES:
+            return Response(
+                {'error': f'Au plus {settings.WEATHER_COMPARE_MAX_DEVICES} appareils peuvent être comparés'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if resolution not in COMPARE_STEPS:
+            return Response(
+                {'error': f'Résolution invalide. Valeurs acceptées: {", ".join(COMPARE_STEPS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        unknown = [name for name in fields if name not in COMPARE_FIELDS]
+        if not fields or unknown:
+            return Response(
+                {'error': f'Grandeur invalide. Valeurs acceptées: {", ".join(COMPARE_FIELDS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        source_resolution = compare_source_resolution(resolution)
+        try:
+            range_error = self.validate_history_range(start_date, end_date, source_resolution)
+        except ValueError:
+            return Response(
+                {'error': 'Format de date incorrect. Utilisez le format YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if range_error:
+            return Response({'error': range_error}, status=status.HTTP_400_BAD_REQUEST)
+
+        config, error_message = self.get_ecowitt_config()
+        if not config:
+            return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Les séries sont lues en base : vérifier que les appareils appartiennent au compte
+        missing = self.unknown_devices(config, device_ids)
+        if missing:
+            return Response(
+                {'error': f'Appareil(s) introuvable(s) : {", ".join(missing)}'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        start, end = day_bounds(start_date, end_date)
+        client = EcowittClient.from_config(config)
+        stale = []
+        for device_id in device_ids:
+            try:
+                if not sync_range(client, device_id, source_resolution, start, end):
+                    stale.append(device_id)
+            except EcowittError as e:
+                logger.warning(f"Comparaison météo {device_id}: synchronisation impossible ({e}), données locales utilisées")
+                stale.append(device_id)
+
+        payload = compare_series(device_ids, resolution, start, end, fields)
+        payload['stale'] = stale
+        return Response(payload)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Export CSV de l'historique brut d'un appareil (unités métriques), diffusé ligne
+        par ligne : plages pluriannuelles possibles sans charger la série en mémoire.
+        """
+        device_id = request.query_params.get('mac')
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        cycle_type = request.query_params.get('cycle_type', '30min')
+
+        if not device_id or not start_date or not end_date:
+            return Response(
+                {'error': "Les paramètres mac, start_date et end_date sont obligatoires"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if cycle_type not in HISTORY_WINDOW_DAYS:
+            return Response(
+                {'error': f'Type de cycle invalide. Valeurs acceptées: {", ".join(HISTORY_WINDOW_DAYS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            start, end = day_bounds(start_date, end_date)
+        except ValueError:
+            return Response(
+                {'error': 'Format de date incorrect. Utilisez le format YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if end < start:
+            return Response(
+                {'error': 'La date de fin doit être postérieure à la date de début'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (end - start).days + 1 > settings.WEATHER_EXPORT_MAX_DAYS:
+            return Response(
+                {'error': f"La plage d'export ne doit pas dépasser {settings.WEATHER_EXPORT_MAX_DAYS} jours"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        config, error_message = self.get_ecowitt_config()
+        if not config:
+            return Response({'error': error_message}, status=status.HTTP_400_BAD_REQUEST)
+        if self.unknown_devices(config, [device_id]):
+            return Response({'error': 'Appareil introuvable'}, status=status.HTTP_404_NOT_FOUND)
+
+        writer = csv.writer(EchoBuffer(), delimiter=';')
+        rows = itertools.chain(
+            [export_header()],
+            iter_export_rows(EcowittClient.from_config(config), device_id, cycle_type, start, end)
+        )
+        response = StreamingHttpResponse((writer.writerow(row) for row in rows), content_type='text/csv; charset=utf-8')
+        safe_device = device_id.replace(':', '')
+        response['Content-Disposition'] = f'attachment; filename="meteo-{safe_device}-{start_date}-{end_date}.csv"'
+        return response
+
     @action(detail=False, methods=['get'])
     def chart(self, request):
         """Récupère les données pour générer des graphiques."""
@@ -1327,12 +2231,16 @@ class WeatherViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            # Les observations locales ne sont indexées que par appareil : vérifier qu'il appartient au compte
+            if self.unknown_devices(config, [device_id]):
+                return Response({'error': 'Appareil introuvable'}, status=status.HTTP_404_NOT_FOUND)
+
             # Mapper les types de données de notre API vers les chemins d'API Ecowitt
             data_type_mapping = {
                 'temp': 'outdoor.temperature',
                 'humidity': 'outdoor.humidity',
                 'pressure': 'pressure.absolute',
-                'wind': 'wind.wind_speed',
+                'wind': 'wind.wind_speed,wind.wind_gust',
                 'rain': 'rainfall.daily',
                 'solar': 'solar_and_uvi.solar'
             }
@@ -1347,39 +2255,33 @@ class WeatherViewSet(viewsets.ViewSet):
             # Convertir le type de données en chemin complet pour l'API Ecowitt
             call_back = data_type_mapping[data_type]
 
-            # Déterminer s'il s'agit d'un MAC ou d'un IMEI
-            param_key = 'mac' if ':' in device_id else 'imei'
-
-            api_url = f"{config['base_url']}/device/history"
-            params = {
-                'application_key': config['application_key'],
-                'api_key': config['api_key'],
-                param_key: device_id,
-                'start_date': f"{start_date} 00:00:00",
-                'end_date': f"{end_date} 23:59:59",
-                'cycle_type': cycle_type,
-                'call_back': call_back
-            }
-
-            response = requests.get(api_url, params=params)
-
-            if response.status_code != 200:
-                self.log_api_response('chart', response, error=True)
+            # Nombre maximal de points par série (réduction LTTB, 0 pour tout renvoyer)
+            try:
+                max_points = int(request.query_params.get('max_points', settings.WEATHER_CHART_MAX_POINTS))
+            except ValueError:
+                max_points = -1
+            if max_points < 0 or 0 < max_points < 3:
                 return Response(
-                    {'error': 'Erreur lors de la récupération des données'},
-                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                    {'error': 'max_points doit être 0 (pas de réduction) ou un entier supérieur ou égal à 3'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
 
-            data = response.json()
-            if data.get('code') != 0:
-                self.log_api_response('chart', response, error=True)
+            range_error = self.validate_history_range(start_date, end_date, cycle_type)
+            if range_error:
+                return Response({'error': range_error}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Mêmes observations locales que l'historique, filtrées sur la série demandée
+            start, end = day_bounds(start_date, end_date)
+            try:
+                data = get_history(EcowittClient.from_config(config), device_id, cycle_type, start, end, call_back)
+            except EcowittError as e:
                 return Response(
-                    {'error': data.get('msg', 'Erreur inconnue')},
+                    {'error': e.upstream_message or 'Erreur lors de la récupération des données'},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
 
             # Traiter les données pour le graphique
-            chart_data = self.format_chart_data(data.get('data', {}), data_type)
+            chart_data = self.format_chart_data(data.get('data', {}), data_type, max_points)
             return Response(chart_data)
 
         except Exception as e:
@@ -1389,8 +2291,43 @@ class WeatherViewSet(viewsets.ViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def format_chart_data(self, data, data_type):
-        """Transforme les données brutes en format adapté aux graphiques."""
+    # Séries tracées par type de graphique :
+    # (groupe Ecowitt, champ, libellé, couleur, couleur de fond, conversion vectorisée vers le métrique)
+    CHART_SERIES = {
+        'temp': [
+            ('outdoor', 'temperature', 'Température extérieure', '#FF6384', 'rgba(255, 99, 132, 0.2)', fahrenheit_to_celsius),
+        ],
+        'humidity': [
+            ('outdoor', 'humidity', 'Humidité extérieure', '#36A2EB', 'rgba(54, 162, 235, 0.2)', identity),
+        ],
+        'pressure': [
+            ('pressure', 'absolute', 'Pression absolue', '#4BC0C0', 'rgba(75, 192, 192, 0.2)', lambda x: x * INHG_TO_HPA),
+        ],
+        'wind': [
+            ('wind', 'wind_speed', 'Vitesse du vent', '#FFCE56', 'rgba(255, 206, 86, 0.2)', lambda x: x * MPH_TO_KMH),
+            ('wind', 'wind_gust', 'Rafales', '#FF9F40', 'rgba(255, 159, 64, 0.2)', lambda x: x * MPH_TO_KMH),
+        ],
+        'rain': [
+            ('rainfall', 'daily', 'Précipitations journalières', '#9966FF', 'rgba(153, 102, 255, 0.2)', lambda x: x * INCH_TO_MM),
+        ],
+        'solar': [
+            ('solar_and_uvi', 'solar', 'Rayonnement solaire', '#FF9F40', 'rgba(255, 159, 64, 0.2)', identity),
+        ],
+    }
+
+    @staticmethod
+    def is_history_data(data):
+        """Vrai si au moins une série contient une liste historique ({'list': {epoch: valeur}})."""
+        return any(
+            isinstance(group, dict) and any(isinstance(series, dict) and 'list' in series for series in group.values())
+            for group in data.values()
+        )
+
+    def format_chart_data(self, data, data_type, max_points=None):
+        """
+        Transforme les données brutes en format adapté aux graphiques.
+        Si `max_points` est fourni, chaque série historique est réduite par LTTB.
+        """
         try:
             result = {
                 'type': data_type,
@@ -1400,73 +2337,29 @@ class WeatherViewSet(viewsets.ViewSet):
 
             # Vérifier si nous avons des données en temps réel (un seul point)
             if isinstance(data, dict) and not isinstance(data, list):
-                # Vérifier si c'est des données historiques au format Ecowitt API v3
-                if data_type in data and isinstance(data[data_type], dict):
-
-                    # Initialiser les configurations de datasets selon le type de données
-                    if data_type == 'temp':
-                        datasets_config = [
-                            {'key': 'temperature', 'subkey': 'list', 'label': 'Température extérieure', 'color': '#FF6384', 'bgColor': 'rgba(255, 99, 132, 0.2)', 'conversion': self.fahrenheit_to_celsius}
-                        ]
-                    elif data_type == 'humidity':
-                        datasets_config = [
-                            {'key': 'humidity', 'subkey': 'list', 'label': 'Humidité extérieure', 'color': '#36A2EB', 'bgColor': 'rgba(54, 162, 235, 0.2)', 'conversion': lambda x: x}
-                        ]
-                    elif data_type == 'pressure':
-                        datasets_config = [
-                            {'key': 'absolute', 'subkey': 'list', 'label': 'Pression absolue', 'color': '#4BC0C0', 'bgColor': 'rgba(75, 192, 192, 0.2)', 'conversion': lambda x: x * 33.8639}  # inHg vers hPa
-                        ]
-                    elif data_type == 'wind':
-                        datasets_config = [
-                            {'key': 'wind_speed', 'subkey': 'list', 'label': 'Vitesse du vent', 'color': '#FFCE56', 'bgColor': 'rgba(255, 206, 86, 0.2)', 'conversion': lambda x: x * 1.60934},  # mph vers km/h
-                            {'key': 'wind_gust', 'subkey': 'list', 'label': 'Rafales', 'color': '#FF9F40', 'bgColor': 'rgba(255, 159, 64, 0.2)', 'conversion': lambda x: x * 1.60934}  # mph vers km/h
-                        ]
-                    elif data_type == 'rain':
-                        datasets_config = [
-                            {'key': 'daily', 'subkey': 'list', 'label': 'Précipitations journalières', 'color': '#9966FF', 'bgColor': 'rgba(153, 102, 255, 0.2)', 'conversion': lambda x: x * 25.4}  # inches vers mm
-                        ]
-                    elif data_type == 'solar':
-                        datasets_config = [
-                            {'key': 'solar', 'subkey': 'list', 'label': 'Rayonnement solaire', 'color': '#FF9F40', 'bgColor': 'rgba(255, 159, 64, 0.2)', 'conversion': lambda x: x}
-                        ]
-                    else:
-                        datasets_config = []
-
-                    # Traiter chaque dataset configuré
-                    for config in datasets_config:
-                        # Vérifier si les données existent pour cette clé
-                        if config['key'] in data[data_type] and config['subkey'] in data[data_type][config['key']]:
-                            # Récupérer les données de la liste
-                            data_list = data[data_type][config['key']][config['subkey']]
-
-                            # Créer un dataset pour cette série
-                            dataset = {
-                                'label': config['label'],
-                                'borderColor': config['color'],
-                                'backgroundColor': config['bgColor'],
-                                'fill': False,
-                                'tension': 0.1,
-                                'data': []
-                            }
-
-                            # Ajouter les points de données (format timestamp: valeur)
-                            for timestamp, value in data_list.items():
-                                try:
-                                    # Convertir la valeur selon la fonction de conversion
-                                    converted_value = config['conversion'](float(value))
-
-                                    # Ajouter le point au dataset (timestamp en ms pour JavaScript)
-                                    dataset['data'].append({
-                                        'x': int(timestamp) * 1000,  # Convertir en millisecondes pour JavaScript
-                                        'y': converted_value
-                                    })
-                                except (ValueError, TypeError) as e:
-                                    pass
-                            dataset['data'].sort(key=lambda point: point['x'])
-
-                            # Si le dataset contient des données, l'ajouter au résultat
-                            if dataset['data']:
-                                result['datasets'].append(dataset)
+                # Vérifier si c'est des données historiques au format Ecowitt API v3 ({groupe: {champ: {'list': ...}}})
+                if self.is_history_data(data):
+                    for group, key, label, color, bg_color, conversion in self.CHART_SERIES.get(data_type, []):
+                        series = data.get(group)
+                        if not isinstance(series, dict) or not isinstance(series.get(key), dict):
+                            continue
+
+                        # Conversion et tri vectorisés (timestamps en ms pour JavaScript)
+                        x, y = series_arrays(series[key].get('list') or {})
+                        if not len(x):
+                            continue
+                        y = conversion(y)
+                        if max_points:
+                            x, y = lttb(x, y, max_points)
+
+                        result['datasets'].append({
+                            'label': label,
+                            'borderColor': color,
+                            'backgroundColor': bg_color,
+                            'fill': False,
+                            'tension': 0.1,
+                            'data': [{'x': px, 'y': py} for px, py in zip(x.tolist(), y.tolist())]
+                        })
 
                 # Données en temps réel
                 else:
@@ -1596,83 +2489,82 @@ class WeatherViewSet(viewsets.ViewSet):
 
             # Données historiques (liste de points - ancien format)
             elif isinstance(data, list):
-            # Extraire les timestamps pour les labels
+                # Extraire les timestamps pour les labels
                 result['labels'] = [item.get('time') for item in data]
 
-            # Formater selon le type de données
-            if data_type == 'temp':
-                result['datasets'].append({
-                    'label': 'Température extérieure',
-                    'data': [self.fahrenheit_to_celsius(float(item.get('outdoor', {}).get('temperature', {}).get('value', 0))) for item in data],
-                    'borderColor': '#FF6384',
-                    'backgroundColor': 'rgba(255, 99, 132, 0.2)',
-                    'fill': False,
-                    'tension': 0.1
-                })
-
-            elif data_type == 'humidity':
-                result['datasets'].append({
-                    'label': 'Humidité extérieure',
-                    'data': [float(item.get('outdoor', {}).get('humidity', {}).get('value', 0)) for item in data],
-                    'borderColor': '#36A2EB',
-                    'backgroundColor': 'rgba(54, 162, 235, 0.2)',
-                    'fill': False,
-                    'tension': 0.1
-                })
-
-            elif data_type == 'pressure':
-                result['datasets'].append({
-                    'label': 'Pression absolue',
-                    'data': [float(item.get('pressure', {}).get('absolute', {}).get('value', 0)) * 33.8639 for item in data],  # Conversion inHg vers hPa
-                    'borderColor': '#4BC0C0',
-                    'backgroundColor': 'rgba(75, 192, 192, 0.2)',
-                    'fill': False,
-                    'tension': 0.1
-                })
-
-            elif data_type == 'wind':
-                # Vitesse du vent
-                result['datasets'].append({
-                    'label': 'Vitesse du vent',
-                    'data': [float(item.get('wind', {}).get('wind_speed', {}).get('value', 0)) * 1.60934 for item in data],  # Conversion mph vers km/h
-                    'borderColor': '#FFCE56',
-                    'backgroundColor': 'rgba(255, 206, 86, 0.2)',
-                    'fill': False,
-                    'tension': 0.1
-                })
-                # Rafales
-                result['datasets'].append({
-                    'label': 'Rafales',
-                    'data': [float(item.get('wind', {}).get('wind_gust', {}).get('value', 0)) * 1.60934 for item in data],  # Conversion mph vers km/h
-                    'borderColor': '#FF9F40',
-                    'backgroundColor': 'rgba(255, 159, 64, 0.2)',
-                    'fill': False,
-                    'tension': 0.1
-                })
-
-            elif data_type == 'rain':
-                result['datasets'].append({
-                    'label': 'Précipitations journalières',
-                    'data': [float(item.get('rainfall', {}).get('daily', {}).get('value', 0)) * 25.4 for item in data],  # Conversion inches vers mm
-                    'borderColor': '#9966FF',
-                    'backgroundColor': 'rgba(153, 102, 255, 0.2)',
-                    'fill': False,
-                    'tension': 0.1
-                })
-
-            elif data_type == 'solar':
-                result['datasets'].append({
-                    'label': 'Rayonnement solaire',
-                    'data': [float(item.get('solar_and_uvi', {}).get('solar', {}).get('value', 0)) for item in data],
+                # Formater selon le type de données
+                if data_type == 'temp':
+                    result['datasets'].append({
+                        'label': 'Température extérieure',
+                        'data': [self.fahrenheit_to_celsius(float(item.get('outdoor', {}).get('temperature', {}).get('value', 0))) for item in data],
+                        'borderColor': '#FF6384',
+                        'backgroundColor': 'rgba(255, 99, 132, 0.2)',
+                        'fill': False,
+                        'tension': 0.1
+                    })
+
+                elif data_type == 'humidity':
+                    result['datasets'].append({
+                        'label': 'Humidité extérieure',
+                        'data': [float(item.get('outdoor', {}).get('humidity', {}).get('value', 0)) for item in data],
+                        'borderColor': '#36A2EB',
+                        'backgroundColor': 'rgba(54, 162, 235, 0.2)',
+                        'fill': False,
+                        'tension': 0.1
+                    })
+
+                elif data_type == 'pressure':
+                    result['datasets'].append({
+                        'label': 'Pression absolue',
+                        'data': [float(item.get('pressure', {}).get('absolute', {}).get('value', 0)) * 33.8639 for item in data],  # Conversion inHg vers hPa
+                        'borderColor': '#4BC0C0',
+                        'backgroundColor': 'rgba(75, 192, 192, 0.2)',
+                        'fill': False,
+                        'tension': 0.1
+                    })
+
+                elif data_type == 'wind':
+                    # Vitesse du vent
+                    result['datasets'].append({
+                        'label': 'Vitesse du vent',
+                        'data': [float(item.get('wind', {}).get('wind_speed', {}).get('value', 0)) * 1.60934 for item in data],  # Conversion mph vers km/h
+                        'borderColor': '#FFCE56',
+                        'backgroundColor': 'rgba(255, 206, 86, 0.2)',
+                        'fill': False,
+                        'tension': 0.1
+                    })
+                    # Rafales
+                    result['datasets'].append({
+                        'label': 'Rafales',
+                        'data': [float(item.get('wind', {}).get('wind_gust', {}).get('value', 0)) * 1.60934 for item in data],  # Conversion mph vers km/h
                         'borderColor': '#FF9F40',
                         'backgroundColor': 'rgba(255, 159, 64, 0.2)',
-                    'fill': False,
-                    'tension': 0.1
-                })
+                        'fill': False,
+                        'tension': 0.1
+                    })
+
+                elif data_type == 'rain':
+                    result['datasets'].append({
+                        'label': 'Précipitations journalières',
+                        'data': [float(item.get('rainfall', {}).get('daily', {}).get('value', 0)) * 25.4 for item in data],  # Conversion inches vers mm
+                        'borderColor': '#9966FF',
+                        'backgroundColor': 'rgba(153, 102, 255, 0.2)',
+                        'fill': False,
+                        'tension': 0.1
+                    })
+
+                elif data_type == 'solar':
+                    result['datasets'].append({
+                        'label': 'Rayonnement solaire',
+                        'data': [float(item.get('solar_and_uvi', {}).get('solar', {}).get('value', 0)) for item in data],
+                        'borderColor': '#FF9F40',
+                        'backgroundColor': 'rgba(255, 159, 64, 0.2)',
+                        'fill': False,
+                        'tension': 0.1
+                    })
             return result
 
         except Exception as e:
-            import traceback
             return {
                 'type': data_type,
                 'labels': [],
@@ -1684,6 +2576,270 @@ class WeatherViewSet(viewsets.ViewSet):
         """Convertit les degrés Fahrenheit en Celsius."""
         return (fahrenheit - 32) * 5/9
 
+class WeatherIngestView(APIView):
+    """
+    Réception des envois directs des passerelles Ecowitt (protocole « customized upload »,
+    formulaire POST). La station est authentifiée par sa PASSKEY.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    parser_classes = [FormParser, MultiPartParser]
+
+    def post(self, request):
+        passkey = (request.data.get('PASSKEY') or '').upper()
+        stations = list(WeatherStation.objects.filter(passkey=passkey)) if passkey else []
+        if not stations:
+            return Response({'error': 'Station inconnue'}, status=status.HTTP_403_FORBIDDEN)
+
+        # Un même appareil peut être rattaché à plusieurs comptes ; une PASSKEY qui désigne
+        # des appareils différents ne permet pas de savoir à qui appartiennent les mesures
+        device_ids = {station.device_id for station in stations}
+        if len(device_ids) > 1:
+            logger.warning(f"Envoi direct refusé : PASSKEY {passkey} partagée par {', '.join(sorted(device_ids))}")
+            return Response({'error': 'PASSKEY ambiguë'}, status=status.HTTP_409_CONFLICT)
+
+        if not ingest_push(stations, request.data):
+            return Response({'error': 'Aucune mesure exploitable'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': 'ok'})
+
+
+class ElevationView(APIView):
+    """
+    Altitudes d'une liste de points depuis les MNT locaux (voir api/elevation.py).
+    Corps : {"points": [{"latitude": …, "longitude": …}]}. Altitude null hors couverture.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        points = request.data.get('points')
+        if not isinstance(points, list) or not points:
+            return Response({'error': 'Le paramètre points est obligatoire'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(points) > settings.DEM_MAX_POINTS:
+            return Response(
+                {'error': f'Au plus {settings.DEM_MAX_POINTS} points par requête'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            latitudes = np.array([float(point['latitude']) for point in points])
+            longitudes = np.array([float(point['longitude']) for point in points])
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'Chaque point doit avoir une latitude et une longitude numériques'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        elevations = sample_elevations(longitudes, latitudes)
+        return Response({
+            'results': [
+                {'latitude': latitude, 'longitude': longitude, 'elevation': None if np.isnan(elevation) else round(elevation, 2)}
+                for latitude, longitude, elevation in zip(latitudes.tolist(), longitudes.tolist(), elevations.tolist())
+            ]
+        })
+
+
+def media_note_ids(path):
+    """
+    Identifiants des notes référençant un fichier média. Non mis en cache : avec la
+    déduplication, un fichier peut être rattaché à une nouvelle note ou détaché à tout moment.
+    """
+    return list(NotePhoto.objects.filter(image=path).values_list('note_id', flat=True).distinct())
+
+
+def can_view_media_notes(user, note_ids):
+    """
+    Vérifie qu'au moins une des notes est visible par l'utilisateur.
+    Le résultat est mis en cache par utilisateur et par note.
+    """
+    if user.role == ROLE_ADMIN:
+        return True
+
+    keys = {note_id: f"media-access:{user.id}:{note_id}" for note_id in note_ids}
+    cached = cache.get_many(keys.values())
+    if any(cached.get(key) for key in keys.values()):
+        return True
+
+    unknown = [note_id for note_id, key in keys.items() if key not in cached]
+    if not unknown:
+        return False
+
+    visible = set(
+        GeoNote.objects.filter(id__in=unknown).filter(
+            photo_notes_filter(user) | Q(createur=user) | Q(photos__user=user)
+        ).values_list('id', flat=True).distinct()
+    )
+    cache.set_many(
+        {keys[note_id]: note_id in visible for note_id in unknown},
+        settings.MEDIA_ACCESS_CACHE_TTL
+    )
+    return bool(visible)
+
+
+def parse_byte_range(header, size):
+    """
+    Analyse un en-tête Range à intervalle unique (« bytes=debut-fin »).
+    Retourne (debut, fin) inclusifs, None si l'en-tête est absent ou ignoré,
+    ou lève ValueError si l'intervalle n'est pas satisfaisable.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start, _, end = header[len('bytes='):].strip().partition('-')
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    else:
+        # Suffixe : les N derniers octets
+        length = int(end)
+        if length <= 0:
+            raise ValueError(header)
+        start, end = max(size - length, 0), size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def iter_file_range(path, start, length, block_size=64 * 1024):
+    """Lit un intervalle de fichier par blocs (mode de service sans serveur frontal)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(block_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def protected_media(request, path):
+    """
+    Sert les fichiers média après contrôle des droits.
+    - notes/ : la photo doit appartenir à une note visible par l'utilisateur
+    - logos/ : tout utilisateur authentifié
+    Le transfert est délégué au serveur frontal (X-Accel-Redirect pour Nginx,
+    X-Sendfile pour Apache/Lighttpd) ; Django ne sert les octets lui-même
+    qu'en l'absence de serveur frontal configuré (développement).
+    """
+    user = get_user_jwt(request, allow_cookie=True) or request.user
+    if not user or not user.is_authenticated:
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    if path.startswith('notes/'):
+        note_ids = media_note_ids(path)
+        if not note_ids:
+            raise Http404
+        if not can_view_media_notes(user, note_ids):
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    elif not path.startswith('logos/'):
+        raise Http404
+
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+
+    # Les photos adressées par contenu ont leur empreinte pour ETag et sont immuables
+    content_addressed = path.startswith('notes/sha256/')
+    if content_addressed:
+        etag = f'"{os.path.splitext(os.path.basename(path))[0]}"'
+        cache_header = f'private, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        cache_header = 'private, max-age=0, must-revalidate'
+    last_modified = http_date(stat.st_mtime)
+
+    # Requêtes conditionnelles
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if (if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]) or \
+            (not if_none_match and if_modified_since and int(stat.st_mtime) <= if_modified_since):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_header
+        return response
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    backend = settings.MEDIA_SENDFILE_BACKEND
+
+    if backend == 'nginx':
+        # Nginx gère lui-même Range et la lecture du fichier
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{settings.MEDIA_ACCEL_REDIRECT_PREFIX}{path}"
+    elif backend in ('apache', 'lighttpd'):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+    else:
+        try:
+            byte_range = parse_byte_range(request.META.get('HTTP_RANGE'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+        # If-Range : ignorer l'intervalle si la ressource a changé
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if byte_range and if_range and if_range not in (etag, last_modified):
+            byte_range = None
+
+        start, end = byte_range or (0, stat.st_size - 1)
+        length = max(end - start + 1, 0)
+        response = StreamingHttpResponse(
+            iter_file_range(full_path, start, length),
+            content_type=content_type,
+            status=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK
+        )
+        response['Content-Length'] = str(length)
+        if byte_range:
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = cache_header
+    return response
+
+
+def tile_proxy(request, tile_type, z, x, y):
+    """
+    Sert une tuile de fond de carte (hybrid, cadastre, ign) depuis le cache disque ou
+    son fournisseur (voir api/tiles.py). Authentification par en-tête ou cookie pour
+    les balises <img> des couches de tuiles.
+    """
+    user = get_user_jwt(request, allow_cookie=True) or request.user
+    if not user or not user.is_authenticated:
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+
+    tile_type = tile_type.lower()
+    if tile_type not in TILE_SOURCES or z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        raise Http404
+
+    try:
+        content = get_tile(tile_type, z, x, y)
+    except TileNotFound:
+        response = HttpResponse(status=status.HTTP_404_NOT_FOUND)
+        response['Cache-Control'] = f'private, max-age={settings.TILE_NEGATIVE_TTL}'
+        return response
+    except TileError as e:
+        logger.warning(str(e))
+        response = HttpResponse(status=status.HTTP_502_BAD_GATEWAY)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    # Tuiles immuables pour une adresse donnée : le navigateur les conserve sans revalidation
+    etag = f'"{hashlib.md5(content).hexdigest()}"'
+    cache_header = f'private, max-age={settings.TILE_BROWSER_MAX_AGE}, immutable'
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=tile_content_type(content))
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_header
+    return response
+
 class NoteColumnViewSet(viewsets.ViewSet):
     """ViewSet pour la gestion des colonnes de notes fixes."""
     permission_classes = [permissions.IsAuthenticated]
@@ -1851,6 +3007,8 @@ class ApplicationSettingViewSet(viewsets.ModelViewSet):
                 'description': 'Clé API Google Maps pour la carte hybride'
             }
         )
+        # Le proxy de tuiles relit la clé au prochain appel
+        cache.delete(GOOGLE_API_KEY_CACHE)
         
         return Response({
             'id': setting.id,
@@ -0,0 +1,893 @@
+"""
+Stockage local des séries météo Ecowitt.
+Les observations sont conservées en unités métriques (une ligne par appareil,
+résolution et horodatage). Seules les portions de la plage demandée absentes de
+la base sont récupérées auprès d'Ecowitt ; les réponses sont ensuite reconstruites
+au format de l'API v3 (unités impériales) attendu par le frontend.
+Les derniers relevés temps réel sont conservés dans WeatherSnapshot ; les
+passerelles configurées en envoi direct alimentent les deux sans passer par le cloud.
+"""
+
+import atexit
+import hashlib
+import logging
+import threading
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.contrib.gis.db.models import PointField
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.db.models import Avg, DateTimeField, FloatField, Func, Max, Value
+from django.db.models.functions import Cos, Radians, Sin
+from django.utils import timezone
+
+from .ecowitt import EcowittError, single_flight
+from .models import WeatherObservation, WeatherSnapshot, WeatherStation, WeatherSyncState
+from .timeseries import cumulative_increments, resample
+
+logger = logging.getLogger(__name__)
+
+# Pas de temps des cycles d'historique Ecowitt (secondes)
+RESOLUTION_STEPS = {'5min': 300, '30min': 1800, '4hour': 14400, '1day': 86400}
+
+# Plage maximale (jours) d'un appel d'historique Ecowitt selon le cycle
+HISTORY_WINDOW_DAYS = {'5min': 1, '30min': 7, '4hour': 31, '1day': 365}
+
+# Résolution cible des agrégats de rétention
+ROLLUP_TARGETS = {'5min': '30min', '30min': '4hour', '4hour': '1day'}
+
+# Groupes demandés à Ecowitt : tout ce qui est stocké, quelle que soit la vue appelante
+HISTORY_CALL_BACK = 'outdoor,indoor,pressure,wind,rainfall,solar_and_uvi'
+
+ECOWITT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+INHG_TO_HPA = 33.8639
+MPH_TO_KMH = 1.60934
+INCH_TO_MM = 25.4
+
+
+def fahrenheit_to_celsius(value):
+    return (value - 32) * 5 / 9
+
+
+def celsius_to_fahrenheit(value):
+    return value * 9 / 5 + 32
+
+
+def identity(value):
+    return value
+
+
+def scale(factor):
+    """Couple de conversions (vers métrique, vers impérial) pour un facteur multiplicatif."""
+    return (lambda value: value * factor), (lambda value: value / factor)
+
+
+# (groupe Ecowitt, champ Ecowitt, colonne, unité Ecowitt, vers métrique, vers impérial)
+FIELDS = [
+    ('outdoor', 'temperature', 'temperature', 'ºF', fahrenheit_to_celsius, celsius_to_fahrenheit),
+    ('outdoor', 'humidity', 'humidity', '%', identity, identity),
+    ('outdoor', 'dew_point', 'dew_point', 'ºF', fahrenheit_to_celsius, celsius_to_fahrenheit),
+    ('indoor', 'temperature', 'indoor_temperature', 'ºF', fahrenheit_to_celsius, celsius_to_fahrenheit),
+    ('indoor', 'humidity', 'indoor_humidity', '%', identity, identity),
+    ('pressure', 'relative', 'pressure_relative', 'inHg', *scale(INHG_TO_HPA)),
+    ('pressure', 'absolute', 'pressure_absolute', 'inHg', *scale(INHG_TO_HPA)),
+    ('wind', 'wind_speed', 'wind_speed', 'mph', *scale(MPH_TO_KMH)),
+    ('wind', 'wind_gust', 'wind_gust', 'mph', *scale(MPH_TO_KMH)),
+    ('wind', 'wind_direction', 'wind_direction', 'º', identity, identity),
+    ('rainfall', 'rain_rate', 'rain_rate', 'in/hr', *scale(INCH_TO_MM)),
+    ('rainfall', 'hourly', 'rain_hourly', 'in', *scale(INCH_TO_MM)),
+    ('rainfall', 'daily', 'rain_daily', 'in', *scale(INCH_TO_MM)),
+    ('solar_and_uvi', 'solar', 'solar', 'W/m²', identity, identity),
+    ('solar_and_uvi', 'uvi', 'uvi', '', identity, identity),
+]
+
+COLUMNS = [field[2] for field in FIELDS]
+
+# Colonnes agrégées par maximum lors des cumuls (les autres par moyenne)
+MAX_COLUMNS = {'wind_gust', 'rain_hourly', 'rain_daily'}
+
+
+def selected_fields(call_back):
+    """Filtre FIELDS selon un call_back Ecowitt (« outdoor », « outdoor.temperature »…)."""
+    if not call_back or call_back == 'all':
+        return FIELDS
+    wanted = [item.strip() for item in call_back.split(',') if item.strip()]
+    return [
+        field for field in FIELDS
+        if any(item == field[0] or item == f'{field[0]}.{field[1]}' for item in wanted)
+    ]
+
+
+def day_bounds(start_date, end_date):
+    """Bornes (datetimes conscients) de deux dates « YYYY-MM-DD », fin de journée incluse."""
+    start = timezone.make_aware(datetime.strptime(start_date, '%Y-%m-%d'))
+    end = timezone.make_aware(datetime.strptime(f'{end_date} 23:59:59', ECOWITT_DATE_FORMAT))
+    return start, end
+
+
+def parse_history(data):
+    """Convertit la section `data` d'un historique Ecowitt en {epoch: {colonne: valeur métrique}}."""
+    rows = {}
+    for group, field, column, unit, to_metric, to_imperial in FIELDS:
+        group_data = data.get(group)
+        if not isinstance(group_data, dict):
+            continue
+        values = (group_data.get(field) or {}).get('list') or {}
+        for epoch, value in values.items():
+            try:
+                rows.setdefault(int(epoch), {})[column] = to_metric(float(value))
+            except (TypeError, ValueError):
+                continue
+    return rows
+
+
+def store_observations(device_id, resolution, rows):
+    """Insère ou met à jour les observations (upsert sur appareil, résolution, horodatage)."""
+    observations = [
+        WeatherObservation(
+            device_id=device_id,
+            resolution=resolution,
+            timestamp=datetime.fromtimestamp(epoch, tz=dt_timezone.utc),
+            **values
+        )
+        for epoch, values in rows.items()
+    ]
+    WeatherObservation.objects.bulk_create(
+        observations,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['device_id', 'resolution', 'timestamp'],
+        update_fields=COLUMNS
+    )
+    return len(observations)
+
+
+def missing_ranges(state, start, end, step):
+    """Portions de [start, end] non couvertes par l'intervalle synchronisé."""
+    if state is None or start > state.synced_until + step or end < state.synced_from - step:
+        return [(start, end)]
+    ranges = []
+    if start < state.synced_from:
+        ranges.append((start, state.synced_from))
+    if end > state.synced_until:
+        ranges.append((state.synced_until, end))
+    return ranges
+
+
+def history_windows(start, end, resolution):
+    """Découpe [start, end] en fenêtres respectant la plage maximale Ecowitt du cycle."""
+    size = timedelta(days=HISTORY_WINDOW_DAYS[resolution])
+    windows = []
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + size - timedelta(seconds=1), end)
+        windows.append((window_start, window_end))
+        window_start = window_end + timedelta(seconds=1)
+    return windows
+
+
+def fetch_windows(client, device_id, resolution, windows):
+    """
+    Interroge Ecowitt pour chaque fenêtre en parallèle (le nombre d'appels simultanés
+    par clé API est borné par le client) et retourne les réponses dans l'ordre.
+    Les threads ne font que des appels HTTP : l'écriture en base reste dans l'appelant.
+    """
+    def fetch(window):
+        window_start, window_end = window
+        try:
+            return client.history(
+                device_id,
+                timezone.localtime(window_start).strftime(ECOWITT_DATE_FORMAT),
+                timezone.localtime(window_end).strftime(ECOWITT_DATE_FORMAT),
+                resolution,
+                HISTORY_CALL_BACK
+            )
+        except EcowittError as e:
+            return e
+
+    if not windows:
+        return []
+    if len(windows) == 1:
+        return [fetch(windows[0])]
+
+    workers = min(len(windows), settings.ECOWITT_MAX_CONCURRENCY_PER_KEY)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ecowitt-history') as executor:
+        return list(executor.map(fetch, windows))
+
+
+def sync_range(client, device_id, resolution, start, end):
+    """
+    Récupère auprès d'Ecowitt les seules portions manquantes de [start, end], découpées
+    en fenêtres interrogées en parallèle, et étend l'intervalle synchronisé.
+    Retourne False si une portion n'a pu être obtenue qu'en réponse de secours
+    (`stale`) ; lève EcowittError si une fenêtre a échoué (les autres sont conservées).
+    """
+    step = timedelta(seconds=RESOLUTION_STEPS[resolution])
+    end = min(end, timezone.now())
+    if start >= end:
+        return True
+
+    state = WeatherSyncState.objects.filter(device_id=device_id, resolution=resolution).first()
+    ranges = missing_ranges(state, start, end, step)
+    windows = [window for range_start, range_end in ranges for window in history_windows(range_start, range_end, resolution)]
+    if not windows:
+        return True
+
+    fetched_at = timezone.now()
+    responses = fetch_windows(client, device_id, resolution, windows)
+
+    # Fusion des fenêtres : les horodatages communs aux bornes sont dédoublonnés
+    rows = {}
+    error = None
+    fresh = True
+    for response in responses:
+        if isinstance(response, EcowittError):
+            error = error or response
+            continue
+        rows.update(parse_history(response.get('data') or {}))
+        if response.get('stale'):
+            fresh = False
+
+    count = store_observations(device_id, resolution, rows)
+    logger.debug(f"Météo {device_id} {resolution}: {count} observation(s) stockée(s) ({len(windows)} fenêtre(s))")
+
+    if error is not None:
+        raise error
+    if not fresh:
+        return False
+
+    # Le dernier créneau peut être incomplet : il sera redemandé au prochain appel
+    for range_start, range_end in ranges:
+        covered_until = min(range_end, fetched_at - step)
+        if covered_until > range_start:
+            state = extend_sync_state(state, device_id, resolution, range_start, covered_until, step)
+
+    return True
+
+
+def extend_sync_state(state, device_id, resolution, start, end, step):
+    """Fusionne [start, end] dans l'intervalle synchronisé (ou le remplace s'il est disjoint et plus récent)."""
+    if state is None:
+        state, created = WeatherSyncState.objects.update_or_create(
+            device_id=device_id,
+            resolution=resolution,
+            defaults={'synced_from': start, 'synced_until': end}
+        )
+        return state
+
+    if start <= state.synced_until + step and end >= state.synced_from - step:
+        state.synced_from = min(state.synced_from, start)
+        state.synced_until = max(state.synced_until, end)
+    elif end > state.synced_until:
+        state.synced_from, state.synced_until = start, end
+    else:
+        return state
+
+    state.save(update_fields=['synced_from', 'synced_until', 'updated_at'])
+    return state
+
+
+def load_observations(device_id, resolution, start, end, columns=COLUMNS):
+    """Observations locales de la plage, triées par horodatage : [(timestamp, *colonnes)]."""
+    return list(
+        WeatherObservation.objects
+        .filter(device_id=device_id, resolution=resolution, timestamp__range=(start, end))
+        .order_by('timestamp')
+        .values_list('timestamp', *columns)
+    )
+
+
+def history_payload(device_id, resolution, start, end, call_back=HISTORY_CALL_BACK):
+    """Section `data` d'un historique Ecowitt reconstruite depuis la base (unités impériales)."""
+    fields = selected_fields(call_back)
+    rows = load_observations(device_id, resolution, start, end, [field[2] for field in fields])
+
+    data = {}
+    for index, (group, field, column, unit, to_metric, to_imperial) in enumerate(fields, start=1):
+        values = {
+            str(int(row[0].timestamp())): str(round(to_imperial(row[index]), 3))
+            for row in rows if row[index] is not None
+        }
+        data.setdefault(group, {})[field] = {'unit': unit, 'list': values}
+    return data
+
+
+def get_history(client, device_id, resolution, start, end, call_back=HISTORY_CALL_BACK):
+    """
+    Historique au format de réponse Ecowitt, servi depuis la base après synchronisation
+    incrémentale. Si Ecowitt est injoignable mais que des données locales existent,
+    elles sont servies marquées `stale` ; sinon l'EcowittError est propagée, comme
+    toute erreur applicative d'Ecowitt (appareil hors du compte…).
+    """
+    try:
+        fresh = sync_range(client, device_id, resolution, start, end)
+    except EcowittError as e:
+        if e.upstream_message is not None or not WeatherObservation.objects.filter(
+            device_id=device_id, resolution=resolution, timestamp__range=(start, end)
+        ).exists():
+            raise
+        logger.warning(f"Météo {device_id}: Ecowitt indisponible, historique local servi")
+        fresh = False
+
+    response = {
+        'code': 0,
+        'msg': 'success',
+        'time': str(int(time.time())),
+        'data': history_payload(device_id, resolution, start, end, call_back),
+    }
+    if not fresh:
+        response['stale'] = True
+    return response
+
+
+# Unités métriques des colonnes stockées, d'après l'unité Ecowitt
+METRIC_UNITS = {'ºF': '°C', 'inHg': 'hPa', 'mph': 'km/h', 'in/hr': 'mm/h', 'in': 'mm'}
+
+
+def export_header():
+    """En-tête CSV : horodatage puis une colonne par grandeur stockée, avec son unité métrique."""
+    header = ['timestamp']
+    for group, field, column, unit, to_metric, to_imperial in FIELDS:
+        unit = METRIC_UNITS.get(unit, unit)
+        header.append(f'{column} ({unit})' if unit else column)
+    return header
+
+
+def iter_export_rows(client, device_id, resolution, start, end):
+    """
+    Génère les lignes d'export de [start, end], fenêtre Ecowitt par fenêtre : chaque
+    fenêtre est synchronisée si nécessaire (appels amont séquentiels) puis lue en base
+    par curseur. La mémoire utilisée ne dépend pas de la longueur de la plage.
+    """
+    for window_start, window_end in history_windows(start, min(end, timezone.now()), resolution):
+        try:
+            sync_range(client, device_id, resolution, window_start, window_end)
+        except EcowittError as e:
+            logger.warning(f"Export météo {device_id}: fenêtre {window_start:%Y-%m-%d} non synchronisée ({e})")
+
+        observations = (
+            WeatherObservation.objects
+            .filter(device_id=device_id, resolution=resolution, timestamp__range=(window_start, window_end))
+            .order_by('timestamp')
+            .values_list('timestamp', *COLUMNS)
+        )
+        for timestamp, *values in observations.iterator(chunk_size=2000):
+            yield [timezone.localtime(timestamp).isoformat()] + ['' if value is None else round(value, 3) for value in values]
+
+
+# Grilles cibles de la comparaison multi-stations (secondes)
+COMPARE_STEPS = {'5min': 300, '30min': 1800, '1hour': 3600, '4hour': 14400, '1day': 86400}
+
+# Grandeurs comparables : (colonne source, agrégation par seau, unité métrique)
+COMPARE_FIELDS = {
+    'temperature': ('temperature', 'mean', '°C'),
+    'humidity': ('humidity', 'mean', '%'),
+    'dew_point': ('dew_point', 'mean', '°C'),
+    'pressure': ('pressure_relative', 'mean', 'hPa'),
+    'wind_speed': ('wind_speed', 'mean', 'km/h'),
+    'wind_gust': ('wind_gust', 'max', 'km/h'),
+    'solar': ('solar', 'mean', 'W/m²'),
+    'uvi': ('uvi', 'max', ''),
+    # Cumul journalier ramené à la pluie tombée entre deux observations
+    'rain': ('rain_daily', 'sum', 'mm'),
+}
+
+
+def compare_source_resolution(target):
+    """Résolution stockée la plus grossière dont le pas ne dépasse pas celui de la grille cible."""
+    step = COMPARE_STEPS[target]
+    return max(
+        (resolution for resolution in ROLLUP_TARGETS if RESOLUTION_STEPS[resolution] <= step),
+        key=RESOLUTION_STEPS.get
+    )
+
+
+def compare_grid(target, start, end):
+    """Début des seaux (datetimes conscients) de la grille cible ; les jours suivent l'heure locale."""
+    if target == '1day':
+        first_day = timezone.localtime(start).date()
+        days = (timezone.localtime(end).date() - first_day).days + 1
+        return [
+            timezone.make_aware(datetime.combine(first_day + timedelta(days=offset), datetime.min.time()))
+            for offset in range(days)
+        ]
+    step = timedelta(seconds=COMPARE_STEPS[target])
+    count = int((end - start) / step) + 1
+    return [start + step * index for index in range(count)]
+
+
+def compare_series(device_ids, target, start, end, names):
+    """
+    Séries des appareils rééchantillonnées et alignées sur la grille cible, depuis les
+    observations locales : {'timestamps': [ms], 'series': [{device_id, field, unit,
+    aggregation, values}]}. Pluie sommée, grandeurs instantanées moyennées, rafales maximales.
+    """
+    resolution = compare_source_resolution(target)
+    grid = compare_grid(target, start, end)
+    origin = int(start.timestamp())
+    step = COMPARE_STEPS[target]
+    first_day = timezone.localtime(start).date().toordinal()
+    columns = list(dict.fromkeys(COMPARE_FIELDS[name][0] for name in names))
+
+    series = []
+    for device_id in device_ids:
+        rows = load_observations(device_id, resolution, start, end, columns)
+        epochs = np.fromiter((int(row[0].timestamp()) for row in rows), dtype=np.int64, count=len(rows))
+        days = np.fromiter(
+            (timezone.localtime(row[0]).date().toordinal() for row in rows), dtype=np.int64, count=len(rows)
+        )
+        buckets = days - first_day if target == '1day' else (epochs - origin) // step
+
+        for name in names:
+            column, how, unit = COMPARE_FIELDS[name]
+            index = columns.index(column) + 1
+            values = np.array([np.nan if row[index] is None else row[index] for row in rows], dtype=np.float64)
+            if name == 'rain':
+                values = cumulative_increments(values, days)
+            resampled = resample(buckets, values, len(grid), how)
+            series.append({
+                'device_id': device_id,
+                'field': name,
+                'unit': unit,
+                'aggregation': how,
+                'values': [None if np.isnan(value) else round(value, 2) for value in resampled.tolist()],
+            })
+
+    return {
+        'resolution': target,
+        'source_resolution': resolution,
+        'timestamps': [int(bucket.timestamp()) * 1000 for bucket in grid],
+        'series': series,
+    }
+
+
+def account_key(api_key):
+    """Empreinte d'une clé API Ecowitt, utilisée pour indexer les relevés sans stocker la clé."""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def store_snapshots(account, responses):
+    """Enregistre les réponses temps réel {device_id: réponse} d'un compte (upsert)."""
+    fetched_at = timezone.now()
+    snapshots = [
+        WeatherSnapshot(account=account, device_id=device_id, data=data, fetched_at=fetched_at)
+        for device_id, data in responses.items()
+    ]
+    WeatherSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['account', 'device_id'],
+        update_fields=['data', 'fetched_at']
+    )
+    return snapshots
+
+
+def snapshot_response(snapshot, stale=False):
+    """Réponse Ecowitt du relevé, complétée de son âge (secondes) et de sa date de récupération."""
+    response = dict(snapshot.data)
+    response['fetched_at'] = snapshot.fetched_at.isoformat()
+    response['age'] = max(0, int((timezone.now() - snapshot.fetched_at).total_seconds()))
+    if stale:
+        response['stale'] = True
+    return response
+
+
+def get_realtime(client, device_id):
+    """
+    Relevé temps réel d'un appareil. Le relevé maintenu par `poll_weather` est servi
+    tant qu'il a moins de WEATHER_SNAPSHOT_MAX_AGE secondes ; au-delà, un seul appel
+    Ecowitt par appareil est fait quel que soit le nombre de requêtes simultanées.
+    Si Ecowitt échoue, le dernier relevé connu est servi marqué `stale`.
+    """
+    account = account_key(client.api_key)
+    snapshot = WeatherSnapshot.objects.filter(account=account, device_id=device_id).first()
+    max_age = timedelta(seconds=settings.WEATHER_SNAPSHOT_MAX_AGE)
+    if snapshot is not None and timezone.now() - snapshot.fetched_at <= max_age:
+        return snapshot_response(snapshot)
+
+    def refresh():
+        data = client.real_time(device_id)
+        if data.get('stale'):
+            return data, None
+        return data, store_snapshots(account, {device_id: data})[0]
+
+    try:
+        data, fresh_snapshot = single_flight.do(f'realtime:{account}:{device_id}', refresh)
+    except EcowittError:
+        if snapshot is None:
+            raise
+        logger.warning(f"Météo {device_id}: Ecowitt indisponible, dernier relevé servi")
+        return snapshot_response(snapshot, stale=True)
+
+    if fresh_snapshot is not None:
+        return snapshot_response(fresh_snapshot)
+    if snapshot is not None:
+        return snapshot_response(snapshot, stale=True)
+    return data
+
+
+def parse_realtime(data):
+    """Convertit la section `data` d'un relevé temps réel Ecowitt en {colonne: valeur métrique}."""
+    readings = {}
+    for group, field, column, unit, to_metric, to_imperial in FIELDS:
+        group_data = data.get(group)
+        if not isinstance(group_data, dict):
+            continue
+        try:
+            readings[column] = to_metric(float((group_data.get(field) or {})['value']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return readings
+
+
+def get_realtime_many(client, device_ids):
+    """
+    Relevés temps réel de plusieurs appareils : les relevés récents sont lus en une
+    requête, les autres sont rafraîchis en parallèle (threads limités aux appels HTTP,
+    plafonnés par clé API dans le client). Retourne {device_id: réponse ou EcowittError}.
+    """
+    account = account_key(client.api_key)
+    max_age = timedelta(seconds=settings.WEATHER_SNAPSHOT_MAX_AGE)
+    snapshots = {
+        snapshot.device_id: snapshot
+        for snapshot in WeatherSnapshot.objects.filter(account=account, device_id__in=device_ids)
+    }
+    now = timezone.now()
+    results = {
+        device_id: snapshot_response(snapshot)
+        for device_id, snapshot in snapshots.items()
+        if now - snapshot.fetched_at <= max_age
+    }
+    outdated = [device_id for device_id in device_ids if device_id not in results]
+    if not outdated:
+        return results
+
+    def fetch(device_id):
+        try:
+            return device_id, single_flight.do(
+                f'realtime-http:{account}:{device_id}', lambda: client.real_time(device_id)
+            )
+        except EcowittError as e:
+            return device_id, e
+
+    workers = min(len(outdated), settings.ECOWITT_MAX_CONCURRENCY_PER_KEY)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ecowitt-realtime') as executor:
+        fetched = dict(executor.map(fetch, outdated))
+
+    fresh = {
+        device_id: data for device_id, data in fetched.items()
+        if not isinstance(data, EcowittError) and not data.get('stale')
+    }
+    for snapshot in store_snapshots(account, fresh):
+        results[snapshot.device_id] = snapshot_response(snapshot)
+
+    for device_id, data in fetched.items():
+        if device_id in results:
+            continue
+        if device_id in snapshots:
+            results[device_id] = snapshot_response(snapshots[device_id], stale=True)
+        else:
+            results[device_id] = data
+    return results
+
+
+def device_location(device):
+    """Position d'un appareil de la liste Ecowitt (Point WGS84) ou None."""
+    try:
+        latitude, longitude = float(device['latitude']), float(device['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if latitude == 0 and longitude == 0:
+        return None
+    return Point(longitude, latitude, srid=4326)
+
+
+def extract_devices(data):
+    """Appareils d'une réponse device/list : la liste est dans data['devices'] ou data['list']."""
+    payload = data.get('data') or {}
+    if not isinstance(payload, dict):
+        return []
+    return payload.get('devices') or payload.get('list') or []
+
+
+def register_stations(account, devices):
+    """
+    Synchronise le registre des stations avec une liste d'appareils Ecowitt : les
+    nouveaux appareils sont créés, seuls ceux dont le nom ou la position a changé
+    sont mis à jour.
+    """
+    existing = {station.device_id: station for station in WeatherStation.objects.filter(account=account)}
+    created, changed = [], []
+
+    for device in devices:
+        device_id = device.get('mac') or device.get('imei')
+        if not device_id:
+            continue
+        name = device.get('name') or ''
+        location = device_location(device)
+        station = existing.get(device_id)
+
+        if station is None:
+            created.append(WeatherStation(
+                account=account,
+                device_id=device_id,
+                name=name,
+                location=location,
+                passkey=WeatherStation.passkey_for(device_id)
+            ))
+        elif station.name != name or (station.location and station.location.coords) != (location and location.coords):
+            station.name, station.location = name, location
+            changed.append(station)
+
+    if created:
+        WeatherStation.objects.bulk_create(created, ignore_conflicts=True)
+    if changed:
+        now = timezone.now()
+        for station in changed:
+            station.updated_at = now
+        WeatherStation.objects.bulk_update(changed, ['name', 'location', 'updated_at'])
+    return len(created) + len(changed)
+
+
+class KNNDistance(Func):
+    """Opérateur PostGIS `<->` : tri des plus proches voisins assisté par l'index spatial."""
+    arg_joiner = ' <-> '
+    template = '%(expressions)s'
+    output_field = FloatField()
+
+
+def nearest_stations(account, point, limit=3):
+    """
+    Stations du compte les plus proches d'un point (WGS84), avec leur distance en mètres.
+    Les candidats sont obtenus par l'index (`<->`), puis classés par distance géodésique.
+    """
+    candidates = list(
+        WeatherStation.objects.filter(account=account, location__isnull=False)
+        .order_by(KNNDistance('location', Value(point, output_field=PointField(srid=4326))))
+        .annotate(distance=Distance('location', point))[:limit + 5]
+    )
+    candidates.sort(key=lambda station: station.distance.m)
+    return candidates[:limit]
+
+
+# Champs du protocole d'envoi direct Ecowitt (« customized upload ») → colonnes
+PUSH_FIELDS = {
+    'tempf': 'temperature',
+    'humidity': 'humidity',
+    'tempinf': 'indoor_temperature',
+    'humidityin': 'indoor_humidity',
+    'baromrelin': 'pressure_relative',
+    'baromabsin': 'pressure_absolute',
+    'windspeedmph': 'wind_speed',
+    'windgustmph': 'wind_gust',
+    'winddir': 'wind_direction',
+    'rainratein': 'rain_rate',
+    'hourlyrainin': 'rain_hourly',
+    'dailyrainin': 'rain_daily',
+    'solarradiation': 'solar',
+    'uv': 'uvi',
+}
+
+COLUMN_FIELDS = {field[2]: field for field in FIELDS}
+
+
+def dew_point(temperature, humidity):
+    """Point de rosée (°C) par la formule de Magnus."""
+    if humidity <= 0:
+        return None
+    gamma = math.log(humidity / 100) + 17.62 * temperature / (243.12 + temperature)
+    return 243.12 * gamma / (17.62 - gamma)
+
+
+def parse_push(payload):
+    """
+    Convertit un envoi direct (formulaire, unités impériales) en (epoch, {colonne: valeur métrique}).
+    L'horodatage `dateutc` est en UTC ; à défaut, l'heure de réception est utilisée.
+    """
+    try:
+        received = datetime.strptime(payload.get('dateutc', ''), ECOWITT_DATE_FORMAT).replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        received = timezone.now()
+
+    readings = {}
+    for name, column in PUSH_FIELDS.items():
+        try:
+            readings[column] = COLUMN_FIELDS[column][4](float(payload[name]))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    if 'temperature' in readings and 'humidity' in readings:
+        readings['dew_point'] = dew_point(readings['temperature'], readings['humidity'])
+    return int(received.timestamp()), readings
+
+
+def realtime_payload(epoch, readings):
+    """Relevé temps réel au format de réponse Ecowitt (unités impériales) à partir de valeurs métriques."""
+    data = {}
+    for group, field, column, unit, to_metric, to_imperial in FIELDS:
+        if readings.get(column) is None:
+            continue
+        data.setdefault(group, {})[field] = {
+            'time': str(epoch), 'unit': unit, 'value': str(round(to_imperial(readings[column]), 3))
+        }
+    return {'code': 0, 'msg': 'success', 'time': str(epoch), 'data': data}
+
+
+class PushBuffer:
+    """
+    Tampon des envois directs : les relevés sont regroupés par créneau de 5 minutes
+    (le plus récent l'emporte) et écrits par lots, au plus tard après
+    WEATHER_PUSH_FLUSH_INTERVAL secondes (minuterie armée au premier relevé du lot)
+    ou WEATHER_PUSH_BATCH_SIZE créneaux.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.timer = None
+
+    def add(self, device_id, epoch, readings):
+        step = RESOLUTION_STEPS['5min']
+        with self.lock:
+            self.rows[(device_id, epoch - epoch % step)] = readings
+            if self.timer is None:
+                self.timer = threading.Timer(settings.WEATHER_PUSH_FLUSH_INTERVAL, self.flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+            due = len(self.rows) >= settings.WEATHER_PUSH_BATCH_SIZE
+        if due:
+            self.flush()
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Écriture des envois directs impossible")
+        finally:
+            connection.close()
+
+    def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not rows:
+            return
+
+        by_device = {}
+        for (device_id, epoch), readings in rows.items():
+            by_device.setdefault(device_id, {})[epoch] = readings
+
+        step = RESOLUTION_STEPS['5min']
+        for device_id, device_rows in by_device.items():
+            store_observations(device_id, '5min', device_rows)
+
+            # Les créneaux reçus en direct n'ont pas à être redemandés au cloud, mais seulement
+            # par suites de créneaux consécutifs : un trou (passerelle hors ligne) reste à récupérer
+            epochs = sorted(device_rows)
+            runs = [[epochs[0], epochs[0]]]
+            for epoch in epochs[1:]:
+                if epoch - runs[-1][1] <= step:
+                    runs[-1][1] = epoch
+                else:
+                    runs.append([epoch, epoch])
+
+            state = WeatherSyncState.objects.filter(device_id=device_id, resolution='5min').first()
+            for run_start, run_end in runs:
+                state = extend_sync_state(
+                    state, device_id, '5min',
+                    datetime.fromtimestamp(run_start, tz=dt_timezone.utc),
+                    datetime.fromtimestamp(run_end, tz=dt_timezone.utc),
+                    timedelta(seconds=step)
+                )
+
+
+push_buffer = PushBuffer()
+atexit.register(push_buffer.flush)
+
+
+def ingest_push(stations, payload):
+    """
+    Enregistre un envoi direct d'un appareil, connu d'un ou plusieurs comptes :
+    relevé temps réel immédiat pour chaque compte, série temporelle par lots.
+    """
+    epoch, readings = parse_push(payload)
+    if not readings:
+        return False
+
+    device_id = stations[0].device_id
+    snapshot = realtime_payload(epoch, readings)
+    for account in {station.account for station in stations}:
+        store_snapshots(account, {device_id: snapshot})
+    WeatherStation.objects.filter(pk__in=[station.pk for station in stations]).update(last_push_at=timezone.now())
+    push_buffer.add(device_id, epoch, readings)
+    return True
+
+
+class LocalTimeBucket(Func):
+    """
+    Début du créneau de `step` secondes contenant l'horodatage, aligné sur l'heure
+    locale (TIME_ZONE) afin que les agrégats journaliers commencent à minuit.
+    """
+    output_field = DateTimeField()
+
+    def __init__(self, expression, step, **extra):
+        super().__init__(expression, **extra)
+        self.step = step
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        return (
+            f"((to_timestamp(floor(extract(epoch from ({sql} AT TIME ZONE %s)) / %s) * %s) "
+            f"AT TIME ZONE 'UTC') AT TIME ZONE %s)",
+            [*params, settings.TIME_ZONE, self.step, self.step, settings.TIME_ZONE]
+        )
+
+
+def rollup_observations(source, older_than, dry_run=False, batch_size=1000):
+    """
+    Agrège les observations `source` antérieures à `older_than` dans la résolution
+    supérieure (moyennes, maxima pour rafales et cumuls de pluie, moyenne circulaire
+    pour la direction du vent), puis supprime les lignes sources.
+    Les lignes déjà présentes à la résolution cible (issues d'Ecowitt) sont conservées.
+    Retourne (agrégats créés, lignes supprimées).
+    """
+    target = ROLLUP_TARGETS[source]
+    aggregates = {
+        column: Max(column) if column in MAX_COLUMNS else Avg(column)
+        for column in COLUMNS if column != 'wind_direction'
+    }
+    aggregates['wind_direction_sin'] = Avg(Sin(Radians('wind_direction')))
+    aggregates['wind_direction_cos'] = Avg(Cos(Radians('wind_direction')))
+
+    # Ne pas agréger un créneau partiellement postérieur à la limite
+    step = RESOLUTION_STEPS[target]
+    cutoff = older_than - timedelta(seconds=step)
+    source_rows = WeatherObservation.objects.filter(resolution=source, timestamp__lt=cutoff)
+    buckets = (
+        source_rows
+        .annotate(bucket=LocalTimeBucket('timestamp', step))
+        .values('device_id', 'bucket')
+        .annotate(**aggregates)
+        .order_by('device_id', 'bucket')
+    )
+
+    if dry_run:
+        return buckets.count(), source_rows.count()
+
+    created = 0
+    with transaction.atomic():
+        batch = []
+        for bucket in buckets.iterator(chunk_size=batch_size):
+            sin, cos = bucket.pop('wind_direction_sin'), bucket.pop('wind_direction_cos')
+            if sin is not None and cos is not None:
+                bucket['wind_direction'] = math.degrees(math.atan2(sin, cos)) % 360
+            batch.append(WeatherObservation(
+                device_id=bucket.pop('device_id'),
+                resolution=target,
+                timestamp=bucket.pop('bucket'),
+                **bucket
+            ))
+            if len(batch) >= batch_size:
+                WeatherObservation.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+                batch = []
+        if batch:
+            WeatherObservation.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+
+        deleted, _ = source_rows.delete()
+
+        # L'intervalle synchronisé à la résolution source ne couvre plus les lignes supprimées
+        WeatherSyncState.objects.filter(resolution=source, synced_until__lte=cutoff).delete()
+        WeatherSyncState.objects.filter(resolution=source, synced_from__lt=cutoff).update(synced_from=cutoff)
+
+    return created, deleted
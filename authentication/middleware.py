@@ -6,14 +6,23 @@ from django.conf import settings
 import jwt
 from django.http import JsonResponse
 
-def get_user_jwt(request):
-    """Récupère l'utilisateur à partir du token JWT."""
+def get_user_jwt(request, allow_cookie=False):
+    """
+    Récupère l'utilisateur à partir du token JWT.
+    Si `allow_cookie` est vrai, le cookie `access_token` est utilisé à défaut
+    d'en-tête (requêtes du navigateur comme les balises <img>).
+    """
     user = None
     auth_header = request.META.get('HTTP_AUTHORIZATION', '').split()
-    
+    jwt_token = None
+
     if len(auth_header) == 2 and auth_header[0].lower() == 'bearer':
+        jwt_token = auth_header[1]
+    elif allow_cookie:
+        jwt_token = request.COOKIES.get('access_token')
+
+    if jwt_token:
         try:
-            jwt_token = auth_header[1]
             jwt_payload = jwt.decode(
                 jwt_token,
                 settings.SECRET_KEY,
@@ -37,6 +46,10 @@ class AuthenticationMiddleware(MiddlewareMixin):
             '/login/',
             '/static/',
             '/media/',
+            # Passerelles Ecowitt : authentifiées par leur PASSKEY dans la vue
+            '/api/weather/ingest/',
+            # Tuiles : authentifiées dans la vue, cookie accepté pour les balises <img>
+            '/api/tiles/',
         ]
         
         # Ne vérifier que les requêtes API
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2025-05-13 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0002_utilisateur_ecowitt_api_key_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="utilisateur",
+            name="storage_used_bytes",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                help_text="Espace de stockage actuellement utilisé en octets (valeur de référence pour le quota)",
+                verbose_name="Stockage utilisé (octets)",
+            ),
+        ),
+    ]
@@ -1,5 +1,15 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+# Nombre d'octets dans un mégaoctet (unité des quotas)
+MEGABYTE = 1024 * 1024
+
+
+class StorageQuotaExceeded(Exception):
+    """L'ajout d'un contenu dépasserait le quota de stockage de l'utilisateur."""
+
 
 class Utilisateur(AbstractUser):
     """
@@ -77,6 +87,12 @@ class Utilisateur(AbstractUser):
         help_text='Espace de stockage actuellement utilisé en mégaoctets'
     )
 
+    storage_used_bytes = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Stockage utilisé (octets)',
+        help_text='Espace de stockage actuellement utilisé en octets (valeur de référence pour le quota)'
+    )
+
     # Clés API Ecowitt pour les entreprises
     ecowitt_api_key = models.CharField(
         max_length=100,
@@ -130,6 +146,44 @@ class Utilisateur(AbstractUser):
     def is_visiteur(self):
         return self.role == self.Role.VISITEUR
 
+    @property
+    def storage_quota_bytes(self):
+        return self.storage_quota * MEGABYTE
+
+    def has_storage_for(self, size_bytes):
+        """Indique si l'ajout de `size_bytes` octets reste dans le quota."""
+        return self.storage_used_bytes + size_bytes <= self.storage_quota_bytes
+
+    def reserve_storage(self, size_bytes):
+        """
+        Admission atomique dans le quota : le stockage utilisé n'est augmenté que si le
+        quota le permet, dans une seule mise à jour conditionnelle (pas de contrôle puis
+        écriture séparés que des envois concurrents pourraient dépasser).
+        Retourne False, sans rien modifier, si le quota serait dépassé.
+        """
+        total = F('storage_used_bytes') + size_bytes
+        updated = Utilisateur.objects.filter(
+            pk=self.pk,
+            storage_used_bytes__lte=F('storage_quota') * MEGABYTE - size_bytes
+        ).update(
+            storage_used_bytes=total,
+            storage_used=(total + MEGABYTE - 1) / MEGABYTE
+        )
+        self.refresh_from_db(fields=['storage_used_bytes', 'storage_used'])
+        return bool(updated)
+
+    def adjust_storage(self, delta_bytes):
+        """
+        Ajuste atomiquement le stockage utilisé, sans lecture-modification-écriture.
+        Le total en MB (arrondi au supérieur) est maintenu dans la même requête.
+        """
+        total = Greatest(F('storage_used_bytes') + delta_bytes, Value(0))
+        Utilisateur.objects.filter(pk=self.pk).update(
+            storage_used_bytes=total,
+            storage_used=(total + MEGABYTE - 1) / MEGABYTE
+        )
+        self.refresh_from_db(fields=['storage_used_bytes', 'storage_used'])
+
     def get_display_name(self):
         """Retourne le nom d'affichage standardisé de l'utilisateur."""
         full_name = f"{self.first_name} {self.last_name}".strip().upper()
@@ -94,9 +94,9 @@ class UserSerializer(serializers.ModelSerializer):
             'salarie_name', 'company_name', 'must_change_password', 'phone',
             'full_name', 'is_active', 'permissions', 'user_type', 'plans_count',
             'entreprise', 'entreprise_id', 'logo', 'ecowitt_api_key', 'ecowitt_application_key',
-            'storage_quota', 'storage_used'
+            'storage_quota', 'storage_used', 'storage_used_bytes'
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['id', 'storage_used_bytes']
         extra_kwargs = {
             'role': {'required': True}
         }
@@ -848,9 +848,8 @@ export const mapService = {
    */
   getTileUrlFunction(tileType: string): (x: number, y: number, z: number) => string {
     return (x: number, y: number, z: number) => {
-      // Ajouter un timestamp pour éviter les problèmes de cache
-      const timestamp = Date.now();
-      return `/api/tiles/${tileType}/${z}/${x}/${y}.png?_t=${timestamp}`;
+      // Pas de paramètre anti-cache : les tuiles sont servies avec des en-têtes de cache longs
+      return `/api/tiles/${tileType}/${z}/${x}/${y}.png`;
     };
   },
 
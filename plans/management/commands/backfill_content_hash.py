@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from plans.models import NotePhoto
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcule l'empreinte de contenu des photos de notes antérieures à la déduplication, "
+        "puis recalcule le stockage utilisé (un contenu déjà présent n'est plus compté qu'une fois)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Compte les photos à traiter sans rien modifier"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Nombre de photos lues puis mises à jour par lot"
+        )
+
+    def handle(self, *args, **options):
+        pending = NotePhoto.objects.filter(content_hash='').exclude(image='').only('id', 'image').order_by('id')
+        if options['dry_run']:
+            self.stdout.write(f"{pending.count()} photo(s) sans empreinte")
+            return
+
+        hashed = missing = 0
+        batch = []
+        for photo in pending.iterator(chunk_size=options['batch_size']):
+            try:
+                photo.content_hash = NotePhoto.compute_content_hash(photo.image)
+            except OSError:
+                # Fichier absent : laissé à collect_media_garbage
+                missing += 1
+                continue
+            finally:
+                photo.image.close()
+            batch.append(photo)
+            if len(batch) >= options['batch_size']:
+                hashed += NotePhoto.objects.bulk_update(batch, ['content_hash'])
+                batch = []
+        if batch:
+            hashed += NotePhoto.objects.bulk_update(batch, ['content_hash'])
+
+        self.stdout.write(f"{hashed} empreinte(s) calculée(s), {missing} photo(s) sans fichier")
+        if hashed:
+            updated = NotePhoto.reconcile_storage()
+            self.stdout.write(self.style.SUCCESS(f"Stockage recalculé pour {updated} utilisateur(s)"))
@@ -0,0 +1,152 @@
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from plans.models import NotePhoto, PhotoUpload
+
+
+def walk_sorted(root, prefix=''):
+    """
+    Parcourt un répertoire en profondeur et produit les chemins relatifs des
+    fichiers dans l'ordre lexicographique exact des chemins complets.
+    Trier les dossiers sur « nom/ » garantit que tout leur contenu se place
+    au bon endroit parmi leurs voisins ; seul un dossier est listé à la fois.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = sorted(
+                it,
+                key=lambda entry: entry.name + '/' if entry.is_dir(follow_symlinks=False) else entry.name
+            )
+    except FileNotFoundError:
+        return
+
+    for entry in entries:
+        relative = f'{prefix}{entry.name}'
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_sorted(entry.path, relative + '/')
+        elif entry.is_file(follow_symlinks=False):
+            yield relative, entry
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les fichiers de photos de notes qui ne sont plus référencés "
+        "(suppressions en cascade de plans ou de notes), purge les uploads abandonnés "
+        "et recalcule le stockage utilisé. Fichiers et base sont parcourus en flux triés, "
+        "sans charger l'un ou l'autre ensemble en mémoire."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Affiche ce qui serait supprimé sans rien modifier"
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help="Âge minimal (secondes) d'un fichier orphelin avant suppression (uploads en cours)"
+        )
+        parser.add_argument(
+            '--upload-max-age',
+            type=int,
+            default=24 * 3600,
+            help="Âge (secondes) au-delà duquel un upload reprenable inactif est abandonné"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help="Nombre de lignes lues par lot depuis la base"
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        root = os.path.join(settings.MEDIA_ROOT, 'notes')
+        cutoff = time.time() - options['min_age']
+
+        # Chemins référencés, triés octet par octet comme les chemins du disque
+        referenced = iter(
+            NotePhoto.objects.filter(image__startswith='notes/')
+            .annotate(path=Collate('image', 'C'))
+            .order_by('path')
+            .values_list('path', flat=True)
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        scanned = deleted = kept_recent = missing = 0
+        freed = 0
+        current = next(referenced, None)
+
+        for relative, entry in walk_sorted(root, 'notes/'):
+            scanned += 1
+
+            # Lignes dont le fichier n'existe pas sur le disque
+            while current is not None and current < relative:
+                missing += 1
+                current = self.advance(referenced, current)
+
+            if current == relative:
+                current = self.advance(referenced, current)
+                continue
+
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                kept_recent += 1
+                continue
+
+            # Le fichier a pu être de nouveau référencé (déduplication) depuis la lecture de la base
+            if NotePhoto.objects.filter(image=relative).exists():
+                continue
+
+            deleted += 1
+            freed += stat.st_size
+            if dry_run:
+                self.stdout.write(f"Orphelin : {relative}")
+            else:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+        while current is not None:
+            missing += 1
+            current = self.advance(referenced, current)
+
+        self.stdout.write(
+            f"{scanned} fichier(s) parcouru(s), {deleted} orphelin(s) "
+            f"({freed / (1024 * 1024):.1f} MB){' à supprimer' if dry_run else ' supprimé(s)'}, "
+            f"{kept_recent} récent(s) conservé(s), {missing} photo(s) sans fichier"
+        )
+
+        # Uploads reprenables abandonnés
+        stale_uploads = PhotoUpload.objects.filter(
+            updated_at__lt=timezone.now() - timedelta(seconds=options['upload_max_age'])
+        )
+        stale_count = 0
+        for upload in stale_uploads.iterator(chunk_size=options['batch_size']):
+            stale_count += 1
+            if not dry_run:
+                upload.discard()
+        self.stdout.write(f"{stale_count} upload(s) abandonné(s){' à purger' if dry_run else ' purgé(s)'}")
+
+        if dry_run:
+            return
+
+        # Les suppressions en cascade n'appellent pas NotePhoto.delete() : recalculer les quotas
+        updated = NotePhoto.reconcile_storage()
+        self.stdout.write(self.style.SUCCESS(f"Stockage recalculé pour {updated} utilisateur(s)"))
+
+    def advance(self, referenced, current):
+        """Passe au chemin référencé suivant en ignorant les doublons (photos dédupliquées)."""
+        following = next(referenced, None)
+        while following is not None and following == current:
+            following = next(referenced, None)
+        return following
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from plans.models import NotePhoto
+
+
+class Command(BaseCommand):
+    help = "Recalcule le stockage utilisé par chaque utilisateur à partir des photos de notes"
+
+    def handle(self, *args, **options):
+        updated = NotePhoto.reconcile_storage()
+        self.stdout.write(self.style.SUCCESS(f"Stockage recalculé pour {updated} utilisateur(s)"))
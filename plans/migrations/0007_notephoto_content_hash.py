@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2025-05-12 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plans", "0006_geonote_createur"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notephoto",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                help_text="Empreinte du contenu de l'image, utilisée pour la déduplication",
+                max_length=64,
+                verbose_name="Empreinte SHA-256",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notephoto",
+            name="charged",
+            field=models.BooleanField(
+                default=True,
+                help_text="Vrai pour la photo qui porte la taille du contenu dans le quota de l'utilisateur",
+                verbose_name="Comptée dans le quota",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notephoto",
+            index=models.Index(
+                fields=["user", "content_hash"], name="plans_notep_user_id_5ebe87_idx"
+            ),
+        ),
+    ]
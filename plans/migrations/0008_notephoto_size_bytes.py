@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2025-05-13 08:05
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+MEGABYTE = 1024 * 1024
+
+
+def sizes_to_bytes(apps, schema_editor):
+    """Convertit les tailles existantes (KB) en octets et recalcule les quotas."""
+    NotePhoto = apps.get_model("plans", "NotePhoto")
+    Utilisateur = apps.get_model("authentication", "Utilisateur")
+
+    NotePhoto.objects.update(size=F("size") * 1024)
+
+    charged_total = (
+        NotePhoto.objects.filter(user=OuterRef("pk"), charged=True)
+        .order_by()
+        .values("user")
+        .annotate(total=Sum("size"))
+        .values("total")
+    )
+    total = Coalesce(Subquery(charged_total, output_field=models.BigIntegerField()), Value(0))
+    Utilisateur.objects.update(
+        storage_used_bytes=total,
+        storage_used=(total + MEGABYTE - 1) / MEGABYTE,
+    )
+
+
+def sizes_to_kilobytes(apps, schema_editor):
+    NotePhoto = apps.get_model("plans", "NotePhoto")
+    NotePhoto.objects.update(size=F("size") / 1024)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plans", "0007_notephoto_content_hash"),
+        ("authentication", "0003_utilisateur_storage_used_bytes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notephoto",
+            name="size",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Taille de l'image en octets",
+                verbose_name="Taille (octets)",
+            ),
+        ),
+        migrations.RunPython(sizes_to_bytes, sizes_to_kilobytes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2025-05-20 09:12
+
+import plans.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("plans", "0009_photoupload"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notephoto",
+            name="image",
+            field=models.ImageField(
+                db_index=True,
+                upload_to=plans.models.note_photo_upload_path,
+                verbose_name="Image",
+            ),
+        ),
+    ]
@@ -1,8 +1,14 @@
+import os
+import shutil
+import tempfile
+import uuid
+
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import GeometryCollection, LineString, Point, Polygon
 from django.conf import settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from authentication.models import Utilisateur
+from authentication.models import StorageQuotaExceeded, Utilisateur
 
 class Plan(models.Model):
     """
@@ -72,6 +78,15 @@ class Plan(models.Model):
     def __str__(self):
         return f"{self.nom} (créé par {self.createur.get_full_name()})"
 
+    def extent(self):
+        """Emprise (xmin, ymin, xmax, ymax) en WGS84 des formes et des notes du plan, ou None."""
+        geometries = [forme.geometry for forme in self.formes.all()]
+        geometries += [note.location for note in self.notes.filter(location__isnull=False)]
+        geometries = [geometry for geometry in geometries if geometry is not None]
+        if not geometries:
+            return None
+        return GeometryCollection(*geometries, srid=4326).extent
+
     def touch(self):
         """Force la mise à jour de la date de modification."""
         self.date_modification = timezone.now()
@@ -148,6 +163,33 @@ class FormeGeometrique(models.Model):
     def __str__(self):
         return f"{self.get_type_forme_display()} dans {self.plan.nom}"
 
+    @property
+    def geometry(self):
+        """
+        Géométrie GEOS (WGS84) de la forme, construite depuis ses données :
+        `points` ([lng, lat]) pour les polygones et lignes, `center` ou `position`
+        ({lat, lng}) pour les formes ponctuelles. None si les données sont inexploitables.
+        """
+        data = self.data or {}
+        try:
+            points = data.get('points')
+            if points:
+                coords = [(float(point[0]), float(point[1])) for point in points]
+                if self.type_forme in ('Polygon', self.TypeForme.RECTANGLE) and len(coords) >= 3:
+                    if coords[0] != coords[-1]:
+                        coords.append(coords[0])
+                    return Polygon(coords, srid=4326)
+                if len(coords) >= 2:
+                    return LineString(coords, srid=4326)
+                return Point(coords[0], srid=4326)
+
+            anchor = data.get('center') or data.get('position')
+            if isinstance(anchor, dict):
+                return Point(float(anchor['lng']), float(anchor['lat']), srid=4326)
+        except (KeyError, IndexError, TypeError, ValueError):
+            pass
+        return None
+
     def clean(self):
         """Valide les données selon le type de forme."""
         super().clean()
@@ -330,24 +372,19 @@ class NoteComment(models.Model):
 
 def note_photo_upload_path(instance, filename):
     """Définit le chemin d'upload pour les photos de notes."""
-    # Format: notes/user_id/note_id/timestamp_filename
-    import os
-    from django.utils import timezone
-
-    base_name, extension = os.path.splitext(filename)
-    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    # Format: notes/sha256/ab/cd/empreinte.ext (adressage par contenu)
+    extension = os.path.splitext(filename)[1].lower()
+    content_hash = instance.content_hash
 
-    # Si la note n'a pas de plan (note privée), utiliser l'ID de l'utilisateur qui ajoute la photo
-    if instance.note.plan is None:
-        return f'notes/{instance.user.id}/{instance.note.id}/{timestamp}{extension}'
-
-    # Sinon, utiliser l'ID du créateur du plan comme avant
-    return f'notes/{instance.note.plan.createur.id}/{instance.note.id}/{timestamp}{extension}'
+    return f'notes/sha256/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{extension}'
 
 
 class NotePhoto(models.Model):
     """
     Modèle pour les photos attachées aux notes géolocalisées.
+    Les fichiers sont stockés par empreinte SHA-256 : une même image jointe
+    à plusieurs notes n'est écrite qu'une fois sur le disque et n'est comptée
+    qu'une fois dans le quota de l'utilisateur.
     """
     note = models.ForeignKey(
         GeoNote,
@@ -363,6 +400,7 @@ class NotePhoto(models.Model):
     )
     image = models.ImageField(
         upload_to=note_photo_upload_path,
+        db_index=True,
         verbose_name='Image'
     )
     caption = models.CharField(
@@ -373,42 +411,247 @@ class NotePhoto(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Date de création')
     size = models.PositiveIntegerField(
         default=0,
-        verbose_name='Taille (KB)',
-        help_text='Taille de l\'image en kilooctets'
+        verbose_name='Taille (octets)',
+        help_text='Taille de l\'image en octets'
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        verbose_name='Empreinte SHA-256',
+        help_text='Empreinte du contenu de l\'image, utilisée pour la déduplication'
+    )
+    charged = models.BooleanField(
+        default=True,
+        verbose_name='Comptée dans le quota',
+        help_text='Vrai pour la photo qui porte la taille du contenu dans le quota de l\'utilisateur'
     )
 
     class Meta:
         verbose_name = 'Photo de note'
         verbose_name_plural = 'Photos de notes'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'content_hash']),
+        ]
 
     def __str__(self):
         return f"Photo sur {self.note.title} par {self.user.get_display_name()}"
 
+    @staticmethod
+    def compute_content_hash(image):
+        """Calcule l'empreinte SHA-256 du contenu d'une image."""
+        import hashlib
+
+        digest = hashlib.sha256()
+        for chunk in image.chunks():
+            digest.update(chunk)
+        image.seek(0)
+        return digest.hexdigest()
+
+    @classmethod
+    def is_stored_for(cls, user, image):
+        """Indique si l'utilisateur possède déjà ce contenu (déjà compté dans son quota)."""
+        return cls.objects.filter(
+            user=user,
+            content_hash=cls.compute_content_hash(image),
+            charged=True
+        ).exists()
+
+    def _store_content(self):
+        """Écrit le fichier une seule fois par empreinte, sinon réutilise le fichier existant."""
+        if self.image._committed:
+            return
+
+        name = self.image.field.generate_filename(self, self.image.name)
+        storage = self.image.storage
+        if not storage.exists(name):
+            name = storage.save(name, self.image.file)
+        else:
+            # Fichier réutilisé : le rajeunir pour que le ramasse-miettes (délai de grâce
+            # sur la date de modification) ne le supprime pas avant l'écriture de la ligne
+            try:
+                os.utime(storage.path(name))
+            except (NotImplementedError, OSError):
+                pass
+
+        # Référencer le fichier sans le réécrire lors du pre_save du champ
+        self.image = name
+
     def save(self, *args, **kwargs):
         # Calculer la taille de l'image si elle est nouvelle
         if self.image and not self.pk:
-            # Convertir la taille en KB
-            self.size = self.image.size // 1024
-
-            # Mettre à jour le stockage utilisé par l'utilisateur
-            size_mb = self.size / 1024  # Convertir KB en MB
-            self.user.storage_used += round(size_mb)
-            self.user.save(update_fields=['storage_used'])
+            self.size = self.image.size
+
+            if not self.content_hash:
+                self.content_hash = self.compute_content_hash(self.image)
+
+            # Ne compter le contenu qu'une fois par utilisateur
+            self.charged = not NotePhoto.objects.filter(
+                user=self.user,
+                content_hash=self.content_hash,
+                charged=True
+            ).exists()
+
+            # Admission atomique dans le quota, avant toute écriture du fichier
+            if self.charged and not self.user.reserve_storage(self.size):
+                raise StorageQuotaExceeded(
+                    f"Quota de stockage dépassé. Vous avez utilisé {self.user.storage_used}MB sur {self.user.storage_quota}MB."
+                )
+
+            try:
+                self._store_content()
+                super().save(*args, **kwargs)
+            except Exception:
+                if self.charged:
+                    self.user.adjust_storage(-self.size)
+                raise
+            return
 
         super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
-        # Récupérer la taille avant de supprimer
-        size_mb = self.size / 1024  # Convertir KB en MB
+        # Récupérer le fichier avant de supprimer
+        name = self.image.name
+        storage = self.image.storage
+
+        result = super().delete(*args, **kwargs)
+
+        # Supprimer le fichier lorsque plus aucune photo ne le référence
+        if name and not NotePhoto.objects.filter(image=name).exists():
+            storage.delete(name)
+
+        if not self.charged:
+            return result
+
+        # Transférer la charge à une autre photo de même contenu si elle existe
+        heir = None
+        if self.content_hash:
+            heir = NotePhoto.objects.filter(user=self.user, content_hash=self.content_hash).first()
+        if heir is not None:
+            NotePhoto.objects.filter(pk=heir.pk).update(charged=True)
+            return result
+
+        # Mettre à jour atomiquement le stockage utilisé par l'utilisateur
+        self.user.adjust_storage(-self.size)
+
+        return result
+
+    @classmethod
+    def reconcile_storage(cls):
+        """
+        Recalcule le stockage utilisé de tous les utilisateurs à partir des photos.
+        Normalise d'abord la photo qui porte la charge de chaque contenu (la plus
+        ancienne), puis met à jour tous les utilisateurs en une seule requête agrégée.
+        Retourne le nombre d'utilisateurs mis à jour.
+        """
+        from django.db.models import Case, When, Value, Min, Sum, OuterRef, Subquery
+        from django.db.models.functions import Coalesce
+        from authentication.models import MEGABYTE
+
+        hashed = cls.objects.exclude(content_hash='')
+        charged_ids = hashed.order_by().values('user', 'content_hash').annotate(first=Min('pk')).values('first')
+        hashed.update(
+            charged=Case(When(pk__in=charged_ids, then=Value(True)), default=Value(False))
+        )
+
+        charged_total = cls.objects.filter(
+            user=OuterRef('pk'), charged=True
+        ).order_by().values('user').annotate(total=Sum('size')).values('total')
+        total = Coalesce(Subquery(charged_total, output_field=models.BigIntegerField()), Value(0))
+
+        return Utilisateur.objects.update(
+            storage_used_bytes=total,
+            storage_used=(total + MEGABYTE - 1) / MEGABYTE
+        )
 
-        # Supprimer l'image
-        super().delete(*args, **kwargs)
 
-        # Mettre à jour le stockage utilisé par l'utilisateur
-        if self.user.storage_used >= round(size_mb):
-            self.user.storage_used -= round(size_mb)
-            self.user.save(update_fields=['storage_used'])
+class PhotoUpload(models.Model):
+    """
+    Upload reprenable (protocole de type tus) d'une photo de note.
+    Les morceaux sont ajoutés à un fichier temporaire ; la NotePhoto n'est
+    créée qu'à la réception du dernier morceau.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    note = models.ForeignKey(
+        GeoNote,
+        on_delete=models.CASCADE,
+        related_name='photo_uploads',
+        verbose_name='Note associée'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='photo_uploads',
+        verbose_name='Utilisateur'
+    )
+    filename = models.CharField(max_length=255, blank=True, verbose_name='Nom du fichier')
+    caption = models.CharField(max_length=200, blank=True, verbose_name='Légende')
+    length = models.PositiveBigIntegerField(verbose_name='Taille totale (octets)')
+    offset = models.PositiveBigIntegerField(default=0, verbose_name='Octets reçus')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Date de création')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Dernière réception')
+
+    class Meta:
+        verbose_name = 'Upload de photo en cours'
+        verbose_name_plural = 'Uploads de photos en cours'
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.length} octets)"
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.PHOTO_UPLOAD_TEMP_DIR, f'{self.id}.part')
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.length
+
+    def stage(self, stream, chunk_size=64 * 1024):
+        """
+        Reçoit le contenu d'un flux dans un fichier de morceau distinct, sans verrou ni
+        chargement en mémoire. Refuse les octets au-delà de la taille annoncée.
+        Retourne (chemin du morceau, nombre d'octets reçus).
+        """
+        os.makedirs(settings.PHOTO_UPLOAD_TEMP_DIR, exist_ok=True)
+        fd, chunk_path = tempfile.mkstemp(prefix=f'{self.id}.', suffix='.chunk', dir=settings.PHOTO_UPLOAD_TEMP_DIR)
+        written = 0
+        try:
+            with os.fdopen(fd, 'wb') as chunk_file:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    if self.offset + written + len(chunk) > self.length:
+                        raise ValidationError("Les données dépassent la taille annoncée de l'upload")
+                    chunk_file.write(chunk)
+                    written += len(chunk)
+        except BaseException:
+            os.remove(chunk_path)
+            raise
+        return chunk_path, written
+
+    def commit(self, chunk_path, written):
+        """
+        Ajoute un morceau reçu par stage() au fichier temporaire et avance le décalage.
+        À appeler sous verrou, après avoir vérifié que le décalage n'a pas changé.
+        """
+        with open(self.temp_path, 'ab') as part, open(chunk_path, 'rb') as chunk:
+            # Tronquer un éventuel reste d'un morceau interrompu
+            part.truncate(self.offset)
+            shutil.copyfileobj(chunk, part)
+
+        self.offset += written
+        self.save(update_fields=['offset', 'updated_at'])
+
+    def discard(self):
+        """Supprime le fichier temporaire et l'upload."""
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+        self.delete()
 
 
 class MapFilter(models.Model):
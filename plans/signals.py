@@ -0,0 +1,42 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Connexion, FormeGeometrique, Plan
+
+_deferred = threading.local()
+
+
+@contextmanager
+def plan_modifications_deferred():
+    """
+    Suspend, pour le thread courant, la mise à jour de la date de modification du plan
+    à chaque forme ou connexion enregistrée : un traitement en lot évite ainsi une
+    requête UPDATE par ligne et appelle plan.touch() une seule fois à la fin.
+    """
+    depth = getattr(_deferred, 'depth', 0)
+    _deferred.depth = depth + 1
+    try:
+        yield
+    finally:
+        _deferred.depth = depth
+
+
+@receiver([post_save, post_delete], sender=FormeGeometrique)
+@receiver([post_save, post_delete], sender=Connexion)
+def mark_plan_modified(sender, instance, origin=None, **kwargs):
+    """
+    Toute modification d'une forme ou d'une connexion avance la date de modification
+    du plan, qui sert de version aux index calculés à partir de ses éléments.
+    """
+    if getattr(_deferred, 'depth', 0):
+        return
+    # Suppression en cascade depuis un objet (plan, forme…) : seul l'objet d'origine
+    # avance la date, une fois, au lieu d'une mise à jour par ligne supprimée
+    if isinstance(origin, models.Model) and origin is not instance:
+        return
+    Plan.objects.filter(pk=instance.plan_id).update(date_modification=timezone.now())
@@ -164,6 +164,19 @@ STATICFILES_DIRS = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Uploads reprenables de photos : fichiers partiels hors de MEDIA_ROOT
+PHOTO_UPLOAD_TEMP_DIR = os.getenv('PHOTO_UPLOAD_TEMP_DIR', os.path.join(BASE_DIR, 'tmp', 'photo_uploads'))
+PHOTO_UPLOAD_MAX_LENGTH = int(os.getenv('PHOTO_UPLOAD_MAX_LENGTH', 20 * 1024 * 1024))
+
+# Durée de cache des photos adressées par contenu (URL immuables)
+MEDIA_IMMUTABLE_MAX_AGE = int(os.getenv('MEDIA_IMMUTABLE_MAX_AGE', 60 * 60 * 24 * 365))
+
+# Service protégé des médias : 'nginx' (X-Accel-Redirect), 'apache' ou 'lighttpd' (X-Sendfile),
+# vide pour que Django serve les fichiers lui-même (développement)
+MEDIA_SENDFILE_BACKEND = os.getenv('MEDIA_SENDFILE_BACKEND', '')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_ACCESS_CACHE_TTL = int(os.getenv('MEDIA_ACCESS_CACHE_TTL', 300))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -220,3 +233,108 @@ AUTHENTICATION_BACKENDS = [
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
+
+# Configuration du client Ecowitt
+ECOWITT_BASE_URL = os.getenv('ECOWITT_BASE_URL', 'https://api.ecowitt.net/api/v3')
+ECOWITT_CONNECT_TIMEOUT = float(os.getenv('ECOWITT_CONNECT_TIMEOUT', 3.05))
+ECOWITT_READ_TIMEOUT = float(os.getenv('ECOWITT_READ_TIMEOUT', 10))
+ECOWITT_MAX_RETRIES = int(os.getenv('ECOWITT_MAX_RETRIES', 2))
+ECOWITT_BACKOFF_BASE = float(os.getenv('ECOWITT_BACKOFF_BASE', 0.3))
+ECOWITT_BACKOFF_MAX = float(os.getenv('ECOWITT_BACKOFF_MAX', 2))
+ECOWITT_POOL_SIZE = int(os.getenv('ECOWITT_POOL_SIZE', 20))
+ECOWITT_MAX_CONCURRENCY_PER_KEY = int(os.getenv('ECOWITT_MAX_CONCURRENCY_PER_KEY', 4))
+ECOWITT_BREAKER_THRESHOLD = int(os.getenv('ECOWITT_BREAKER_THRESHOLD', 5))
+ECOWITT_BREAKER_RESET_TIMEOUT = float(os.getenv('ECOWITT_BREAKER_RESET_TIMEOUT', 30))
+ECOWITT_FALLBACK_TTL = int(os.getenv('ECOWITT_FALLBACK_TTL', 24 * 3600))
+
+# Stockage local des séries météo : durée de conservation (jours) de chaque résolution
+# avant agrégation dans la résolution supérieure (les données journalières sont conservées)
+WEATHER_RETENTION_DAYS = {
+    '5min': int(os.getenv('WEATHER_5MIN_RETENTION_DAYS', 30)),
+    '30min': int(os.getenv('WEATHER_30MIN_RETENTION_DAYS', 365)),
+    '4hour': int(os.getenv('WEATHER_4HOUR_RETENTION_DAYS', 730)),
+}
+
+# Relevés temps réel : cadence du poller (poll_weather) et âge maximal servi sans appel Ecowitt (secondes)
+WEATHER_POLL_INTERVAL = int(os.getenv('WEATHER_POLL_INTERVAL', 60))
+WEATHER_SNAPSHOT_MAX_AGE = int(os.getenv('WEATHER_SNAPSHOT_MAX_AGE', 150))
+
+# Envois directs des passerelles : écriture de la série temporelle par lots ; le tampon est
+# en mémoire, un arrêt brutal perd au plus WEATHER_PUSH_FLUSH_INTERVAL secondes de relevés
+WEATHER_PUSH_BATCH_SIZE = int(os.getenv('WEATHER_PUSH_BATCH_SIZE', 50))
+WEATHER_PUSH_FLUSH_INTERVAL = int(os.getenv('WEATHER_PUSH_FLUSH_INTERVAL', 15))
+
+# Indicateurs agronomiques (/weather/rollups/) : hauteur de l'anémomètre (m), latitude utilisée
+# pour le rayonnement extraterrestre faute de position de station, base et plafond des degrés-jours (°C)
+WEATHER_ANEMOMETER_HEIGHT = float(os.getenv('WEATHER_ANEMOMETER_HEIGHT', 2))
+WEATHER_DEFAULT_LATITUDE = float(os.getenv('WEATHER_DEFAULT_LATITUDE', 46.0))
+WEATHER_GDD_BASE = float(os.getenv('WEATHER_GDD_BASE', 10))
+WEATHER_GDD_CAP = float(os.getenv('WEATHER_GDD_CAP', 30))
+
+# Grille interpolée (/weather/grid/) : cellules sur le plus grand côté, puissance IDW, durée de cache (s)
+WEATHER_GRID_MAX_CELLS = int(os.getenv('WEATHER_GRID_MAX_CELLS', 96))
+WEATHER_IDW_POWER = float(os.getenv('WEATHER_IDW_POWER', 2))
+WEATHER_GRID_CACHE_TTL = int(os.getenv('WEATHER_GRID_CACHE_TTL', 24 * 3600))
+
+# Nombre maximal d'appareils comparés par /weather/compare/
+WEATHER_COMPARE_MAX_DEVICES = int(os.getenv('WEATHER_COMPARE_MAX_DEVICES', 10))
+
+# Plage maximale (jours) d'un export CSV de l'historique
+WEATHER_EXPORT_MAX_DAYS = int(os.getenv('WEATHER_EXPORT_MAX_DAYS', 3660))
+
+# Nombre maximal de fenêtres Ecowitt (une par limite de plage du cycle) par requête d'historique
+WEATHER_HISTORY_MAX_WINDOWS = int(os.getenv('WEATHER_HISTORY_MAX_WINDOWS', 62))
+
+# Nombre maximal de points par série renvoyés par /weather/chart/ (réduction LTTB, 0 = illimité)
+WEATHER_CHART_MAX_POINTS = int(os.getenv('WEATHER_CHART_MAX_POINTS', 2000))
+
+# Proxy de tuiles (/api/tiles/) : cache disque borné, durées de vie (s), pool HTTP amont
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'tiles'))
+TILE_CACHE_MAX_BYTES = int(os.getenv('TILE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+TILE_CACHE_TTL = int(os.getenv('TILE_CACHE_TTL', 30 * 24 * 3600))
+TILE_NEGATIVE_TTL = int(os.getenv('TILE_NEGATIVE_TTL', 3600))
+TILE_BROWSER_MAX_AGE = int(os.getenv('TILE_BROWSER_MAX_AGE', 7 * 24 * 3600))
+TILE_POOL_SIZE = int(os.getenv('TILE_POOL_SIZE', 16))
+TILE_CONNECT_TIMEOUT = float(os.getenv('TILE_CONNECT_TIMEOUT', 3.05))
+TILE_READ_TIMEOUT = float(os.getenv('TILE_READ_TIMEOUT', 10))
+
+# Paquets de tuiles hors ligne (MBTiles) : répertoire, zooms par défaut et maximal, taille, marge, threads
+OFFLINE_PACK_DIR = os.getenv('OFFLINE_PACK_DIR', os.path.join(BASE_DIR, 'cache', 'offline'))
+OFFLINE_PACK_MIN_ZOOM = int(os.getenv('OFFLINE_PACK_MIN_ZOOM', 12))
+OFFLINE_PACK_MAX_ZOOM = int(os.getenv('OFFLINE_PACK_MAX_ZOOM', 18))
+OFFLINE_PACK_MAX_TILES = int(os.getenv('OFFLINE_PACK_MAX_TILES', 20000))
+OFFLINE_PACK_MARGIN = float(os.getenv('OFFLINE_PACK_MARGIN', 0.1))
+OFFLINE_PACK_WORKERS = int(os.getenv('OFFLINE_PACK_WORKERS', 8))
+# Verrou de construction d'un paquet (partagé entre processus) considéré abandonné s'il n'est plus rafraîchi (secondes)
+OFFLINE_PACK_LOCK_TIMEOUT = int(os.getenv('OFFLINE_PACK_LOCK_TIMEOUT', 300))
+
+# Altitudes (/elevation/) : dalles MNT GeoTIFF, tableaux .npy dérivés, dalles ouvertes simultanément, points par requête
+DEM_DIR = os.getenv('DEM_DIR', os.path.join(BASE_DIR, 'data', 'dem'))
+DEM_CACHE_DIR = os.getenv('DEM_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'dem'))
+DEM_OPEN_TILES = int(os.getenv('DEM_OPEN_TILES', 16))
+DEM_MAX_POINTS = int(os.getenv('DEM_MAX_POINTS', 20000))
+
+# Profils altimétriques des lignes : pas par défaut et minimal (m), durée de cache (s)
+PROFILE_DEFAULT_SPACING = float(os.getenv('PROFILE_DEFAULT_SPACING', 10))
+PROFILE_MIN_SPACING = float(os.getenv('PROFILE_MIN_SPACING', 1))
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 7 * 24 * 3600))
+
+# Statistiques de terrain des polygones : pixels analysés au plus par polygone, processus, polygones à calculer
+# à partir desquels le calcul est réparti sur les processus, durée de cache (s)
+TERRAIN_MAX_CELLS = int(os.getenv('TERRAIN_MAX_CELLS', 1000000))
+TERRAIN_WORKERS = int(os.getenv('TERRAIN_WORKERS', 4))
+TERRAIN_PARALLEL_MIN = int(os.getenv('TERRAIN_PARALLEL_MIN', 8))
+TERRAIN_CACHE_TTL = int(os.getenv('TERRAIN_CACHE_TTL', 7 * 24 * 3600))
+
+# Nombre de plans dont l'index de réseau (formes et connexions) est conservé par processus
+NETWORK_INDEX_MAX_PLANS = int(os.getenv('NETWORK_INDEX_MAX_PLANS', 128))
+
+# Calcul hydraulique : pression d'alimentation par défaut (bar), coefficient de Hazen-Williams des conduites sans matériau connu, durée de cache (s)
+HYDRAULIC_INLET_PRESSURE = float(os.getenv('HYDRAULIC_INLET_PRESSURE', 3))
+HYDRAULIC_DEFAULT_C = float(os.getenv('HYDRAULIC_DEFAULT_C', 140))
+HYDRAULIC_CACHE_TTL = int(os.getenv('HYDRAULIC_CACHE_TTL', 24 * 3600))
+
+# Détection des connexions : distance (m) entre une extrémité de ligne et une forme, maximum accepté, détection à l'enregistrement d'un plan
+CONNEXION_TOLERANCE = float(os.getenv('CONNEXION_TOLERANCE', 1))
+CONNEXION_MAX_TOLERANCE = float(os.getenv('CONNEXION_MAX_TOLERANCE', 50))
+CONNEXION_AUTO_DETECT = os.getenv('CONNEXION_AUTO_DETECT', 'True').lower() == 'true'
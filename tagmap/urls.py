@@ -26,6 +26,7 @@ from rest_framework_simplejwt.views import (
 )
 from rest_framework.documentation import include_docs_urls
 from authentication.views import SecureIndexView, LoginView
+from api.views import protected_media
 
 # Routes publiques pour le frontend
 public_routes = [
@@ -47,9 +48,13 @@ admin_routes = [
 
 urlpatterns = public_routes + api_routes + admin_routes
 
-# Servir les fichiers statiques et média en développement
+# Fichiers média : droits vérifiés par Django, transfert délégué au serveur frontal
+urlpatterns += [
+    re_path(r'^media/(?P<path>.+)$', protected_media, name='protected-media'),
+]
+
+# Servir les fichiers statiques en développement
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
 # Route par défaut - doit être authentifié